@@ -0,0 +1,560 @@
+"""
+Client for the archiver appliance's retrieval interface. All of the engine's
+archiver traffic goes through an ArchiverClient so that connections are pooled
+and kept alive across scans instead of being rebuilt for every PV request.
+"""
+
+############
+# Standard #
+############
+import logging
+import collections
+import datetime
+import threading
+import time
+
+###############
+# Third Party #
+###############
+import numpy as np
+import requests
+import xarray
+
+##########
+# Custom #
+##########
+from . import archiver_pb
+from .resilience import CircuitBreaker
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+PvSamples = collections.namedtuple('PvSamples', ['times', 'vals'])
+PvSamples.__doc__ = """
+Samples of one PV as contiguous arrays: times (int64 ns since the epoch) and
+vals (float64).
+"""
+
+
+def pv_values(pv, data):
+    """
+    Return the sample values of a PV as a NumPy array, whether the data was
+    pulled as PvSamples or in the xarray layout.
+
+    Parameters
+    ----------
+    pv : str
+        name of the PV
+
+    data : PvSamples or xarray.Dataset
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+    if isinstance(data, PvSamples):
+        return data.vals
+    return data[pv].sel(field='vals').values
+
+
+def pv_times(pv, data):
+    """
+    Return the sample timestamps of a PV in ns since the epoch, whether the
+    data was pulled as PvSamples or in the xarray layout.
+
+    Parameters
+    ----------
+    pv : str
+        name of the PV
+
+    data : PvSamples or xarray.Dataset
+
+    Returns
+    -------
+    numpy.ndarray (int64)
+    """
+    if isinstance(data, PvSamples):
+        return data.times
+    return data[pv]['time'].values.view(np.int64)
+
+
+def format_time(dt):
+    """
+    Produce the ISO 8601 string the archiver expects for a point in time.
+
+    Parameters
+    ----------
+    dt : datetime.datetime
+        Naive datetimes are treated as local time, matching the rest of the
+        engine.
+
+    Returns
+    -------
+    str
+        UTC timestamp with millisecond precision (e.g.
+        '2017-08-10T17:41:00.000Z')
+    """
+    utc_dt = dt.astimezone(datetime.timezone.utc)
+    return utc_dt.strftime("%Y-%m-%dT%H:%M:%S.") \
+        + "{:03d}Z".format(utc_dt.microsecond // 1000)
+
+
+def parse_status_time(text):
+    """
+    Read a timestamp from a getPVStatus entry, such as its lastEvent, in the
+    appliance's 'Aug/10/2017 17:41:00 -07:00' form.
+
+    Returns
+    -------
+    int or None
+        ns since the epoch, None if the text isn't a timestamp. The
+        appliance reports whole seconds, the event can be up to a second
+        later.
+    """
+    try:
+        # strptime's %z only accepts the offset without a colon before 3.7
+        date, clock, offset = text.split(" ")
+        dt = datetime.datetime.strptime(
+            " ".join([date, clock, offset.replace(":", "")]),
+            "%b/%d/%Y %H:%M:%S %z",
+        )
+    except (AttributeError, ValueError):
+        return None
+    return int(dt.timestamp()) * 1000000000
+
+
+def epoch_ns(dt):
+    """
+    Convert a datetime to integer nanoseconds since the epoch. Naive datetimes
+    are treated as local time.
+    """
+    seconds = int(dt.replace(microsecond=0).timestamp())
+    return seconds * 1000000000 + dt.microsecond * 1000
+
+
+def from_epoch_ns(ns):
+    """
+    Convert nanoseconds since the epoch to a naive local datetime.
+    """
+    ns = int(ns)
+    return datetime.datetime.fromtimestamp(ns // 1000000000) \
+        + datetime.timedelta(microseconds=(ns % 1000000000) // 1000)
+
+
+def arrays_to_xarray(pv, times, vals):
+    """
+    Wrap sample arrays in the engine's xarray layout without copying them.
+    Only the 'vals' field is present.
+
+    Parameters
+    ----------
+    pv : str
+        Name of the PV.
+
+    times : numpy.ndarray
+        Sample timestamps in ns since the epoch.
+
+    vals : numpy.ndarray
+        Sample values.
+
+    Returns
+    -------
+    xarray.Dataset
+    """
+    data = xarray.DataArray(
+        vals[:, np.newaxis],
+        coords = [times.view('datetime64[ns]'), ['vals']],
+        dims = ['time', 'field'],
+    )
+    return xarray.Dataset({pv: data})
+
+
+def json_to_arrays(payload):
+    """
+    Convert a getData.json response into PvSamples.
+    """
+    if payload:
+        samples = payload[0].get('data', [])
+    else:
+        samples = []
+    count = len(samples)
+    secs = np.fromiter((s['secs'] for s in samples), np.int64, count)
+    nanos = np.fromiter((s.get('nanos', 0) for s in samples), np.int64, count)
+    vals = np.fromiter((s['val'] for s in samples), np.float64, count)
+    return PvSamples(secs * 1000000000 + nanos, vals)
+
+
+def to_xarray(pv, payload):
+    """
+    Convert a getData.json response into the xarray layout used by the
+    engine. The result is indexed by PV name, each PV holding a
+    ('time', 'field') DataArray with 'vals', 'sevr' and 'stat' fields.
+
+    Parameters
+    ----------
+    pv : str
+        Name of the PV the payload belongs to.
+
+    payload : list
+        Decoded json body returned by the archiver.
+
+    Returns
+    -------
+    xarray.Dataset
+    """
+    if payload:
+        samples = payload[0].get('data', [])
+    else:
+        samples = []
+    count = len(samples)
+    secs = np.fromiter((s['secs'] for s in samples), np.int64, count)
+    nanos = np.fromiter((s.get('nanos', 0) for s in samples), np.int64, count)
+    table = np.empty((count, 3))
+    table[:, 0] = np.fromiter((s['val'] for s in samples), np.float64, count)
+    table[:, 1] = np.fromiter(
+        (s.get('severity', 0) for s in samples), np.float64, count)
+    table[:, 2] = np.fromiter(
+        (s.get('status', 0) for s in samples), np.float64, count)
+    times = (secs * 1000000000 + nanos).astype('datetime64[ns]')
+    data = xarray.DataArray(
+        table,
+        coords = [times, ['vals', 'sevr', 'stat']],
+        dims = ['time', 'field'],
+    )
+    return xarray.Dataset({pv: data})
+
+
+class ArchiverClient:
+    """
+    Pooled, keep-alive connection to a single archiver appliance. The object
+    is safe to share between the threads of TriggerScan's worker pool.
+    """
+    def __init__(self, hostname, data_port=17668, pool_size=10,
+                 idle_timeout=60.0, fetch_format="json", breaker=None,
+                 mgmt_port=17665, proxy=None):
+        """
+
+        Parameters
+        ----------
+        hostname : string
+            specify location of archiver
+
+        data_port : int
+            Port of the appliance's retrieval service. Defaults to 17668.
+
+        pool_size : int
+            Maximum number of connections kept open to the appliance. Should
+            be at least the number of threads sharing the client.
+
+        idle_timeout : float
+            Seconds a pool may sit unused before its connections are dropped
+            and reopened. Keeps the engine from reusing sockets the appliance
+            or a firewall has quietly closed between long scan periods.
+
+        fetch_format : str
+            Format get_arrays requests from the appliance, either "json" or
+            "pb" for the binary protocol buffer format.
+
+        breaker : resilience.CircuitBreaker
+            Breaker tracking this appliance's health. A default
+            CircuitBreaker is made if None.
+
+        mgmt_port : int
+            Port of the appliance's management service, used to ask which
+            PVs it archives. Defaults to 17665.
+
+        proxy : str
+            URL of an HTTP proxy, such as an archiver_proxy, to send every
+            request through. Defaults to None, connecting directly.
+        """
+        self.hostname = hostname
+        self.data_port = data_port
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        if fetch_format not in ("json", "pb"):
+            raise ValueError("unknown fetch_format {}".format(fetch_format))
+        self.fetch_format = fetch_format
+        if breaker == None:
+            breaker = CircuitBreaker()
+        self.breaker = breaker
+        self.mgmt_port = mgmt_port
+        self.proxy = proxy
+        self.base_url = "http://{}:{}/retrieval".format(hostname, data_port)
+        self.mgmt_url = "http://{}:{}/mgmt/bpl".format(hostname, mgmt_port)
+        self._lock = threading.Lock()
+        self._session = None
+        self._last_used = 0
+
+    def _new_session(self):
+        """
+        Build a requests.Session whose adapter holds pool_size keep-alive
+        connections to each of the retrieval and management services.
+
+        Note
+        ----
+            Intended for internal use only.
+        """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections = 2,
+            pool_maxsize = self.pool_size,
+            pool_block = True,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if self.proxy != None:
+            session.proxies = {'http': self.proxy, 'https': self.proxy}
+        return session
+
+    @property
+    def session(self):
+        """
+        requests.Session shared by all requests to this appliance. Recreated
+        if it has been idle for longer than idle_timeout.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._session != None \
+                    and now - self._last_used > self.idle_timeout:
+                logger.debug("{} pool idle, reconnecting".format(
+                    self.hostname))
+                self._session.close()
+                self._session = None
+            if self._session == None:
+                self._session = self._new_session()
+            self._last_used = now
+            return self._session
+
+    def close(self):
+        """
+        Drop all pooled connections.
+        """
+        with self._lock:
+            if self._session != None:
+                self._session.close()
+                self._session = None
+
+    def get_pv_status(self, pvs, timeout=None):
+        """
+        Ask the appliance's management service about the given PVs.
+
+        Parameters
+        ----------
+        pvs : list of str
+            names of the PVs
+
+        timeout : float
+            Seconds to wait for the appliance. Defaults to None, waiting
+            indefinitely.
+
+        Returns
+        -------
+        dict
+            PV name mapped to the appliance's status entry for it, e.g.
+            {'pvName': ..., 'status': 'Being archived', ...}
+        """
+        response = self.session.get(
+            self.mgmt_url + "/getPVStatus",
+            params = {'pv': ",".join(pvs)},
+            timeout = timeout,
+        )
+        response.raise_for_status()
+        return dict((entry['pvName'], entry) for entry in response.json())
+
+    def get_last_events(self, pvs, timeout=None, batch_size=100):
+        """
+        Time of each PV's newest sample according to the appliance.
+
+        Parameters
+        ----------
+        pvs : list of str
+            names of the PVs
+
+        timeout : float
+            Seconds to wait for each status request.
+
+        batch_size : int
+            PVs asked about per request.
+
+        Returns
+        -------
+        dict
+            PV name mapped to ns since the epoch, or None if the appliance
+            doesn't report one
+        """
+        events = {}
+        for i in range(0, len(pvs), batch_size):
+            status = self.get_pv_status(pvs[i:i + batch_size], timeout)
+            for name in pvs[i:i + batch_size]:
+                events[name] = parse_status_time(
+                    status.get(name, {}).get('lastEvent'))
+        return events
+
+    def get_json(self, pv, start, end, timeout=None):
+        """
+        Request a PV's samples between two times from getData.json.
+
+        Parameters
+        ----------
+        pv : str
+            name of the PV
+
+        start : datetime.datetime
+            start time for the pulled data
+
+        end : datetime.datetime
+            end time for the pulled data
+
+        timeout : float
+            Seconds to wait for the appliance. Defaults to None, waiting
+            indefinitely.
+
+        Returns
+        -------
+        list
+            Decoded json body of the response.
+        """
+        response = self.session.get(
+            self.base_url + "/data/getData.json",
+            params = {
+                'pv': pv,
+                'from': format_time(start),
+                'to': format_time(end),
+            },
+            timeout = timeout,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get_raw(self, pv, start, end, timeout=None):
+        """
+        Request a PV's samples between two times from getData.raw.
+
+        Parameters
+        ----------
+        pv : str
+            name of the PV
+
+        start : datetime.datetime
+            start time for the pulled data
+
+        end : datetime.datetime
+            end time for the pulled data
+
+        timeout : float
+            Seconds to wait for the appliance. Defaults to None, waiting
+            indefinitely.
+
+        Returns
+        -------
+        bytes
+            Body of the response in the archiver's protocol buffer format.
+        """
+        response = self.session.get(
+            self.base_url + "/data/getData.raw",
+            params = {
+                'pv': pv,
+                'from': format_time(start),
+                'to': format_time(end),
+            },
+            timeout = timeout,
+        )
+        response.raise_for_status()
+        return response.content
+
+    def get_arrays(self, pv, start, end, timeout=None):
+        """
+        Request a PV's samples between two times as contiguous arrays, using
+        the client's fetch_format.
+
+        Parameters
+        ----------
+        pv : str
+            name of the PV
+
+        start : datetime.datetime
+            start time for the pulled data
+
+        end : datetime.datetime
+            end time for the pulled data
+
+        timeout : float
+            Seconds to wait for the appliance. Defaults to None, waiting
+            indefinitely.
+
+        Returns
+        -------
+        PvSamples
+        """
+        if self.fetch_format == "pb":
+            return PvSamples(*archiver_pb.decode_raw(
+                self.get_raw(pv, start, end, timeout)))
+        return json_to_arrays(self.get_json(pv, start, end, timeout))
+
+    def get_binned(self, pv, operator, bin_size, start, end, timeout=None):
+        """
+        Request a PV reduced by one of the appliance's post-processors, e.g.
+        max_60(pv) for the maximum of every 60 second bin.
+
+        Parameters
+        ----------
+        pv : str
+            name of the PV
+
+        operator : str
+            post-processor name, such as "min", "max" or "mean"
+
+        bin_size : int
+            seconds per bin, bins are aligned to multiples of it since the
+            epoch
+
+        start : datetime.datetime
+            start time for the pulled data
+
+        end : datetime.datetime
+            end time for the pulled data
+
+        timeout : float
+            Seconds to wait for the appliance. Defaults to None, waiting
+            indefinitely.
+
+        Returns
+        -------
+        PvSamples
+            one sample per bin
+        """
+        return self.get_arrays(
+            "{}_{}({})".format(operator, int(bin_size), pv),
+            start, end, timeout,
+        )
+
+    def get(self, pv, start, end, xarray=True, timeout=None):
+        """
+        Request a PV's samples between two times. Call signature mirrors
+        archapp's EpicsArchive.get.
+
+        Parameters
+        ----------
+        pv : str
+            name of the PV
+
+        start : datetime.datetime
+            start time for the pulled data
+
+        end : datetime.datetime
+            end time for the pulled data
+
+        xarray : bool
+            If true, return the samples as an xarray.Dataset, otherwise
+            return the decoded json. Defaults to true.
+
+        timeout : float
+            Seconds to wait for the appliance. Defaults to None, waiting
+            indefinitely.
+        """
+        payload = self.get_json(pv, start, end, timeout)
+        if xarray:
+            return to_xarray(pv, payload)
+        return payload
@@ -0,0 +1,383 @@
+"""
+Decoder for the archiver appliance's raw (protocol buffer) retrieval format.
+
+A getData.raw response is a sequence of chunks separated by empty lines. Each
+chunk starts with a PayloadInfo message naming the PV, the sample type and the
+year, followed by one sample message per line. Newlines, carriage returns and
+the escape character inside messages are escaped so that lines can be split
+on a plain newline.
+
+Only the scalar numeric sample types are handled. Their samples are decoded
+straight into NumPy arrays without building any per-sample Python objects.
+"""
+
+############
+# Standard #
+############
+import logging
+import calendar
+import struct
+
+###############
+# Third Party #
+###############
+import numpy as np
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+# PayloadInfo.type values (EPICSEvent.proto)
+SCALAR_STRING = 0
+SCALAR_SHORT = 1
+SCALAR_FLOAT = 2
+SCALAR_ENUM = 3
+SCALAR_BYTE = 4
+SCALAR_INT = 5
+SCALAR_DOUBLE = 6
+
+NUMERIC_TYPES = (SCALAR_SHORT, SCALAR_FLOAT, SCALAR_ENUM, SCALAR_INT,
+                 SCALAR_DOUBLE)
+
+_double = struct.Struct("<d")
+_float = struct.Struct("<f")
+_sfixed32 = struct.Struct("<i")
+
+_year_start = {}
+
+
+def year_start_ns(year):
+    """
+    Nanoseconds since the epoch at the start of a year (UTC).
+    """
+    if year not in _year_start:
+        _year_start[year] = calendar.timegm((year, 1, 1, 0, 0, 0)) \
+            * 1000000000
+    return _year_start[year]
+
+
+def escape(line):
+    """
+    Apply the archiver's line escaping.
+    """
+    return line.replace(b"\x1b", b"\x1b\x01").replace(b"\n", b"\x1b\x02") \
+        .replace(b"\r", b"\x1b\x03")
+
+
+def read_varint(buf, pos):
+    """
+    Read a protocol buffer varint.
+
+    Returns
+    -------
+    tuple
+        (value, position after the varint)
+    """
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos = pos + 1
+        result = result | ((byte & 0x7f) << shift)
+        if not byte & 0x80:
+            return result, pos
+        shift = shift + 7
+
+
+def write_varint(value):
+    """
+    Encode a non-negative integer as a protocol buffer varint.
+    """
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value = value >> 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def skip_field(buf, pos, wire_type):
+    """
+    Step over a field's payload.
+
+    Returns
+    -------
+    int
+        position after the field
+    """
+    if wire_type == 0:
+        return read_varint(buf, pos)[1]
+    if wire_type == 1:
+        return pos + 8
+    if wire_type == 2:
+        length, pos = read_varint(buf, pos)
+        return pos + length
+    if wire_type == 5:
+        return pos + 4
+    raise ValueError("unsupported wire type {}".format(wire_type))
+
+
+def decode_payload_info(buf):
+    """
+    Decode an unescaped chunk header.
+
+    Returns
+    -------
+    tuple
+        (payload type, pv name, year)
+    """
+    pos = 0
+    payload_type = None
+    name = None
+    year = None
+    while pos < len(buf):
+        key, pos = read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if field == 1 and wire_type == 0:
+            payload_type, pos = read_varint(buf, pos)
+        elif field == 2 and wire_type == 2:
+            length, pos = read_varint(buf, pos)
+            name = bytes(buf[pos:pos + length]).decode()
+            pos = pos + length
+        elif field == 3 and wire_type == 0:
+            year, pos = read_varint(buf, pos)
+        else:
+            pos = skip_field(buf, pos, wire_type)
+    return payload_type, name, year
+
+
+def unescape_array(body):
+    """
+    Undo the archiver's escaping over a whole response at once.
+
+    Parameters
+    ----------
+    body : bytes
+        Full response body.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        the unescaped bytes (uint8) and the positions of the line separating
+        newlines within them
+    """
+    raw = np.frombuffer(body, dtype=np.uint8)
+    newlines = np.flatnonzero(raw == 0x0a)
+    escapes = np.flatnonzero(raw == 0x1b)
+    if len(escapes) == 0:
+        return raw, newlines
+    # an escape is always followed by its code byte, translate the code byte
+    # in place and drop the escape character itself
+    buf = raw.copy()
+    codes = buf[escapes + 1]
+    buf[escapes + 1] = np.choose(codes - 1, [0x1b, 0x0a, 0x0d])
+    keep = np.ones(len(buf), dtype=bool)
+    keep[escapes] = False
+    newlines = newlines - np.searchsorted(escapes, newlines)
+    return buf[keep], newlines
+
+
+def read_varint_column(buf, pos, rows):
+    """
+    Decode one varint for each of the given rows.
+
+    Parameters
+    ----------
+    buf : numpy.ndarray (uint8)
+        unescaped response
+
+    pos : numpy.ndarray (int64)
+        read position of every row, advanced past the varint for the given
+        rows
+
+    rows : numpy.ndarray (int)
+        indices of the rows to read
+
+    Returns
+    -------
+    numpy.ndarray (int64)
+        the decoded value for each of rows
+    """
+    values = np.zeros(len(rows), dtype=np.int64)
+    going = np.arange(len(rows))
+    shift = 0
+    while len(going):
+        byte = buf[pos[rows[going]]].astype(np.int64)
+        values[going] |= (byte & 0x7f) << shift
+        pos[rows[going]] += 1
+        going = going[(byte & 0x80) != 0]
+        shift = shift + 7
+    return values
+
+
+def decode_raw(body):
+    """
+    Decode a getData.raw response into sample arrays.
+
+    The samples are decoded a field at a time across all lines of the
+    response, so the work done in Python scales with the number of fields in
+    a sample message rather than with the number of samples.
+
+    Parameters
+    ----------
+    body : bytes
+        Full response body.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        timestamps in ns since the epoch (int64) and values (float64), both
+        contiguous and in the order they were served
+
+    Raises
+    ------
+    ValueError
+        If the payload holds a non-numeric or waveform sample type.
+    """
+    buf, newlines = unescape_array(body)
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(buf)]))
+    # a chunk header is the first line and every line after an empty one
+    empty = starts == ends
+    header = np.concatenate(([True], empty[:-1])) & ~empty
+    chunk = np.cumsum(header) - 1
+    samples = ~header & ~empty
+
+    header_rows = np.flatnonzero(header)
+    year_ns = np.empty(len(header_rows), dtype=np.int64)
+    is_float = np.empty(len(header_rows), dtype=bool)
+    for i, row in enumerate(header_rows):
+        payload_type, name, year = decode_payload_info(
+            buf[starts[row]:ends[row]].tobytes())
+        if payload_type not in NUMERIC_TYPES:
+            raise ValueError(
+                "unsupported payload type {} for {}".format(
+                    payload_type, name))
+        year_ns[i] = year_start_ns(year)
+        is_float[i] = payload_type == SCALAR_FLOAT
+
+    pos = starts[samples].astype(np.int64)
+    end = ends[samples]
+    chunk = chunk[samples]
+    count = len(pos)
+    seconds = np.zeros(count, dtype=np.int64)
+    nanos = np.zeros(count, dtype=np.int64)
+    vals = np.zeros(count, dtype=np.float64)
+
+    active = np.flatnonzero(pos < end)
+    while len(active):
+        key = read_varint_column(buf, pos, active)
+        field = key >> 3
+        wire_type = key & 7
+        rows = active[key == 0x08]
+        if len(rows):
+            seconds[rows] = read_varint_column(buf, pos, rows)
+        rows = active[key == 0x10]
+        if len(rows):
+            nanos[rows] = read_varint_column(buf, pos, rows)
+        rows = active[key == 0x19]
+        if len(rows):
+            raw = buf[pos[rows, np.newaxis] + np.arange(8)]
+            vals[rows] = raw.copy().view('<f8').ravel()
+            pos[rows] += 8
+        rows = active[key == 0x1d]
+        if len(rows):
+            raw = buf[pos[rows, np.newaxis] + np.arange(4)].copy()
+            floats = is_float[chunk[rows]]
+            vals[rows] = np.where(
+                floats,
+                raw.view('<f4').ravel(),
+                raw.view('<i4').ravel(),
+            )
+            pos[rows] += 4
+        rows = active[key == 0x18]
+        if len(rows):
+            raw = read_varint_column(buf, pos, rows)
+            vals[rows] = (raw >> 1) ^ -(raw & 1)
+        # severity, status and the rest aren't used by the engine
+        other = ~np.isin(key, (0x08, 0x10, 0x18, 0x19, 0x1d)) & (field != 0)
+        for wire, width in ((0, None), (1, 8), (2, None), (5, 4)):
+            rows = active[other & (wire_type == wire)]
+            if not len(rows):
+                continue
+            if wire == 0:
+                read_varint_column(buf, pos, rows)
+            elif wire == 2:
+                pos[rows] += read_varint_column(buf, pos, rows)
+            else:
+                pos[rows] += width
+        unknown = other & ~np.isin(wire_type, (0, 1, 2, 5))
+        if unknown.any():
+            raise ValueError("unsupported wire type in sample")
+        active = active[pos[active] < end[active]]
+
+    times = year_ns[chunk] + seconds * 1000000000 + nanos
+    return times, vals
+
+
+def encode_raw(name, times, vals, payload_type=SCALAR_DOUBLE):
+    """
+    Encode samples in the getData.raw format. Used by the archiver simulator
+    and the tests.
+
+    Parameters
+    ----------
+    name : str
+        name of the PV
+
+    times : sequence of int
+        ns since the epoch, ascending
+
+    vals : sequence of float
+
+    payload_type : int
+        one of the numeric payload types
+
+    Returns
+    -------
+    bytes
+    """
+    chunks = []
+    year = None
+    lines = []
+    for t, v in zip(times, vals):
+        t = int(t)
+        t_year = int(np.datetime64(t, 'ns').astype('datetime64[Y]')
+            .astype(int)) + 1970
+        if t_year != year:
+            if lines:
+                chunks.append(b"\n".join(lines) + b"\n")
+            year = t_year
+            encoded_name = name.encode()
+            info = write_varint(0x08) + write_varint(payload_type) \
+                + b"\x12" + write_varint(len(encoded_name)) + encoded_name \
+                + b"\x18" + write_varint(year)
+            lines = [escape(info)]
+        into_year = t - year_start_ns(year)
+        sample = b"\x08" + write_varint(into_year // 1000000000) \
+            + b"\x10" + write_varint(into_year % 1000000000)
+        if payload_type == SCALAR_DOUBLE:
+            sample = sample + b"\x19" + _double.pack(v)
+        elif payload_type == SCALAR_FLOAT:
+            sample = sample + b"\x1d" + _float.pack(v)
+        elif payload_type == SCALAR_INT:
+            sample = sample + b"\x1d" + _sfixed32.pack(int(v))
+        else:
+            sample = sample + b"\x18" + write_varint(
+                zigzag(int(v)) & 0xffffffff)
+        lines.append(escape(sample))
+    if lines:
+        chunks.append(b"\n".join(lines) + b"\n")
+    return b"\n".join(chunks)
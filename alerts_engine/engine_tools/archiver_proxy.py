@@ -0,0 +1,359 @@
+"""
+Caching HTTP proxy to run in front of the archiver appliances. Several
+engines, or several scans of one engine, asking for the same data are served
+by a single upstream request: identical requests arriving while one is in
+flight wait for its answer, and answers are kept in an LRU cache for a short
+time afterwards.
+
+Clients use it as a plain HTTP proxy, so it serves any number of appliances.
+Only retrieval requests are cached, management requests such as getPVStatus
+are always passed through. Hit and miss counts are served as JSON at /stats.
+
+The proxy can be started from the command line:
+
+    python -m engine_tools.archiver_proxy --port 17600 --ttl 30
+"""
+
+############
+# Standard #
+############
+import logging
+import argparse
+import collections
+import json
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse
+
+###############
+# Third Party #
+###############
+import requests
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+# upstream responses are passed on as (status, content type, body)
+CachedResponse = collections.namedtuple(
+    'CachedResponse', ['status', 'content_type', 'body'])
+
+
+class _Pending:
+    """
+    Upstream request other threads can wait on.
+
+    Note
+    ----
+        Intended for internal use only.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class ArchiverProxy:
+    """
+    Request coalescing and response cache of the proxy, independent of the
+    HTTP server.
+
+    Attributes
+    ----------
+    ttl : float
+        Seconds a response is served from the cache.
+
+    max_entries : int
+        Responses kept before the least recently used one is evicted.
+
+    stats : collections.Counter
+        'hits', 'misses', 'coalesced', 'evictions' and 'expired' counts.
+    """
+    def __init__(self, ttl=30.0, max_entries=1024, timeout=30.0,
+                 pool_size=16):
+        """
+        Parameters
+        ----------
+        ttl : float
+            Seconds a response is served from the cache.
+
+        max_entries : int
+            Number of responses kept in the cache.
+
+        timeout : float
+            Seconds to wait for the appliances.
+
+        pool_size : int
+            Keep-alive connections held open to each appliance.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize = pool_size,
+            pool_block = True,
+        )
+        self.session.mount("http://", adapter)
+        # the proxy's own environment must not send it to another proxy
+        self.session.trust_env = False
+        # url -> (expires, CachedResponse), least recently used first
+        self.cache = collections.OrderedDict()
+        # url -> _Pending
+        self.in_flight = {}
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+
+    def cacheable(self, url):
+        return urlparse(url).path.startswith("/retrieval/")
+
+    def _lookup(self, url, now):
+        """
+        Note
+        ----
+            Intended for internal use only.
+        """
+        entry = self.cache.get(url)
+        if entry == None:
+            return None
+        expires, response = entry
+        if expires <= now:
+            del self.cache[url]
+            self.stats['expired'] += 1
+            return None
+        self.cache.move_to_end(url)
+        return response
+
+    def _store(self, url, response, now):
+        """
+        Note
+        ----
+            Intended for internal use only.
+        """
+        self.cache[url] = (now + self.ttl, response)
+        self.cache.move_to_end(url)
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def upstream(self, url):
+        """
+        Make the actual request to the appliance.
+
+        Returns
+        -------
+        CachedResponse
+        """
+        response = self.session.get(url, timeout=self.timeout)
+        return CachedResponse(
+            response.status_code,
+            response.headers.get('Content-Type', 'application/octet-stream'),
+            response.content,
+        )
+
+    def get(self, url):
+        """
+        Answer a request, from the cache, by waiting on an identical request
+        in flight, or by asking the appliance.
+
+        Parameters
+        ----------
+        url : str
+            absolute URL on an appliance
+
+        Returns
+        -------
+        CachedResponse
+
+        Raises
+        ------
+        requests.RequestException
+            If the appliance couldn't be reached.
+        """
+        if not self.cacheable(url):
+            with self._lock:
+                self.stats['passed'] += 1
+            return self.upstream(url)
+        with self._lock:
+            response = self._lookup(url, time.monotonic())
+            if response != None:
+                self.stats['hits'] += 1
+                return response
+            pending = self.in_flight.get(url)
+            if pending != None:
+                self.stats['coalesced'] += 1
+                leader = False
+            else:
+                self.stats['misses'] += 1
+                pending = _Pending()
+                self.in_flight[url] = pending
+                leader = True
+        if not leader:
+            pending.done.wait()
+            if pending.error != None:
+                raise pending.error
+            return pending.response
+        try:
+            pending.response = self.upstream(url)
+        except Exception as exc:
+            pending.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self.in_flight[url]
+                # errors are passed on but never cached
+                if pending.response != None \
+                        and pending.response.status == 200:
+                    self._store(url, pending.response, time.monotonic())
+            pending.done.set()
+        return pending.response
+
+    def statistics(self):
+        """
+        Returns
+        -------
+        dict
+            the counters plus the current number of cached responses
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.cache)
+        for key in ('hits', 'misses', 'coalesced'):
+            stats.setdefault(key, 0)
+        return stats
+
+
+class ProxyRequestHandler(BaseHTTPRequestHandler):
+    """
+    Pass proxied GET requests to the server's ArchiverProxy.
+
+    Note
+    ----
+        Intended for internal use only.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def send_body(self, code, body, content_type="application/json"):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        proxy = self.server.proxy
+        # proxied requests carry the absolute URL of the appliance
+        if not self.path.startswith("http://"):
+            if urlparse(self.path).path == "/stats":
+                self.send_body(200,
+                    json.dumps(proxy.statistics()).encode())
+            else:
+                self.send_body(404, b"not found", "text/plain")
+            return
+        try:
+            response = proxy.get(self.path)
+        except requests.RequestException as exc:
+            logger.warning("upstream request failed: {}".format(exc))
+            self.send_body(502, str(exc).encode(), "text/plain")
+            return
+        self.send_body(response.status, response.body,
+            response.content_type)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class ProxyHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ProxyServer:
+    """
+    Runs an ArchiverProxy behind an HTTP server in a background thread.
+    """
+    def __init__(self, proxy=None, host="127.0.0.1", port=0):
+        """
+        Parameters
+        ----------
+        proxy : ArchiverProxy
+            proxy to serve, a default ArchiverProxy is made if None
+
+        host : str
+            interface to bind
+
+        port : int
+            port to bind, 0 picks a free one
+        """
+        if proxy == None:
+            proxy = ArchiverProxy()
+        self.proxy = proxy
+        self.httpd = ProxyHTTPServer((host, port), ProxyRequestHandler)
+        self.httpd.proxy = proxy
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.httpd.server_address[0]
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(self.host, self.port)
+
+    def start(self):
+        """
+        Serve requests from a background thread.
+        """
+        self.thread = threading.Thread(
+            target = self.httpd.serve_forever,
+            daemon = True,
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving and release the socket.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=17600)
+    parser.add_argument("--ttl", type=float, default=30.0)
+    parser.add_argument("--max-entries", type=int, default=1024)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    proxy = ArchiverProxy(
+        ttl = args.ttl,
+        max_entries = args.max_entries,
+        timeout = args.timeout,
+    )
+    server = ProxyServer(proxy, args.host, args.port)
+    logger.info("proxying on {}:{}".format(server.host, server.port))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
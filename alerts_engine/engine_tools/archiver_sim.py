@@ -0,0 +1,517 @@
+"""
+Local stand-in for an archiver appliance. SimArchiver serves synthetic or
+recorded PV series over the appliance's getData API so TriggerScan can be
+run and measured without a live archiver.
+
+The server can be started from the command line:
+
+    python -m engine_tools.archiver_sim --port 17668 --latency .05
+"""
+
+############
+# Standard #
+############
+import logging
+import argparse
+import datetime
+import json
+import math
+import random
+import re
+import socketserver
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+###############
+# Third Party #
+###############
+import numpy as np
+
+##########
+# Custom #
+##########
+from . import archiver_pb
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+# post-processed requests such as max_60(PV:NAME)
+POST_PROCESSOR = re.compile(r"^(\w+?)_(\d+)\((.+)\)$")
+
+REDUCERS = {
+    'min': np.minimum.reduceat,
+    'max': np.maximum.reduceat,
+    'mean': lambda vals, starts: np.add.reduceat(vals, starts)
+        / np.diff(np.append(starts, len(vals))),
+}
+
+
+def parse_time(text):
+    """
+    Read an ISO 8601 timestamp as sent by ArchiverClient.
+
+    Returns
+    -------
+    int
+        nanoseconds since the epoch
+    """
+    text = text.replace("Z", "+0000")
+    if "." in text:
+        dt = datetime.datetime.strptime(text, "%Y-%m-%dT%H:%M:%S.%f%z")
+    else:
+        dt = datetime.datetime.strptime(text, "%Y-%m-%dT%H:%M:%S%z")
+    seconds = int(dt.replace(microsecond=0).timestamp())
+    return seconds * 1000000000 + dt.microsecond * 1000
+
+
+def format_status_time(ns):
+    """
+    Format a time the way getPVStatus reports it, in UTC.
+    """
+    dt = datetime.datetime.fromtimestamp(
+        int(ns) // 1000000000, datetime.timezone.utc)
+    return dt.strftime("%b/%d/%Y %H:%M:%S +00:00")
+
+
+class SyntheticSeries:
+    """
+    Deterministic sine wave sampled at a fixed period. The wave's parameters
+    are derived from the PV name so every replay sees the same data.
+    """
+    def __init__(self, name, period=1.0):
+        """
+        Parameters
+        ----------
+        name : str
+            name of the PV, seeds the wave's amplitude, offset and phase
+
+        period : float
+            seconds between samples
+        """
+        seed = zlib.crc32(name.encode())
+        self.period_ns = int(period * 1000000000)
+        self.offset = seed % 100
+        self.amplitude = 1 + (seed >> 8) % 10
+        self.wavelength = 60 + (seed >> 16) % 600
+
+    def samples(self, start, end):
+        """
+        Samples covering [start, end] plus the newest one before start.
+
+        Parameters
+        ----------
+        start : int
+            ns since the epoch
+
+        end : int
+            ns since the epoch
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            (times, vals)
+        """
+        first = start // self.period_ns
+        last = end // self.period_ns
+        times = np.arange(first, last + 1, dtype=np.int64) * self.period_ns
+        vals = self.offset + self.amplitude * np.sin(
+            2 * math.pi * (times / 1e9) / self.wavelength)
+        return times, vals
+
+
+class RecordedSeries:
+    """
+    Fixed set of samples, e.g. loaded from a saved getData.json response.
+    """
+    def __init__(self, times, vals):
+        """
+        Parameters
+        ----------
+        times : sequence of int
+            ns since the epoch, ascending
+
+        vals : sequence of float
+        """
+        self.times = np.asarray(times, dtype=np.int64)
+        self.vals = np.asarray(vals, dtype=np.float64)
+
+    def samples(self, start, end):
+        lo = max(np.searchsorted(self.times, start, side='right') - 1, 0)
+        hi = np.searchsorted(self.times, end, side='right')
+        return self.times[lo:hi], self.vals[lo:hi]
+
+
+class SimArchiver:
+    """
+    Collection of PV series plus the failure behaviour of the simulated
+    appliance.
+
+    Attributes
+    ----------
+    latency : float
+        Seconds added to every data request.
+
+    jitter : float
+        Up to this many extra seconds are randomly added to the latency.
+
+    error_rate : float
+        Probability (0-1) that a data request fails with HTTP 500.
+
+    synthesize : bool
+        If true, PVs without a recorded series are served a SyntheticSeries.
+        Otherwise they are answered with an empty response, like a PV the
+        appliance doesn't archive.
+
+    request_count : int
+        Number of data requests answered so far.
+
+    status_count : int
+        Number of getPVStatus requests answered so far.
+
+    binned_count : int
+        Number of data requests answered through a post-processor.
+
+    Note
+    ----
+        The management interface (getPVStatus) is served on the same port as
+        the retrieval interface.
+    """
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0,
+                 synthesize=True, period=1.0, seed=None):
+        """
+        Parameters
+        ----------
+        period : float
+            sample period in seconds of synthesized PVs
+
+        seed : int
+            seed for the latency jitter and error injection
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.synthesize = synthesize
+        self.period = period
+        self.series = {}
+        self.request_count = 0
+        self.status_count = 0
+        self.binned_count = 0
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def add_series(self, name, series):
+        """
+        Serve the given series for a PV.
+        """
+        self.series[name] = series
+
+    def load_recording(self, path):
+        """
+        Load PV series from a json file holding a list of getData.json
+        responses, i.e. entries of the form {"meta": {"name": ...},
+        "data": [{"secs": ..., "nanos": ..., "val": ...}, ...]}.
+
+        Parameters
+        ----------
+        path : str
+            location of the recording
+        """
+        with open(path) as fp:
+            recording = json.load(fp)
+        for entry in recording:
+            samples = entry['data']
+            times = [s['secs'] * 1000000000 + s.get('nanos', 0)
+                for s in samples]
+            vals = [s['val'] for s in samples]
+            self.add_series(entry['meta']['name'], RecordedSeries(times, vals))
+
+    def samples(self, name, start, end):
+        """
+        A PV's samples for a request, applying the post-processor if the
+        name asks for one. A post-processed PV gets one sample per bin,
+        stamped with the bin's start.
+
+        Returns
+        -------
+        tuple of numpy.ndarray or None
+            (times, vals), None if the PV isn't archived
+        """
+        match = POST_PROCESSOR.match(name)
+        if match and match.group(1) in REDUCERS:
+            operator, bin_size, name = match.groups()
+        else:
+            operator = None
+        series = self.lookup(name)
+        if series == None:
+            return None
+        times, vals = series.samples(start, end)
+        if operator == None or len(times) == 0:
+            return times, vals
+        with self._lock:
+            self.binned_count = self.binned_count + 1
+        bin_ns = int(bin_size) * 1000000000
+        bins = times // bin_ns
+        starts = np.flatnonzero(np.concatenate(([True], np.diff(bins) != 0)))
+        return bins[starts] * bin_ns, REDUCERS[operator](vals, starts)
+
+    def lookup(self, name):
+        """
+        Return the series for a PV or None if it isn't archived.
+        """
+        if name in self.series:
+            return self.series[name]
+        if self.synthesize:
+            return SyntheticSeries(name, self.period)
+        return None
+
+    def pv_status(self, names):
+        """
+        Build the getPVStatus response for a list of PVs.
+
+        Parameters
+        ----------
+        names : list of str
+
+        Returns
+        -------
+        list
+        """
+        with self._lock:
+            self.status_count = self.status_count + 1
+        now = int(time.time()) * 1000000000
+        status = []
+        for name in names:
+            series = self.lookup(name)
+            if series == None:
+                status.append({"pvName": name, "status": "Not being archived"})
+                continue
+            times = series.samples(now, now)[0]
+            entry = {"pvName": name, "status": "Being archived"}
+            if len(times):
+                entry["lastEvent"] = format_status_time(times[-1])
+            status.append(entry)
+        return status
+
+    def fail_next(self):
+        """
+        Apply latency to a request and decide whether it fails.
+
+        Returns
+        -------
+        bool
+            True if the request should be answered with an error
+        """
+        with self._lock:
+            self.request_count = self.request_count + 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        return failed
+
+    def get_data(self, name, start, end):
+        """
+        Build the getData.json response for a PV.
+
+        Parameters
+        ----------
+        name : str
+            name of the PV
+
+        start : int
+            ns since the epoch
+
+        end : int
+            ns since the epoch
+
+        Returns
+        -------
+        list
+        """
+        samples = self.samples(name, start, end)
+        if samples == None:
+            return []
+        times, vals = samples
+        secs, nanos = np.divmod(times, 1000000000)
+        data = [
+            {"secs": int(s), "nanos": int(n), "val": float(v),
+             "severity": 0, "status": 0}
+            for s, n, v in zip(secs, nanos, vals)
+        ]
+        return [{"meta": {"name": name, "PREC": "3"}, "data": data}]
+
+    def get_raw(self, name, start, end):
+        """
+        Build the getData.raw response for a PV.
+
+        Parameters
+        ----------
+        name : str
+            name of the PV
+
+        start : int
+            ns since the epoch
+
+        end : int
+            ns since the epoch
+
+        Returns
+        -------
+        bytes
+        """
+        samples = self.samples(name, start, end)
+        if samples == None:
+            return b""
+        return archiver_pb.encode_raw(name, *samples)
+
+
+class SimRequestHandler(BaseHTTPRequestHandler):
+    """
+    Translate HTTP requests into calls on the server's SimArchiver.
+
+    Note
+    ----
+        Intended for internal use only.
+    """
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    def send_body(self, code, body, content_type="application/json"):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        sim = self.server.sim
+        if url.path in ("/retrieval/data/getData.json",
+                        "/retrieval/data/getData.raw"):
+            if sim.fail_next():
+                self.send_body(500, b"simulated failure", "text/plain")
+                return
+            try:
+                name = query['pv'][0]
+                start = parse_time(query['from'][0])
+                end = parse_time(query['to'][0])
+            except (KeyError, ValueError):
+                self.send_body(400, b"bad request", "text/plain")
+                return
+            if url.path.endswith(".raw"):
+                body = sim.get_raw(name, start, end)
+                self.send_body(200, body, "application/x-protobuf")
+            else:
+                body = json.dumps(sim.get_data(name, start, end)).encode()
+                self.send_body(200, body)
+        elif url.path == "/mgmt/bpl/getPVStatus":
+            if 'pv' not in query:
+                self.send_body(400, b"bad request", "text/plain")
+                return
+            names = query['pv'][0].split(",")
+            self.send_body(200, json.dumps(sim.pv_status(names)).encode())
+        else:
+            self.send_body(404, b"not found", "text/plain")
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class SimHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class SimServer:
+    """
+    Runs a SimArchiver behind an HTTP server in a background thread.
+    """
+    def __init__(self, sim=None, host="127.0.0.1", port=0):
+        """
+        Parameters
+        ----------
+        sim : SimArchiver
+            archiver to serve, a default SimArchiver is made if None
+
+        host : str
+            interface to bind
+
+        port : int
+            port to bind, 0 picks a free one
+        """
+        if sim == None:
+            sim = SimArchiver()
+        self.sim = sim
+        self.httpd = SimHTTPServer((host, port), SimRequestHandler)
+        self.httpd.sim = sim
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.httpd.server_address[0]
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        """
+        Serve requests from a background thread.
+        """
+        self.thread = threading.Thread(
+            target = self.httpd.serve_forever,
+            daemon = True,
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving and release the socket.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=17668)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--period", type=float, default=1.0)
+    parser.add_argument("--recording", default=None)
+    args = parser.parse_args()
+
+    sim = SimArchiver(
+        latency = args.latency,
+        jitter = args.jitter,
+        error_rate = args.error_rate,
+        period = args.period,
+    )
+    if args.recording:
+        sim.load_recording(args.recording)
+    server = SimServer(sim, args.host, args.port)
+    logger.info("serving on {}:{}".format(server.host, server.port))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
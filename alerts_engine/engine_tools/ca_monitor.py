@@ -0,0 +1,275 @@
+"""
+Channel Access ingestion for the engine. Instead of polling the archiver,
+MonitorScan subscribes to every configured PV and evaluates the triggers on
+short micro-windows of the updates that arrived since the previous one.
+
+Requires caproto, which is only imported when a Channel Access context is
+actually needed.
+"""
+
+############
+# Standard #
+############
+import logging
+import datetime
+import threading
+import time
+
+###############
+# Third Party #
+###############
+import numpy as np
+
+##########
+# Custom #
+##########
+from .archiver_client import PvSamples, epoch_ns
+from .record_scanner import TriggerScan
+from .sample_cache import SampleCache
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+
+def default_context():
+    """
+    Make a caproto threading client Context.
+
+    Raises
+    ------
+    ImportError
+        If caproto isn't installed.
+    """
+    try:
+        from caproto.threading.client import Context
+    except ImportError:
+        raise ImportError(
+            "caproto is required to ingest PVs over Channel Access")
+    return Context()
+
+
+class MonitorSource:
+    """
+    Keeps a Channel Access monitor on each watched PV. Monitor callbacks only
+    append to a pending list; the updates are moved into each PV's RingBuffer
+    in one batch when a window is collected.
+
+    Samples are stamped with their arrival time rather than the IOC's
+    timestamp so that windows line up with the engine's own clock.
+    """
+    def __init__(self, context=None, capacity=4096, connect_timeout=2.0):
+        """
+        Parameters
+        ----------
+        context : caproto.threading.client.Context
+            Channel Access context to subscribe with, a new one is made if
+            None.
+
+        capacity : int
+            Number of samples preallocated per PV.
+
+        connect_timeout : float
+            Seconds to wait when searching for new PVs.
+        """
+        if context == None:
+            context = default_context()
+        self.context = context
+        self.connect_timeout = connect_timeout
+        self.cache = SampleCache(capacity)
+        # PV name -> (caproto PV, subscription)
+        self.subscriptions = {}
+        self.pending = {}
+        self._lock = threading.Lock()
+
+    def watch(self, names):
+        """
+        Monitor exactly the given PVs, subscribing to new ones and dropping
+        the ones no longer listed.
+
+        Parameters
+        ----------
+        names : list of str
+        """
+        wanted = set(names)
+        for name in set(self.subscriptions) - wanted:
+            pv, sub = self.subscriptions.pop(name)
+            sub.clear()
+            self.cache.discard(name)
+            with self._lock:
+                self.pending.pop(name, None)
+        new = [name for name in names if name not in self.subscriptions]
+        if not new:
+            return
+        logger.debug("subscribing to {} PVs".format(len(new)))
+        pvs = self.context.get_pvs(*new, timeout=self.connect_timeout)
+        for name, pv in zip(new, pvs):
+            sub = pv.subscribe(data_type='time')
+            sub.add_callback(self._callback)
+            self.subscriptions[name] = (pv, sub)
+
+    def connected(self, name):
+        return name in self.subscriptions \
+            and self.subscriptions[name][0].connected
+
+    def _callback(self, sub, response):
+        """
+        Note
+        ----
+            Intended for internal use only.
+        """
+        try:
+            value = float(response.data[0])
+        except (TypeError, ValueError, IndexError):
+            logger.debug("ignoring non-numeric update of {}".format(
+                sub.pv.name))
+            return
+        self.push(sub.pv.name, value)
+
+    def push(self, name, value, timestamp=None):
+        """
+        Queue an update of a PV.
+
+        Parameters
+        ----------
+        name : str
+            name of the PV
+
+        value : float
+
+        timestamp : int
+            ns since the epoch, defaults to now
+        """
+        if timestamp == None:
+            timestamp = int(time.time() * 1e9)
+        with self._lock:
+            self.pending.setdefault(name, []).append((timestamp, value))
+
+    def flush(self):
+        """
+        Move all queued updates into the PVs' buffers.
+        """
+        with self._lock:
+            pending = self.pending
+            self.pending = {}
+        for name, updates in pending.items():
+            if name not in self.subscriptions:
+                continue
+            times = np.fromiter((u[0] for u in updates), np.int64,
+                len(updates))
+            vals = np.fromiter((u[1] for u in updates), np.float64,
+                len(updates))
+            order = np.argsort(times, kind='stable')
+            self.cache.buffer(name).extend(times[order], vals[order])
+
+    def window(self, name, start, end):
+        """
+        A PV's samples in [start, end] plus the newest one before start.
+
+        Parameters
+        ----------
+        name : str
+
+        start : int
+            ns since the epoch
+
+        end : int
+            ns since the epoch
+
+        Returns
+        -------
+        PvSamples
+        """
+        buf = self.cache.buffer(name)
+        buf.evict(start)
+        return PvSamples(*buf.window(start, end))
+
+
+class MonitorScan(TriggerScan):
+    """
+    TriggerScan fed by Channel Access monitors. Run it from an EventMgr whose
+    interval is the micro-window; each scanTask evaluates the updates that
+    arrived during the last window using the usual Pv and Trigger
+    configuration, subscriptions following any configuration change.
+    """
+    def __init__(self, rep_t=datetime.timedelta(seconds=.5), context=None,
+                 buffer_capacity=4096, connect_timeout=2.0):
+        """
+        Parameters
+        ----------
+        rep_t : datetime.timedelta
+            length of the micro-windows
+
+        context : caproto.threading.client.Context
+            Channel Access context, a new one is made if None
+
+        buffer_capacity : int
+            Number of samples preallocated per PV.
+
+        connect_timeout : float
+            Seconds to wait when searching for new PVs.
+        """
+        # the archiver settings are left at their defaults, no request is
+        # ever made to it
+        super().__init__(rep_t=rep_t, deadline_fraction=None)
+        self.source = MonitorSource(
+            context,
+            capacity = buffer_capacity,
+            connect_timeout = connect_timeout,
+        )
+
+    def archPull(self, pv_list, end_time=None, start_time=None,
+                 failures=None, reductions=None, lookbacks=None):
+        """
+        Return the monitored samples of a collection of PVs in the same form
+        as TriggerScan.archPull with the "pb" fetch_format.
+
+        Parameters
+        ----------
+        pv_list : django.db.models.query.Queryset (Pv type) or list of strings
+
+        end_time : datetime.datetime
+            end of the window, defaults to now
+
+        start_time : datetime.datetime
+            start of the window, defaults to end_time - rep_t
+
+        failures : dict
+            If given, PVs whose channel isn't connected are added to it.
+
+        reductions : dict
+            Ignored, monitors always deliver every update.
+
+        lookbacks : dict
+            PV name mapped to how far back from end_time its samples are
+            kept, for triggers with windows longer than the micro-window.
+
+        Returns
+        -------
+        dict of PvSamples
+        """
+        if end_time == None:
+            end_time = datetime.datetime.now()
+        if start_time == None:
+            start_time = end_time - self.rep_t
+        if lookbacks == None:
+            lookbacks = {}
+        pv_names = self._pvNames(pv_list)
+
+        self.source.watch(pv_names)
+        self.source.flush()
+        end_ns = epoch_ns(end_time)
+        pv_data = {}
+        for name in pv_names:
+            if not self.source.connected(name):
+                if failures != None:
+                    failures[name] = ConnectionError(
+                        "{} is not connected".format(name))
+                continue
+            if name in lookbacks:
+                start_ns = epoch_ns(end_time - lookbacks[name])
+            else:
+                start_ns = epoch_ns(start_time)
+            pv_data[name] = self.source.window(name, start_ns, end_ns)
+        return pv_data
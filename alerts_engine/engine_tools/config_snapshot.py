@@ -0,0 +1,123 @@
+"""
+In-memory copy of the alert configuration. The engine keeps the triggers as
+plain records together with the newest ConfigChange log entry they reflect.
+Later entries only cause the triggers they touch to be read again; the
+patched records are compiled into a new snapshot that replaces the old one
+in a single assignment between scans.
+"""
+
+############
+# Standard #
+############
+import logging
+import collections
+
+##########
+# Custom #
+##########
+from .trigger_table import TriggerTable
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+# fields of each trigger the engine needs, in TriggerTable's row order
+TRIGGER_FIELDS = ('pk', 'pv__name', 'compare', 'value', 'window', 'alert_id',
+                  'pv_id', 'kind', 'deadband', 'dwell')
+
+TriggerRecord = collections.namedtuple(
+    'TriggerRecord',
+    ['pk', 'pv', 'compare', 'value', 'window', 'alert', 'pv_id', 'kind',
+     'deadband', 'dwell'],
+)
+# rows from before the trigger kinds are level triggers
+TriggerRecord.__new__.__defaults__ = ('level', None, None)
+
+
+class ConfigSnapshot:
+    """
+    Triggers as of one point in the change log, compiled into a
+    TriggerTable.
+
+    Attributes
+    ----------
+    version : int
+        pk of the newest ConfigChange the records reflect.
+
+    records : dict
+        trigger pk mapped to its TriggerRecord
+
+    table : TriggerTable
+    """
+    def __init__(self, version, rows, indexes=None, carry=None):
+        """
+        Parameters
+        ----------
+        version : int
+
+        rows : iterable of tuple
+            values of TRIGGER_FIELDS for each trigger
+
+        indexes : dict
+            ThresholdIndexes to reuse, see TriggerTable. The dict is copied,
+            the snapshot it came from is left untouched.
+
+        carry : dict
+            carried trigger states to reuse, copied like the indexes
+        """
+        self.version = version
+        self.records = collections.OrderedDict(
+            (row[0], TriggerRecord(*row)) for row in rows)
+        if indexes == None:
+            indexes = {}
+        if carry == None:
+            carry = {}
+        self.table = TriggerTable(self.records.values(), dict(indexes),
+            dict(carry))
+
+    def __len__(self):
+        return len(self.records)
+
+    def patched(self, version, changes, fetch):
+        """
+        A new snapshot with the changed triggers read again.
+
+        Parameters
+        ----------
+        version : int
+            pk of the newest of the changes
+
+        changes : iterable of tuple
+            (model, object pk) of each ConfigChange entry, model being
+            'alert', 'pv' or 'trigger'
+
+        fetch : callable
+            fetch(trigger_pks, alert_pks, pv_pks) returns the rows of
+            TRIGGER_FIELDS of the triggers with any of the given pks,
+            alerts or PVs
+
+        Returns
+        -------
+        ConfigSnapshot
+        """
+        touched = {'alert': set(), 'pv': set(), 'trigger': set()}
+        for model, pk in changes:
+            touched[model].add(pk)
+        # triggers dropped or moved to another alert or PV are removed;
+        # whatever still matches is read back below
+        records = collections.OrderedDict(
+            (pk, record) for pk, record in self.records.items()
+            if pk not in touched['trigger']
+            and record.alert not in touched['alert']
+            and record.pv_id not in touched['pv']
+        )
+        dropped = len(self.records) - len(records)
+        rows = list(fetch(touched['trigger'], touched['alert'],
+            touched['pv']))
+        for row in rows:
+            records[row[0]] = row
+        logger.debug("{} triggers replaced by {} after {} changes".format(
+            dropped, len(rows), sum(len(pks) for pks in touched.values())))
+        return ConfigSnapshot(version, records.values(), self.table.indexes,
+            self.table.carry)
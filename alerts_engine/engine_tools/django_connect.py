@@ -8,7 +8,23 @@ document as it stands to break a lot of scripts.
 import sys, os
     
 import django
-def prepare():
+
+# full settings of the web interface
+WEB_SETTINGS = 'web_interface.settings'
+# minimal settings for the alerts engine, see web_interface/engine_settings.py
+ENGINE_SETTINGS = 'web_interface.engine_settings'
+
+def prepare(settings=WEB_SETTINGS):
+    """
+    Make the web_interface project importable and set Django up.
+
+    Parameters
+    ----------
+    settings : str
+        Settings module to use. Defaults to WEB_SETTINGS; the engine uses
+        ENGINE_SETTINGS. Once Django is configured, later calls keep the
+        settings of the first one.
+    """
     sys.path.append(
         os.path.abspath(
             os.path.join(
@@ -21,7 +37,7 @@ def prepare():
         )
     )
     
-    os.environ['DJANGO_SETTINGS_MODULE'] = 'web_interface.settings'
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings
     django.setup()
     
     
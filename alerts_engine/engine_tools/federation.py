@@ -0,0 +1,137 @@
+"""
+Routing of PVs across several archiver appliances. ApplianceRouter asks the
+appliances which of them archives each PV and caches the answer for a while,
+so TriggerScan can send every request straight to the right appliance.
+"""
+
+############
+# Standard #
+############
+import logging
+import threading
+import time
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+BEING_ARCHIVED = "Being archived"
+
+
+class ApplianceRouter:
+    """
+    Cached PV to appliance routing table.
+
+    PVs that no appliance reports as archived are routed to the first
+    (primary) appliance, matching the behaviour of a single appliance setup.
+    """
+    def __init__(self, clients, ttl=3600.0, batch_size=100):
+        """
+        Parameters
+        ----------
+        clients : list of archiver_client.ArchiverClient
+            one client per appliance, the first is the primary
+
+        ttl : float
+            seconds a discovered route is trusted before being looked up
+            again
+
+        batch_size : int
+            number of PVs asked about in a single status request
+        """
+        self.clients = list(clients)
+        self.ttl = ttl
+        self.batch_size = batch_size
+        # PV name -> (client, time the route expires)
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.clients[0]
+
+    def invalidate(self, name=None):
+        """
+        Forget a PV's route, or every route if name is None.
+        """
+        with self._lock:
+            if name == None:
+                self.routes.clear()
+            else:
+                self.routes.pop(name, None)
+
+    def discover(self, names, timeout=None):
+        """
+        Ask every appliance which of the given PVs it archives and cache the
+        answers.
+
+        Parameters
+        ----------
+        names : list of str
+            PVs to look up
+
+        timeout : float
+            seconds to wait for each status request
+        """
+        found = {}
+        complete = True
+        for client in self.clients:
+            for i in range(0, len(names), self.batch_size):
+                batch = names[i:i + self.batch_size]
+                try:
+                    status = client.get_pv_status(batch, timeout)
+                except Exception as exc:
+                    logger.warning("PV status from {} failed: {!r}".format(
+                        client.hostname, exc))
+                    complete = False
+                    continue
+                for name, info in status.items():
+                    if info.get('status') == BEING_ARCHIVED:
+                        found.setdefault(name, client)
+
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for name in names:
+                if name in found:
+                    self.routes[name] = (found[name], expires)
+                elif complete:
+                    # nobody archives it, don't ask again until the ttl runs
+                    # out. If an appliance didn't answer, it may hold the PV.
+                    self.routes[name] = (self.primary, expires)
+
+    def route(self, names, timeout=None):
+        """
+        Group PVs by the appliance that archives them. PVs without a fresh
+        route are discovered first.
+
+        Parameters
+        ----------
+        names : list of str
+            PVs to route
+
+        timeout : float
+            seconds to wait for each status request
+
+        Returns
+        -------
+        list of tuple
+            (client, list of PV names) for each appliance with PVs, in the
+            order of the clients
+        """
+        if len(self.clients) == 1:
+            return [(self.primary, list(names))]
+        now = time.monotonic()
+        with self._lock:
+            stale = [name for name in names
+                if name not in self.routes or self.routes[name][1] <= now]
+        if stale:
+            self.discover(stale, timeout)
+
+        groups = dict((client.hostname, []) for client in self.clients)
+        with self._lock:
+            for name in names:
+                client = self.routes.get(name, (self.primary, None))[0]
+                groups[client.hostname].append(name)
+        return [(client, groups[client.hostname])
+            for client in self.clients if groups[client.hostname]]
@@ -0,0 +1,139 @@
+"""
+Fetch planning for triggers with their own lookback windows. All windows of
+a scan end at the scan's target time, so the windows of a PV's triggers nest
+inside the longest one: each PV is fetched once over its longest window and
+every trigger is evaluated on a view of that fetch.
+"""
+
+############
+# Standard #
+############
+import logging
+
+###############
+# Third Party #
+###############
+import numpy as np
+
+##########
+# Custom #
+##########
+from .archiver_client import PvSamples, epoch_ns
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+
+def window_view(pv, data, start):
+    """
+    Narrow a PV's data to the samples after start, plus the newest one at
+    or before start. Nothing is copied.
+
+    Parameters
+    ----------
+    pv : str
+        name of the PV
+
+    data : PvSamples or xarray.Dataset
+
+    start : int
+        ns since the epoch
+
+    Returns
+    -------
+    PvSamples or xarray.Dataset
+    """
+    if isinstance(data, PvSamples):
+        times = data.times
+    else:
+        times = data[pv]['time'].values.view(np.int64)
+    lo = max(np.searchsorted(times, start, side='right') - 1, 0)
+    if lo == 0:
+        return data
+    if isinstance(data, PvSamples):
+        return PvSamples(data.times[lo:], data.vals[lo:])
+    return data.isel(time=slice(lo, None))
+
+
+class FetchPlan:
+    """
+    Lookback windows of each PV's triggers.
+
+    Attributes
+    ----------
+    default_window : datetime.timedelta
+        Window of triggers that don't set their own, the scan period.
+
+    windows : dict
+        PV name mapped to the set of its triggers' windows.
+    """
+    def __init__(self, default_window, rows=()):
+        """
+        Parameters
+        ----------
+        default_window : datetime.timedelta
+
+        rows : iterable of tuple
+            (PV name, trigger window or None) for each trigger
+        """
+        self.default_window = default_window
+        self.windows = {}
+        for name, window in rows:
+            self.add(name, window)
+
+    def add(self, name, window=None):
+        if window == None:
+            window = self.default_window
+        self.windows.setdefault(name, set()).add(window)
+
+    def lookback(self, name):
+        """
+        Longest window of a PV's triggers, the span it has to be fetched
+        over.
+        """
+        if name not in self.windows:
+            return self.default_window
+        return max(self.windows[name])
+
+    def lookbacks(self):
+        """
+        Returns
+        -------
+        dict
+            PV name mapped to its lookback, only for PVs that differ from
+            the default window
+        """
+        return dict(
+            (name, self.lookback(name)) for name in self.windows
+            if self.lookback(name) != self.default_window
+        )
+
+    def view(self, name, data, window, end_time):
+        """
+        The part of a PV's fetched data a trigger looks at.
+
+        Parameters
+        ----------
+        name : str
+            name of the PV
+
+        data : PvSamples or xarray.Dataset
+            data fetched over the PV's lookback
+
+        window : datetime.timedelta or None
+            the trigger's window, None for the default
+
+        end_time : datetime.datetime
+            end of the scan's windows
+
+        Returns
+        -------
+        PvSamples or xarray.Dataset
+        """
+        if window == None:
+            window = self.default_window
+        if window >= self.lookback(name):
+            return data
+        return window_view(name, data, epoch_ns(end_time - window))
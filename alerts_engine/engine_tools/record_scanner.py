@@ -8,13 +8,16 @@ Contains TriggerScan, the task to be run at regular intervals.
 import logging
 import sys
 import os
+import collections
 import datetime
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 ###############
 # Third Party #
 ###############
 import django
-from archapp.interactive import EpicsArchive
+import numpy as np
 
 ##########
 # Custom #
@@ -23,15 +26,48 @@ from archapp.interactive import EpicsArchive
 #from .django_connect import prepare
 from . import django_connect
 from . import email_wrapper
+from .archiver_client import (ArchiverClient, PvSamples, epoch_ns,
+                              from_epoch_ns, arrays_to_xarray)
+from .sample_cache import SampleCache
+from .segment_store import SegmentStore, merge_samples
+from .segment_store import window as sample_window
+from .resilience import CircuitBreaker, call_with_retries
+from .federation import ApplianceRouter
+from .fetch_planner import FetchPlan
+from .config_snapshot import ConfigSnapshot, TRIGGER_FIELDS
 
 #################
 # Configuration #
 #################
 logger = logging.getLogger(__name__)
-django_connect.prepare()
+django_connect.prepare(django_connect.ENGINE_SETTINGS)
 from alert_config_app.models import *
 from account_mgr_app.models import *
+from django.db.models import Prefetch, Q
 
+# server side reduction able to stand in for the raw samples of a window,
+# comparisons missing here need every sample
+REDUCTIONS = {
+    '<': 'min',
+    '<=': 'min',
+    '>': 'max',
+    '>=': 'max',
+}
+
+# ns resolution of the lastEvent times getPVStatus reports
+STATUS_RESOLUTION = 1000000000
+
+# ConfigChange entries applied and older than this are pruned from the log
+CONFIG_LOG_RETENTION = datetime.timedelta(days=1)
+
+ScanResult = collections.namedtuple(
+    'ScanResult',
+    ['target_time', 'tripped', 'failed'],
+)
+ScanResult.__doc__ = """
+Outcome of one scanTask: the scan's target time, the set of tripped trigger
+pks and a dict mapping each PV that could not be pulled to its error.
+"""
 
 
 def test_db():
@@ -47,20 +83,228 @@ def test_db():
 
 
 class TriggerScan:
-    def __init__(self, hostname="pscaa02", rep_t=datetime.timedelta(minutes=1)):
+    def __init__(self, hostname="pscaa02", rep_t=datetime.timedelta(minutes=1),
+                 data_port=17668, max_workers=1, pool_size=None,
+                 idle_timeout=60.0, incremental=False, buffer_capacity=4096,
+                 fetch_format="json", deadline_fraction=0.8, retries=0,
+                 backoff=0.5, breaker_threshold=5, breaker_reset=30.0,
+                 mgmt_port=17665, routing_ttl=3600.0, segment_dir=None,
+                 segment_retention=None, segment_settle=60.0, bin_size=None,
+                 min_bins=2, streaming=False, chunk_samples=None,
+                 min_chunk=10.0, initial_chunk=3600.0, max_chunks=32,
+                 skip_unchanged=False, proxy=None, stateful=False,
+                 incremental_overlap=10.0):
         """
 
         Parameters
         ----------
-        hostname : string
-            specify location of archiver
+        hostname : string or list of strings
+            specify location of archiver. Given several appliances, each PV
+            is pulled from the appliance that archives it.
 
         rep_t : datetime.timedelta
             specify duration of each period between scans
+
+        data_port : int
+            port of the archiver's retrieval service
+
+        max_workers : int
+            Maximum number of archiver requests in flight at once. A value of
+            1 pulls the PVs serially. Defaults to 1.
+
+        pool_size : int
+            Number of keep-alive connections held open to the archiver.
+            Defaults to max_workers.
+
+        idle_timeout : float
+            Seconds the connection pool may sit unused before it is rebuilt.
+
+        incremental : bool
+            If true, keep each PV's recent samples in a SampleCache and only
+            request samples newer than those already held. Defaults to false.
+
+        buffer_capacity : int
+            Number of samples preallocated per PV when incremental is set.
+
+        incremental_overlap : float
+            Seconds before the previous pull's end that incremental pulls
+            request again, so samples the archiver writes late are still
+            merged in. Defaults to 10.
+
+        fetch_format : str
+            "json" pulls xarrays through the archiver's json interface. "pb"
+            pulls the binary protocol buffer format and decodes it straight
+            into PvSamples arrays, skipping xarray entirely. Defaults to
+            "json".
+
+        deadline_fraction : float
+            Fraction of rep_t that a scan's archiver pulls may take. Every PV
+            not pulled by then fails with resilience.DeadlineExceeded. None
+            disables the deadline. Defaults to 0.8.
+
+        retries : int
+            Number of times a failed PV request is repeated. Defaults to 0.
+
+        backoff : float
+            Seconds before the first retry, doubled for each further retry.
+
+        breaker_threshold : int
+            Consecutive failures after which the archiver's circuit breaker
+            opens and the remaining requests fail immediately.
+
+        breaker_reset : float
+            Seconds the circuit breaker stays open before trying again.
+
+        mgmt_port : int
+            Port of the appliances' management service, used to find which
+            appliance archives a PV.
+
+        routing_ttl : float
+            Seconds a PV's appliance is remembered before being looked up
+            again. Only used with several appliances.
+
+        segment_dir : str
+            If given, every fetch is also kept in a SegmentStore in this
+            directory and later pulls only request the gaps it doesn't
+            cover, including after a restart. xarrays built from it carry
+            the 'vals' field only. Defaults to None.
+
+        segment_retention : float
+            Seconds of history kept in the segment store, None keeps it all.
+
+        segment_settle : float
+            The archiver writes samples with a delay. Only the part of a
+            fetch older than this many seconds is marked as covered, the rest
+            is requested again later. Fetches whose settled part is shorter
+            than half of rep_t aren't stored at all.
+
+        bin_size : int
+            If given, PVs whose triggers only need a window's minimum or
+            maximum are pulled through the archiver's min_N/max_N
+            post-processors with bins of this many seconds. Only the partial
+            bins at the window's edges are pulled raw. Not used together with
+            incremental. Defaults to None, pulling raw samples.
+
+        min_bins : int
+            Windows spanning fewer whole bins than this are pulled raw.
+
+        streaming : bool
+            If true, scanTask evaluates each PV as soon as its data arrives
+            and drops the data straight after, instead of first collecting
+            every PV. Peak memory is then bounded by max_workers rather than
+            by the number of PVs. Defaults to false.
+
+        chunk_samples : int
+            If given, long windows are split into chunks expected to hold
+            about this many samples each, judging by the PV's sample rate in
+            its previous pull. The chunks are requested concurrently and
+            joined in time order. Pulls made this way go through the arrays
+            path, so xarrays carry the 'vals' field only. Defaults to None,
+            requesting each window in one piece.
+
+        min_chunk : float
+            Seconds, the shortest chunk a window is split into.
+
+        initial_chunk : float
+            Seconds per chunk for PVs whose sample rate isn't known yet.
+
+        max_chunks : int
+            Upper limit on the number of chunks per window.
+
+        skip_unchanged : bool
+            If true, scanTask first asks the appliances for each PV's last
+            event in one batched status request. PVs with no sample since
+            before their previous scan's window are not pulled again, their
+            previous results are reused. Defaults to false.
+
+        proxy : str
+            URL of an archiver_proxy, or any HTTP proxy, that every request
+            to the appliances goes through. Defaults to None, connecting
+            directly.
+
+        stateful : bool
+            If true, each trigger window's statistics are kept between scans
+            in a WindowState and only the newly arrived samples are folded
+            in, so evaluation follows the new data rather than the window
+            length. PVs pulled binned are still reduced whole. Defaults to
+            false.
         """
         #timing info etc probs useful
-        self.arch = EpicsArchive(hostname=hostname)
+        if pool_size == None:
+            pool_size = max_workers
+        if isinstance(hostname, str):
+            hostname = [hostname]
+        # every appliance gets its own connections and circuit breaker
+        self.appliances = [
+            ArchiverClient(
+                host,
+                data_port = data_port,
+                pool_size = pool_size,
+                idle_timeout = idle_timeout,
+                fetch_format = fetch_format,
+                breaker = CircuitBreaker(breaker_threshold, breaker_reset),
+                mgmt_port = mgmt_port,
+                proxy = proxy,
+            )
+            for host in hostname
+        ]
+        self.arch = self.appliances[0]
+        if len(self.appliances) > 1:
+            self.router = ApplianceRouter(self.appliances, routing_ttl)
+        else:
+            self.router = None
         self.rep_t = rep_t
+        self.deadline_fraction = deadline_fraction
+        self.retries = retries
+        self.backoff = backoff
+        self.max_workers = max(int(max_workers), 1)
+        # the pools persist across scans so threads aren't respawned each
+        # cycle. With several appliances each one gets max_workers threads of
+        # its own so a slow appliance can't hold up the others.
+        self.pools = {}
+        for client in self.appliances:
+            if self.max_workers > 1 or self.router != None:
+                self.pools[client.hostname] = ThreadPoolExecutor(
+                    max_workers=self.max_workers)
+            else:
+                self.pools[client.hostname] = None
+        self.pool = self.pools[self.arch.hostname]
+        self.incremental_overlap = incremental_overlap
+        if incremental:
+            self.cache = SampleCache(buffer_capacity)
+        else:
+            self.cache = None
+        if segment_dir != None:
+            self.store = SegmentStore(segment_dir, retention=segment_retention)
+        else:
+            self.store = None
+        self.segment_settle = segment_settle
+        self.bin_size = bin_size
+        self.min_bins = min_bins
+        self.streaming = streaming
+        self.chunk_samples = chunk_samples
+        self.min_chunk = min_chunk
+        self.initial_chunk = initial_chunk
+        self.max_chunks = max_chunks
+        # PV name -> samples per second seen in its latest pull
+        self.sample_rates = {}
+        if chunk_samples != None:
+            # chunks get their own threads, waiting on them from inside the
+            # PV pool could otherwise starve it
+            self.chunk_pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        else:
+            self.chunk_pool = None
+        self.skip_unchanged = skip_unchanged
+        # PV name -> (window end ns, lookback ns, trigger signature, tripped
+        # trigger pks) of its latest evaluation
+        self.pv_state = {}
+        # configuration kept between scans, see triggerTable
+        self.snapshot = None
+        if stateful:
+            # (PV name, window) -> WindowState
+            self.window_states = {}
+        else:
+            self.window_states = None
         self.emailer = email_wrapper.EmailWrapper("psmail","EASE")
 
     def dbPvPull(self,live=True):
@@ -79,12 +323,14 @@ class TriggerScan:
 
         """
         if live:
-            return Pv.objects.filter(trigger__isnull=False)
+            # the join lists a PV once per trigger
+            return Pv.objects.filter(trigger__isnull=False).distinct()
         else:
             return Pv.objects.all()
 
     def archPull(self, pv_list, end_time=datetime.datetime.now(),
-                 start_time=None):
+                 start_time=None, failures=None, reductions=None,
+                 lookbacks=None):
         """
         return xarray of archiver data for a collection of pvs. Duration of
         data is specified by the interval (rep_t) until the current_time 
@@ -94,6 +340,32 @@ class TriggerScan:
         ----
             xarray is preferred for its ability to easily store metadata in the
             attributes field. 
+
+            When the TriggerScan was built with max_workers > 1 the requests
+            are issued concurrently from the worker pool, so a pull takes about
+            as long as the slowest PV rather than the sum of all of them.
+
+            When the TriggerScan is incremental, only samples newer than the
+            previous pull, less incremental_overlap, are requested and the
+            results are views of each
+            PV's cached window. xarrays built this way carry the 'vals' field
+            only.
+
+            With the "pb" fetch_format each PV's data is returned as
+            PvSamples arrays rather than an xarray.
+
+            A PV that can't be pulled (after retries, before the deadline) is
+            left out of the result rather than failing the whole pull.
+
+            With several appliances the PVs are grouped by the appliance that
+            archives them and each group is pulled from its own worker pool.
+            A failed PV's route is forgotten so it is looked up again on the
+            next pull.
+
+            PVs given reductions are pulled binned when the TriggerScan has a
+            bin_size. Their data then holds the bins' minima and/or maxima
+            next to the raw edge samples, which keeps the window's minimum
+            and maximum exact but nothing else.
             
         Paramaters
         ----------
@@ -109,11 +381,40 @@ class TriggerScan:
             in which the interval set for the TriggerScan class calculates the
             start_time. 
 
+        failures : dict
+            If given, each PV that could not be pulled is added to it, mapped
+            to the exception raised. Defaults to None.
+
+        reductions : dict
+            PV name mapped to the set of reductions ('min', 'max' or 'raw')
+            its triggers need, see pvReductions. Defaults to None, pulling
+            every PV raw.
+
+        lookbacks : dict
+            PV name mapped to a datetime.timedelta. Those PVs are pulled from
+            end_time minus their lookback instead of from start_time, see
+            FetchPlan. Defaults to None.
+
         Returns
         -------
-        dict of xarray.DataArray
+        dict of xarray.DataArray or PvSamples
             xarray with PV data
         """
+        pv_names = self._pvNames(pv_list)
+        pv_data = dict(self.archStream(
+            pv_names, end_time, start_time, failures, reductions, lookbacks))
+        # completion order is arbitrary, keep the order the PVs were given in
+        return dict(
+            (name, pv_data[name]) for name in pv_names if name in pv_data)
+
+    def _pvNames(self, pv_list):
+        """
+        Unique PV names of a Pv queryset or a list of names.
+
+        Note
+        ----
+            Intended for internal use only.
+        """
         if type(pv_list) == django.db.models.query.QuerySet:
             pv_names = []
             for entry in pv_list:
@@ -122,60 +423,656 @@ class TriggerScan:
         if type(pv_list) == list:
             pv_names = pv_list
 
+        # live querysets list a PV once per trigger, only request it once
+        return list(dict.fromkeys(pv_names))
+
+    def archStream(self, pv_list, end_time=None, start_time=None,
+                   failures=None, reductions=None, lookbacks=None):
+        """
+        Pull a collection of PVs like archPull, yielding each PV's data as
+        soon as it arrives instead of collecting all of it.
+
+        Note
+        ----
+            At most max_workers requests per appliance are in flight and
+            their results waiting to be consumed, so memory use is bounded by
+            the concurrency rather than by the number of PVs as long as the
+            consumer drops each PV's data once it's done with it.
+
+        Parameters
+        ----------
+        pv_list : django.db.models.query.Queryset (Pv type) or list of strings
+
+        end_time : datetime.datetime
+            end time for the pulled data, defaults to now
+
+        start_time : datetime.datetime
+            start time for the pulled data, defaults to end_time - rep_t
+
+        failures : dict
+            If given, each PV that could not be pulled is added to it, mapped
+            to the exception raised.
+
+        reductions : dict
+            PV name mapped to the reductions its triggers need
+
+        lookbacks : dict
+            PV name mapped to how far back from end_time it is pulled
+
+        Yields
+        ------
+        tuple
+            (PV name, xarray.Dataset or PvSamples) in completion order
+        """
+        pv_names = self._pvNames(pv_list)
+        if end_time == None:
+            end_time = datetime.datetime.now()
         if start_time == None:
             start_time = end_time - self.rep_t
 
-        pv_data = {}
+        if self.deadline_fraction == None:
+            deadline = None
+        else:
+            deadline = time.monotonic() \
+                + self.rep_t.total_seconds() * self.deadline_fraction
+
+        if reductions == None:
+            reductions = {}
+        if lookbacks == None:
+            lookbacks = {}
 
-        for name in pv_names:
-            pv_data[name] = self.arch.get(
-                name,
-                xarray = True,
-                start = start_time,
-                end = end_time,
-            )
+        def fetch(name, client):
+            if name in lookbacks:
+                start = end_time - lookbacks[name]
+            else:
+                start = start_time
+            try:
+                return call_with_retries(
+                    lambda timeout: self._archGet(
+                        name, start, end_time, timeout, client,
+                        reductions.get(name)),
+                    deadline = deadline,
+                    retries = self.retries,
+                    backoff = self.backoff,
+                    breaker = client.breaker,
+                )
+            except Exception as exc:
+                logger.warning("failed to pull {}: {!r}".format(name, exc))
+                if self.router != None:
+                    self.router.invalidate(name)
+                return exc
 
-        return pv_data
-        
+        if self.router == None:
+            groups = [(self.arch, self.pool, pv_names)]
+        else:
+            if deadline == None:
+                timeout = None
+            else:
+                timeout = max(deadline - time.monotonic(), 0)
+            groups = [
+                (client, self.pools[client.hostname], names)
+                for client, names in self.router.route(pv_names, timeout)
+            ]
 
-    def compare(self, dbpv, dbtrig, archpv):
-        #examine 1 pv for violations
-        logger.debug("compare {} {}".format(str(dbpv.name),str(dbtrig.name)))
-        comparison = dbtrig.compare
-        # if the value field has been left empty
-        if comparison == None:
-            return False
-        if dbtrig.value == None:
+        def results():
+            if len(pv_names) < 2 or all(g[1] == None for g in groups):
+                for client, pool, names in groups:
+                    for name in names:
+                        yield name, fetch(name, client)
+                return
+            # future -> (PV name, index of its group)
+            pending = {}
+            queues = [collections.deque(names) for _, _, names in groups]
+
+            def submit(index):
+                client, pool, _ = groups[index]
+                name = queues[index].popleft()
+                pending[pool.submit(fetch, name, client)] = (name, index)
+
+            for index, queue in enumerate(queues):
+                for _ in range(min(self.max_workers, len(queue))):
+                    submit(index)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, index = pending.pop(future)
+                    if queues[index]:
+                        submit(index)
+                    yield name, future.result()
+
+        for name, result in results():
+            if isinstance(result, Exception):
+                if failures != None:
+                    failures[name] = result
+            else:
+                yield name, result
+
+    def _archGet(self, name, start_time, end_time, timeout=None,
+                 client=None, needs=None):
+        """
+        Pull a single PV in the layout set by the fetch_format and the
+        incremental option.
+
+        Parameters
+        ----------
+        name : str
+            name of the PV
+
+        start_time : datetime.datetime
+            start time for the pulled data
+
+        end_time : datetime.datetime
+            end time for the pulled data
+
+        timeout : float
+            seconds to wait for the archiver
+
+        client : archiver_client.ArchiverClient
+            appliance to pull from, defaults to the primary one
+
+        needs : set
+            reductions the PV's triggers need, None if unknown
+
+        Returns
+        -------
+        xarray.Dataset or PvSamples
+
+        Note
+        ----
+            Intended for internal use only.
+        """
+        if client == None:
+            client = self.arch
+        if self.cache != None:
+            return self._archGetCached(
+                name, start_time, end_time, timeout, client)
+        if self._binnable(needs, start_time, end_time):
+            samples = self._archGetBinned(
+                name, start_time, end_time, needs, timeout, client)
+            if client.fetch_format == "pb":
+                return samples
+            return arrays_to_xarray(name, *samples)
+        if self.store != None or self.chunk_samples != None:
+            samples = self._archFetch(
+                name, start_time, end_time, timeout, client)
+            if client.fetch_format == "pb":
+                return samples
+            return arrays_to_xarray(name, *samples)
+        if client.fetch_format == "pb":
+            return client.get_arrays(name, start_time, end_time, timeout)
+        return client.get(
+            name,
+            xarray = True,
+            start = start_time,
+            end = end_time,
+            timeout = timeout,
+        )
+
+    def _archGetCached(self, name, start_time, end_time, timeout=None,
+                       client=None):
+        """
+        Pull a single PV through the sample cache. Only the samples after the
+        previous pull's end time, less incremental_overlap, are requested from
+        the archiver; the whole window is then served from the PV's
+        RingBuffer.
+
+        Parameters
+        ----------
+        name : str
+            name of the PV
+
+        start_time : datetime.datetime
+            start time for the window
+
+        end_time : datetime.datetime
+            end time for the window
+
+        timeout : float
+            seconds to wait for the archiver
+
+        client : archiver_client.ArchiverClient
+            appliance to pull from, defaults to the primary one
+
+        Returns
+        -------
+        xarray.Dataset or PvSamples
+
+        Note
+        ----
+            Intended for internal use only.
+        """
+        if client == None:
+            client = self.arch
+        buf = self.cache.buffer(name)
+        start_ns = epoch_ns(start_time)
+        end_ns = epoch_ns(end_time)
+        if buf.fetched_until == None \
+                or start_ns < buf.fetched_from \
+                or end_ns < buf.fetched_until:
+            # window isn't an extension of what's cached, start over
+            buf.reset()
+            buf.fetched_from = start_ns
+            fetch_start = start_time
+        else:
+            # the archiver writes with a delay, ask for the end of the
+            # previous pull again and merge what came in late
+            fetch_start = from_epoch_ns(max(buf.fetched_until
+                - int(self.incremental_overlap * 1e9), buf.fetched_from))
+
+        buf.extend(*self._archFetch(
+            name, fetch_start, end_time, timeout, client))
+        buf.fetched_until = end_ns
+        buf.evict(start_ns)
+        window = buf.window(start_ns, end_ns)
+        if client.fetch_format == "pb":
+            return PvSamples(*window)
+        return arrays_to_xarray(name, *window)
+
+    def _binnable(self, needs, start_time, end_time):
+        """
+        Decide whether a window can be pulled binned.
+
+        Note
+        ----
+            Intended for internal use only.
+        """
+        if self.bin_size == None or not needs or 'raw' in needs:
             return False
-        status = False
-        if comparison == "==":
-            filtered_xarray = dbtrig.value == archpv[dbpv.name].sel(field='vals')
-            if filtered_xarray.any():
-                status = True
-        elif comparison == "<=":
-            minimum = archpv[dbpv.name].sel(field='vals').min().item(0)
-            if minimum <= dbtrig.value:
-                status = True
-        elif comparison == ">=":
-            maximum = archpv[dbpv.name].sel(field='vals').max().item(0)
-            if maximum >= dbtrig.value:
-                status = True
-        elif comparison == "<":
-            minimum = archpv[dbpv.name].sel(field='vals').min().item(0)
-            if minimum < dbtrig.value:
-                status = True
-        elif comparison == ">":
-            maximum = archpv[dbpv.name].sel(field='vals').max().item(0)
-            if maximum > dbtrig.value:
-                status = True
-        elif comparison == "!=":
-            filtered_xarray = dbtrig.value != archpv[dbpv.name].sel(field='vals')
-            if filtered_xarray.any():
-                status = True
+        bin_ns = int(self.bin_size) * 1000000000
+        first = -(-epoch_ns(start_time) // bin_ns) * bin_ns
+        last = epoch_ns(end_time) // bin_ns * bin_ns
+        return last - first >= self.min_bins * bin_ns
+
+    def _archGetBinned(self, name, start_time, end_time, needs, timeout=None,
+                       client=None):
+        """
+        Pull a window as raw samples for the partial bins at its edges and
+        one post-processed value per whole bin in between.
+
+        Parameters
+        ----------
+        name : str
+            name of the PV
+
+        start_time : datetime.datetime
+            start time for the window
+
+        end_time : datetime.datetime
+            end time for the window
+
+        needs : set
+            reductions to request, 'min' and/or 'max'
+
+        timeout : float
+            seconds to wait for each archiver request
+
+        client : archiver_client.ArchiverClient
+            appliance to pull from, defaults to the primary one
+
+        Returns
+        -------
+        PvSamples
+            time ordered; a bin reduced both ways appears twice
+
+        Note
+        ----
+            Intended for internal use only.
+        """
+        if client == None:
+            client = self.arch
+        bin_ns = int(self.bin_size) * 1000000000
+        first = from_epoch_ns(-(-epoch_ns(start_time) // bin_ns) * bin_ns)
+        last = from_epoch_ns(epoch_ns(end_time) // bin_ns * bin_ns)
+        chunks = [
+            client.get_arrays(name, start_time, first, timeout),
+            client.get_arrays(name, last, end_time, timeout),
+        ]
+        for operator in sorted(needs):
+            chunks.append(client.get_binned(
+                name, operator, self.bin_size, first, last, timeout))
+        times = np.concatenate([c[0] for c in chunks])
+        vals = np.concatenate([c[1] for c in chunks])
+        order = np.argsort(times, kind='stable')
+        return PvSamples(times[order], vals[order])
+
+    def _archFetch(self, name, start_time, end_time, timeout=None,
+                   client=None):
+        """
+        Request a PV's samples as arrays, going through the segment store
+        when there is one and splitting long ranges into chunks. Only the
+        gaps between stored segments are requested from the archiver and the
+        fetched samples are stored.
+
+        Parameters
+        ----------
+        name : str
+            name of the PV
+
+        start_time : datetime.datetime
+            start time for the pulled data
+
+        end_time : datetime.datetime
+            end time for the pulled data
+
+        timeout : float
+            seconds to wait for each archiver request
+
+        client : archiver_client.ArchiverClient
+            appliance to pull from, defaults to the primary one
+
+        Returns
+        -------
+        PvSamples
+
+        Note
+        ----
+            Intended for internal use only.
+        """
+        if client == None:
+            client = self.arch
+        if self.store == None:
+            return self._getChunked(
+                name, start_time, end_time, timeout, client)
+        start_ns = epoch_ns(start_time)
+        end_ns = epoch_ns(end_time)
+        settled = epoch_ns(datetime.datetime.now()) \
+            - int(self.segment_settle * 1e9)
+        # scans don't start exactly a scan period apart, allow for it
+        min_span = int(self.rep_t.total_seconds() * 1e9 / 2)
+        chunks = [self.store.read(name, start_ns, end_ns)]
+        for gap_start, gap_end in self.store.missing(name, start_ns, end_ns):
+            times, vals = self._getChunked(
+                name, from_epoch_ns(gap_start), from_epoch_ns(gap_end),
+                timeout, client)
+            # the segment covers the settled part of the gap, the unsettled
+            # tail is left as a gap for the next fetch. A settled part
+            # shorter than about a scan period, as left by windows no longer
+            # than the settle time, would be a sliver that saves no fetch
+            # and never touches the next segment, so it isn't written.
+            covered = min(gap_end, settled)
+            if covered - gap_start >= min_span:
+                self.store.write(name, gap_start, covered, times, vals)
+            chunks.append((times, vals))
+        return PvSamples(*sample_window(
+            *merge_samples(chunks), start_ns, end_ns))
+        
+
+    def _getChunked(self, name, start_time, end_time, timeout=None,
+                    client=None):
+        """
+        Request a PV's samples as arrays, in concurrent chunks when the
+        range is long for the PV's sample rate.
+
+        Parameters
+        ----------
+        name : str
+            name of the PV
+
+        start_time : datetime.datetime
+            start time for the pulled data
+
+        end_time : datetime.datetime
+            end time for the pulled data
+
+        timeout : float
+            seconds to wait for each archiver request
+
+        client : archiver_client.ArchiverClient
+            appliance to pull from, defaults to the primary one
+
+        Returns
+        -------
+        PvSamples
+
+        Note
+        ----
+            Intended for internal use only.
+        """
+        if client == None:
+            client = self.arch
+        if self.chunk_samples == None:
+            return client.get_arrays(name, start_time, end_time, timeout)
+        start_ns = epoch_ns(start_time)
+        end_ns = epoch_ns(end_time)
+        rate = self.sample_rates.get(name)
+        if rate:
+            chunk = max(self.chunk_samples / rate, self.min_chunk)
+        else:
+            chunk = self.initial_chunk
+        chunk_ns = max(int(chunk * 1e9), -(-(end_ns - start_ns)
+            // self.max_chunks), 1)
+        edges = list(range(start_ns, end_ns, chunk_ns)) + [end_ns]
+
+        if len(edges) <= 2:
+            samples = client.get_arrays(name, start_time, end_time, timeout)
         else:
-            logger.error("comparator not yet implemented")
-            #raise NotImplementedError
-        return status
+            futures = [
+                self.chunk_pool.submit(
+                    client.get_arrays, name, from_epoch_ns(lo),
+                    from_epoch_ns(hi), timeout)
+                for lo, hi in zip(edges[:-1], edges[1:])
+            ]
+            times = []
+            vals = []
+            for i, future in enumerate(futures):
+                chunk_times, chunk_vals = future.result()
+                if i > 0:
+                    # each chunk repeats the newest sample before its start,
+                    # the previous chunk already holds everything up to it.
+                    # Requests carry millisecond precision.
+                    edge = edges[i] // 1000000 * 1000000
+                    lo = np.searchsorted(chunk_times, edge, side='right')
+                    chunk_times = chunk_times[lo:]
+                    chunk_vals = chunk_vals[lo:]
+                times.append(chunk_times)
+                vals.append(chunk_vals)
+            samples = PvSamples(np.concatenate(times), np.concatenate(vals))
+
+        if end_ns > start_ns:
+            self.sample_rates[name] = len(samples.times) \
+                / ((end_ns - start_ns) / 1e9)
+        return samples
+
+    def pvReductions(self, table=None):
+        """
+        Work out which server side reductions can stand in for each PV's raw
+        samples given its triggers.
+
+        Parameters
+        ----------
+        table : TriggerTable
+            If given, the triggers are taken from it instead of the database.
+
+        Returns
+        -------
+        dict
+            PV name mapped to a set of 'min', 'max' and 'raw'
+        """
+        if table == None:
+            table = self.triggerTable()
+        needs = {}
+        for name, comparison, window in table.rows():
+            needs.setdefault(name, set()).add(
+                REDUCTIONS.get(comparison, 'raw'))
+        return needs
+
+    def fetchPlan(self, table=None):
+        """
+        Collect the lookback windows of all triggers.
+
+        Parameters
+        ----------
+        table : TriggerTable
+            If given, the triggers are taken from it instead of the database.
+
+        Returns
+        -------
+        FetchPlan
+        """
+        if table == None:
+            table = self.triggerTable()
+        return FetchPlan(
+            self.rep_t,
+            ((name, window) for name, comparison, window in table.rows()),
+        )
+
+    def triggerRows(self, trigger_pks=(), alert_pks=(), pv_pks=()):
+        """
+        Read triggers with a PV from the database.
+
+        Parameters
+        ----------
+        trigger_pks, alert_pks, pv_pks : collection of int
+            If any is given, only the triggers with one of these pks, alerts
+            or PVs are read. Defaults to reading them all.
+
+        Returns
+        -------
+        list of tuple
+            values of TRIGGER_FIELDS for each trigger
+        """
+        triggers = Trigger.objects.filter(pv__isnull=False)
+        if trigger_pks or alert_pks or pv_pks:
+            triggers = triggers.filter(
+                Q(pk__in=list(trigger_pks))
+                | Q(alert_id__in=list(alert_pks))
+                | Q(pv_id__in=list(pv_pks))
+            )
+        return list(triggers.values_list(*TRIGGER_FIELDS))
+
+    def triggerTable(self):
+        """
+        The configuration's triggers compiled into a TriggerTable, with the
+        statistics of any previous scan cleared.
+
+        The table comes from the in-memory ConfigSnapshot. Each call reads
+        the ConfigChange log past the snapshot's version; only the triggers
+        the new entries touch are read again, and the patched snapshot
+        replaces the old one. Threshold indexes of PVs whose triggers didn't
+        change are reused. Applied entries older than CONFIG_LOG_RETENTION
+        are then pruned from the log.
+
+        Returns
+        -------
+        TriggerTable
+        """
+        if self.snapshot == None:
+            # read the log first, a change made while the triggers are read
+            # is then applied again by the next scan
+            version = ConfigChange.latest()
+            self.snapshot = ConfigSnapshot(version, self.triggerRows())
+            logger.info("loaded {} triggers at change {}".format(
+                len(self.snapshot), version))
+        else:
+            changes = list(ConfigChange.objects.filter(
+                pk__gt=self.snapshot.version).order_by('pk').values_list(
+                'pk', 'model', 'object_id'))
+            if not changes:
+                self.snapshot.table.reset()
+                return self.snapshot.table
+            self.snapshot = self.snapshot.patched(
+                changes[-1][0],
+                [change[1:] for change in changes],
+                self.triggerRows,
+            )
+            logger.info("applied changes up to {}".format(
+                self.snapshot.version))
+            ConfigChange.prune(
+                datetime.datetime.now(datetime.timezone.utc)
+                - CONFIG_LOG_RETENTION,
+                through = self.snapshot.version,
+            )
+        table = self.snapshot.table
+        logger.debug("{} triggers share {} conditions".format(
+            len(table), table.n_conditions))
+        return table
+
+    def lastEvents(self, names, timeout=None):
+        """
+        Ask the appliances when each PV last changed.
+
+        Parameters
+        ----------
+        names : list of str
+
+        timeout : float
+            Seconds to wait for each status request.
+
+        Returns
+        -------
+        dict
+            PV name mapped to ns since the epoch or None. PVs whose appliance
+            couldn't be asked are left out.
+        """
+        if self.router != None:
+            groups = self.router.route(names, timeout)
+        else:
+            groups = [(self.arch, names)]
+        events = {}
+        for client, group in groups:
+            try:
+                events.update(client.get_last_events(group, timeout))
+            except Exception as exc:
+                logger.warning("last events unavailable from {}: {}".format(
+                    client.hostname, exc))
+        return events
+
+    def unchangedPvs(self, names, plan, table, end_time):
+        """
+        Find the PVs whose previous evaluation is still valid. A PV whose
+        last sample is older than the start of its previous window had that
+        one sample, carried forward, as its whole window then and has it
+        again now, so comparing it again can't give another result.
+        PVs with rate, hysteresis or dwell triggers are always pulled, their
+        results move on with their carry and the scan's time.
+
+        Parameters
+        ----------
+        names : list of str
+
+        plan : FetchPlan
+
+        table : TriggerTable
+            this scan's triggers
+
+        end_time : datetime.datetime
+            end of this scan's windows
+
+        Returns
+        -------
+        dict
+            PV name mapped to the pks of its previously tripped triggers
+        """
+        end_ns = epoch_ns(end_time)
+        candidates = []
+        for name in names:
+            state = self.pv_state.get(name)
+            if state == None:
+                continue
+            prev_end, lookback, signature, tripped = state
+            if table.carried(name):
+                continue
+            if prev_end > end_ns \
+                    or lookback != int(plan.lookback(name).total_seconds()
+                        * 1e9) \
+                    or signature != table.signature(name):
+                continue
+            candidates.append(name)
+        if not candidates:
+            return {}
+        if self.deadline_fraction != None:
+            timeout = self.rep_t.total_seconds() * self.deadline_fraction
+        else:
+            timeout = None
+        unchanged = {}
+        for name, event in self.lastEvents(candidates, timeout).items():
+            prev_end, lookback, signature, tripped = self.pv_state[name]
+            # lastEvent only has whole seconds, the sample can be anywhere in
+            # the second after it
+            if event != None \
+                    and event + STATUS_RESOLUTION <= prev_end - lookback:
+                unchanged[name] = tripped
+        return unchanged
 
     def utc_to_local(self,utc_dt):
         """
@@ -203,31 +1100,99 @@ class TriggerScan:
 
         Returns
         -------
-        None 
+        ScanResult
+            The tripped triggers and the PVs that could not be pulled. Failed
+            PVs are skipped, the remaining ones are still evaluated.
         """
         if target_time == None:
             target_time = datetime.datetime.now()
 
-        pv_qset = self.dbPvPull()
-        arch_data = self.archPull(pv_qset, target_time)
-        
+        # the PVs, their reductions and windows all come from the trigger
+        # table, which is only read from the database after a change
+        table = self.triggerTable()
+        pv_names = table.pv_names()
+        failed = {}
+        if self.bin_size != None:
+            reductions = self.pvReductions(table)
+        else:
+            reductions = None
+
+        # each PV is pulled once over the longest of its triggers' windows
+        plan = self.fetchPlan(table)
+        lookbacks = plan.lookbacks()
+
+        # every trigger is resolved in one pass once all PVs are reduced
         tripped_trigger_pk = set()
 
+        if self.skip_unchanged:
+            unchanged = self.unchangedPvs(pv_names, plan, table, target_time)
+            logger.debug("{} PVs unchanged".format(len(unchanged)))
+            for tripped in unchanged.values():
+                tripped_trigger_pk.update(tripped)
+            pv_names = [name for name in pv_names if name not in unchanged]
+
+        if self.window_states != None:
+            for key in set(self.window_states) - set(table.views):
+                del self.window_states[key]
+
+        def states(name):
+            # binned data is re-binned every scan, it can't be folded
+            if self.window_states == None or (reductions != None
+                    and 'raw' not in reductions.get(name, ('raw',))):
+                return None
+            return self.window_states
+
         # loop through all PVs
         logger.debug("scanning triggers")
-        for pv in pv_qset:
-            trigger_set = pv.trigger_set.all()
-            # all triggers must be compared - ensures all triggers visited once
-            for trigger in trigger_set:
-                if(self.compare(pv,trigger,arch_data[pv.name])):
-                    logger.debug("TRIPPED")
-                    tripped_trigger_pk.add(trigger.pk)
-
-        tripped_triggers = Trigger.objects.filter(pk__in=tripped_trigger_pk)
-        tripped_alerts = Alert.objects.filter(trigger__in=tripped_triggers)
-        tripped_alerts = tripped_alerts.distinct()
+        pulled = []
+        if self.streaming:
+            # reduce each PV as soon as it arrives and let its data go
+            for name, data in self.archStream(pv_names, target_time,
+                    failures=failed, reductions=reductions,
+                    lookbacks=lookbacks):
+                table.reduce(name, data, plan, target_time, states(name))
+                pulled.append(name)
+        else:
+            arch_data = self.archPull(pv_names, target_time, failures=failed,
+                reductions=reductions, lookbacks=lookbacks)
+            for name, data in arch_data.items():
+                table.reduce(name, data, plan, target_time, states(name))
+                pulled.append(name)
+        if failed:
+            logger.warning("{} PVs could not be pulled".format(len(failed)))
+        mask = table.evaluate()
+        tripped_trigger_pk.update(table.tripped(mask))
+        if self.skip_unchanged:
+            end_ns = epoch_ns(target_time)
+            for name in pulled:
+                self.pv_state[name] = (
+                    end_ns,
+                    int(plan.lookback(name).total_seconds() * 1e9),
+                    table.signature(name),
+                    table.tripped(mask, name),
+                )
+            for name in failed:
+                self.pv_state.pop(name, None)
+
+        # subscribers and tripped triggers come with the alerts in two
+        # prefetch queries and all last_sent stamps are set in one update
+        tripped_alerts = Alert.objects.filter(
+            pk__in=table.alerts(tripped_trigger_pk)
+        ).prefetch_related(
+            Prefetch(
+                'subscriber',
+                queryset = Profile.objects.select_related('user'),
+            ),
+            Prefetch(
+                'trigger_set',
+                queryset = Trigger.objects.filter(
+                    pk__in=tripped_trigger_pk).order_by('pk'),
+                to_attr = 'tripped_triggers',
+            ),
+        )
         #print(tripped_alerts)
 
+        sent = []
         for alert in tripped_alerts:
             #print(alert.last_sent)
             #print(target_time)
@@ -238,11 +1203,8 @@ class TriggerScan:
                         < alert.lockout_duration:
                     logging.debug("lockout duration stil in effect")
                     continue
-            specific_triggers = alert.trigger_set.filter(
-                pk__in=tripped_trigger_pk
-            )
             trigger_string = ""
-            for x in specific_triggers:
+            for x in alert.tripped_triggers:
                 trigger_string = trigger_string + "\t" + str(x.name) + "\n"
             trigger_string = "triggers Tripped:\n" + trigger_string
             recipients = []
@@ -250,8 +1212,11 @@ class TriggerScan:
                 recipients.append(prof.user.email)
             #print(recipients)
             self.emailer.send_text(recipients,'test',trigger_string)
-            alert.last_sent = target_time
-            alert.save()
+            sent.append(alert.pk)
+        if sent:
+            Alert.objects.filter(pk__in=sent).update(last_sent=target_time)
+
+        return ScanResult(target_time, tripped_trigger_pk, failed)
 
 
 
@@ -0,0 +1,196 @@
+"""
+Deadlines, retries and circuit breaking for archiver requests. These keep a
+slow or failing appliance from stalling a whole scan.
+"""
+
+############
+# Standard #
+############
+import logging
+import random
+import threading
+import time
+
+###############
+# Third Party #
+###############
+import requests
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a request could not complete before its deadline.
+    """
+    pass
+
+
+class CircuitOpen(Exception):
+    """
+    Raised instead of contacting an appliance whose circuit breaker is open.
+    """
+    pass
+
+
+def retriable(exc):
+    """
+    Decide whether a failed request is worth repeating. Connection problems,
+    timeouts and server side (5xx) errors are; client errors are not.
+
+    Parameters
+    ----------
+    exc : Exception
+
+    Returns
+    -------
+    bool
+    """
+    if isinstance(exc, requests.HTTPError):
+        response = exc.response
+        return response is None or response.status_code >= 500
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures of one appliance. After failure_threshold
+    failures in a row the circuit opens and requests fail immediately. Once
+    reset_timeout seconds have passed a single trial request is let through;
+    its success closes the circuit again.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        Parameters
+        ----------
+        failure_threshold : int
+            consecutive failures before the circuit opens
+
+        reset_timeout : float
+            seconds the circuit stays open before a trial request
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """
+        One of 'closed', 'open' or 'half-open'.
+        """
+        if self.opened_at == None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """
+        Decide whether a request may be sent now.
+
+        Returns
+        -------
+        bool
+        """
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures = self.failures + 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at == None:
+                    logger.warning("circuit opened after {} failures".format(
+                        self.failures))
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+def call_with_retries(func, deadline=None, retries=0, backoff=0.5,
+                      breaker=None):
+    """
+    Call func until it succeeds, it fails with a non-retriable error, the
+    retries are used up or the deadline passes.
+
+    Parameters
+    ----------
+    func : callable
+        Called with the number of seconds left before the deadline (None if
+        there is no deadline), to be used as the request's timeout.
+
+    deadline : float
+        Absolute time.monotonic() value by which the call must finish.
+        Defaults to None, meaning no deadline.
+
+    retries : int
+        Number of additional attempts after the first failure.
+
+    backoff : float
+        Seconds waited before the first retry, doubled (with jitter) for each
+        subsequent one.
+
+    breaker : CircuitBreaker
+        Breaker of the appliance being contacted. Defaults to None.
+
+    Returns
+    -------
+    The return value of func.
+
+    Raises
+    ------
+    DeadlineExceeded
+        If the deadline passes before an attempt succeeds.
+
+    CircuitOpen
+        If the breaker refuses the request.
+    """
+    attempt = 0
+    while True:
+        if deadline != None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded("deadline passed before the request")
+        else:
+            remaining = None
+        if breaker != None and not breaker.allow():
+            raise CircuitOpen("appliance circuit is open")
+        try:
+            result = func(remaining)
+        except Exception as exc:
+            if breaker != None:
+                if retriable(exc):
+                    breaker.record_failure()
+                else:
+                    # the appliance answered a bad request, it isn't down
+                    breaker.record_success()
+            if not retriable(exc) or attempt >= retries:
+                raise
+            delay = backoff * (2 ** attempt) * random.uniform(.5, 1.5)
+            if deadline != None and time.monotonic() + delay >= deadline:
+                raise DeadlineExceeded(
+                    "no time left to retry after: {}".format(exc))
+            logger.debug("retrying in {:.3f}s after: {}".format(delay, exc))
+            time.sleep(delay)
+            attempt = attempt + 1
+        else:
+            if breaker != None:
+                breaker.record_success()
+            return result
@@ -0,0 +1,230 @@
+"""
+In-memory cache of recently fetched PV samples. Each PV is held in a
+RingBuffer so that consecutive scans only request the samples that arrived
+since the last fetch.
+"""
+
+############
+# Standard #
+############
+import logging
+import threading
+
+###############
+# Third Party #
+###############
+import numpy as np
+
+##########
+# Custom #
+##########
+from .segment_store import merge_samples
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """
+    Time ordered store of a single PV's samples backed by preallocated NumPy
+    arrays.
+
+    Every sample is written twice, at i and i + capacity, so the stored
+    samples are always available as one contiguous slice. Windows are handed
+    out as views of the arrays and are never copied.
+
+    Attributes
+    ----------
+    times : numpy.ndarray (int64)
+        Sample timestamps in nanoseconds since the epoch.
+
+    vals : numpy.ndarray (float64)
+        Sample values.
+
+    fetched_from : int or None
+        Earliest time (ns) the buffer is known to cover.
+
+    fetched_until : int or None
+        Time (ns) up to which the archiver has already been asked for data.
+    """
+    def __init__(self, capacity=4096):
+        """
+        Parameters
+        ----------
+        capacity : int
+            Number of samples allocated up front. The buffer grows if a
+            window ever needs more.
+        """
+        self.capacity = max(int(capacity), 1)
+        self.times = np.empty(2 * self.capacity, dtype=np.int64)
+        self.vals = np.empty(2 * self.capacity, dtype=np.float64)
+        self.head = 0
+        self.count = 0
+        self.fetched_from = None
+        self.fetched_until = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def last_time(self):
+        """
+        Timestamp (ns) of the newest stored sample, None if empty.
+        """
+        if self.count == 0:
+            return None
+        return self.times[self.head + self.count - 1]
+
+    def reset(self):
+        """
+        Forget every stored sample and the fetched range.
+        """
+        self.head = 0
+        self.count = 0
+        self.fetched_from = None
+        self.fetched_until = None
+
+    def _grow(self, needed):
+        """
+        Reallocate the arrays to hold at least needed samples.
+
+        Note
+        ----
+            Intended for internal use only.
+        """
+        capacity = self.capacity
+        while capacity < needed:
+            capacity = capacity * 2
+        times = np.empty(2 * capacity, dtype=np.int64)
+        vals = np.empty(2 * capacity, dtype=np.float64)
+        times[:self.count] = self.times[self.head:self.head + self.count]
+        vals[:self.count] = self.vals[self.head:self.head + self.count]
+        times[capacity:capacity + self.count] = times[:self.count]
+        vals[capacity:capacity + self.count] = vals[:self.count]
+        logger.debug("ring buffer grown from {} to {}".format(
+            self.capacity, capacity))
+        self.times = times
+        self.vals = vals
+        self.capacity = capacity
+        self.head = 0
+
+    def evict(self, cutoff):
+        """
+        Drop samples older than cutoff, keeping the newest sample at or before
+        it so the value at the start of a window is still known.
+
+        Parameters
+        ----------
+        cutoff : int
+            Time in ns since the epoch.
+        """
+        times = self.times[self.head:self.head + self.count]
+        drop = max(np.searchsorted(times, cutoff, side='right') - 1, 0)
+        self.head = (self.head + drop) % self.capacity
+        self.count = self.count - drop
+        if self.fetched_from != None:
+            self.fetched_from = max(self.fetched_from, cutoff)
+
+    def extend(self, times, vals):
+        """
+        Add samples to the buffer. Samples overlapping the stored ones are
+        merged in by timestamp, so overlapping archiver responses can be
+        passed in whole and samples the archiver wrote late are kept.
+
+        Parameters
+        ----------
+        times : numpy.ndarray
+            Sample timestamps (ns since the epoch) in ascending order.
+
+        vals : numpy.ndarray
+            Sample values matching times.
+        """
+        if self.count and len(times) and times[0] <= self.last_time:
+            # rewrite the stored samples from the first new one on
+            stored = self.times[self.head:self.head + self.count]
+            keep = np.searchsorted(stored, times[0], side='left')
+            times, vals = merge_samples([
+                (times, vals),
+                (stored[keep:],
+                 self.vals[self.head + keep:self.head + self.count]),
+            ])
+            self.count = keep
+        added = len(times)
+        if added == 0:
+            return
+        if self.count + added > self.capacity:
+            self._grow(self.count + added)
+        # write each sample into both halves, splitting where the ring wraps
+        start = (self.head + self.count) % self.capacity
+        first = min(added, self.capacity - start)
+        for offset in (0, self.capacity):
+            self.times[offset + start:offset + start + first] = times[:first]
+            self.vals[offset + start:offset + start + first] = vals[:first]
+            self.times[offset:offset + added - first] = times[first:]
+            self.vals[offset:offset + added - first] = vals[first:]
+        self.count = self.count + added
+
+    def window(self, start, end):
+        """
+        View of the samples covering [start, end]. Like the archiver, the
+        newest sample at or before start is included.
+
+        Parameters
+        ----------
+        start : int
+            Time in ns since the epoch.
+
+        end : int
+            Time in ns since the epoch.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            (times, vals) views into the buffer
+        """
+        times = self.times[self.head:self.head + self.count]
+        lo = max(np.searchsorted(times, start, side='right') - 1, 0)
+        hi = np.searchsorted(times, end, side='right')
+        return times[lo:hi], self.vals[self.head + lo:self.head + hi]
+
+
+class SampleCache:
+    """
+    Collection of per-PV RingBuffers shared by TriggerScan's worker threads.
+    """
+    def __init__(self, capacity=4096):
+        """
+        Parameters
+        ----------
+        capacity : int
+            Initial number of samples allocated for each PV.
+        """
+        self.capacity = capacity
+        self.buffers = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, pv):
+        return pv in self.buffers
+
+    def buffer(self, pv):
+        """
+        Return the RingBuffer for a PV, creating it on first use.
+
+        Parameters
+        ----------
+        pv : str
+            name of the PV
+        """
+        with self._lock:
+            if pv not in self.buffers:
+                self.buffers[pv] = RingBuffer(self.capacity)
+            return self.buffers[pv]
+
+    def discard(self, pv):
+        """
+        Stop caching a PV.
+        """
+        with self._lock:
+            self.buffers.pop(pv, None)
@@ -0,0 +1,231 @@
+"""
+Replay harness driving TriggerScan.scanTask against a local SimArchiver.
+A throwaway test database is filled with a synthetic configuration so that
+production sized scans (thousands of PVs) can be reproduced and timed offline.
+
+    python -m engine_tools.scan_replay --pvs 2000 --latency .05 --workers 32
+"""
+
+############
+# Standard #
+############
+import logging
+import argparse
+import datetime
+import time
+
+###############
+# Third Party #
+###############
+
+##########
+# Custom #
+##########
+from . import record_scanner
+from .archiver_sim import SimArchiver, SimServer
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+from django.db import connection
+from alert_config_app.models import Alert, Pv, Trigger
+from django.contrib.auth.models import User
+
+
+class RecordingEmailer:
+    """
+    Replaces EmailWrapper during replays, keeping the messages instead of
+    sending them.
+    """
+    def __init__(self):
+        self.sent = []
+
+    def send_text(self, to, subj, content):
+        self.sent.append((to, subj, content))
+
+
+def create_db():
+    """
+    Create and migrate a test database, leaving the configured one untouched.
+
+    Returns
+    -------
+    str
+        name of the original database, to be passed to destroy_db
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    return old_name
+
+
+def destroy_db(old_name):
+    """
+    Remove the database made by create_db.
+    """
+    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def populate(pv_count, triggers_per_pv=1, pvs_per_alert=10, prefix="SIM:PV"):
+    """
+    Fill the database with a synthetic configuration.
+
+    Parameters
+    ----------
+    pv_count : int
+        number of PVs to create
+
+    triggers_per_pv : int
+        number of triggers attached to each PV
+
+    pvs_per_alert : int
+        number of PVs grouped under each alert
+
+    prefix : str
+        PV names are prefix followed by an index
+
+    Returns
+    -------
+    list of str
+        names of the created PVs
+    """
+    user = User.objects.create_user("replay", email="replay@localhost")
+    comparisons = [x[0] for x in Trigger.compare_choices]
+    Pv.objects.bulk_create(
+        [Pv(name="{}:{}".format(prefix, i)) for i in range(pv_count)]
+    )
+    pvs = list(Pv.objects.order_by('pk'))
+    triggers = []
+    alert = None
+    for i, pv in enumerate(pvs):
+        if i % pvs_per_alert == 0:
+            alert = Alert.objects.create(
+                name = "replay alert {}".format(i // pvs_per_alert),
+                lockout_duration = datetime.timedelta(),
+            )
+            alert.subscriber.add(user.profile)
+        for j in range(triggers_per_pv):
+            triggers.append(Trigger(
+                name = "{} trigger {}".format(pv.name, j),
+                alert = alert,
+                pv = pv,
+                compare = comparisons[(i + j) % len(comparisons)],
+                value = (i * 7 + j * 13) % 100,
+            ))
+    Trigger.objects.bulk_create(triggers)
+    return [pv.name for pv in pvs]
+
+
+def replay(scanner, scans=1, start=None):
+    """
+    Run consecutive scans on a simulated clock and time each one.
+
+    Parameters
+    ----------
+    scanner : record_scanner.TriggerScan
+        scanner pointed at a SimServer
+
+    scans : int
+        number of scan periods to run
+
+    start : datetime.datetime
+        target time of the first scan, defaults to now
+
+    Returns
+    -------
+    list of dict
+        per scan timings in seconds with keys 'fetch', 'evaluate' and 'total'
+    """
+    if start == None:
+        start = datetime.datetime.now()
+
+    fetch_times = []
+    arch_pull = scanner.archPull
+
+    def timed_pull(*args, **kwargs):
+        t0 = time.perf_counter()
+        result = arch_pull(*args, **kwargs)
+        fetch_times.append(time.perf_counter() - t0)
+        return result
+
+    scanner.archPull = timed_pull
+    timings = []
+    try:
+        for i in range(scans):
+            del fetch_times[:]
+            t0 = time.perf_counter()
+            scanner.scanTask(start + i * scanner.rep_t)
+            total = time.perf_counter() - t0
+            fetch = sum(fetch_times)
+            timings.append({
+                'fetch': fetch,
+                'evaluate': total - fetch,
+                'total': total,
+            })
+    finally:
+        scanner.archPull = arch_pull
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pvs", type=int, default=1000)
+    parser.add_argument("--triggers-per-pv", type=int, default=1)
+    parser.add_argument("--scans", type=int, default=3)
+    parser.add_argument("--period", type=float, default=60.0,
+        help="scan period in seconds")
+    parser.add_argument("--sample-period", type=float, default=1.0,
+        help="seconds between synthesized samples")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--streaming", action="store_true",
+        help="evaluate PVs as they arrive, fetch time is then part of eval")
+    parser.add_argument("--fetch-format", default="json",
+        choices=["json", "pb"])
+    parser.add_argument("--recording", default=None)
+    args = parser.parse_args()
+
+    sim = SimArchiver(
+        latency = args.latency,
+        jitter = args.jitter,
+        error_rate = args.error_rate,
+        period = args.sample_period,
+        seed = 0,
+    )
+    if args.recording:
+        sim.load_recording(args.recording)
+
+    old_name = create_db()
+    try:
+        populate(args.pvs, args.triggers_per_pv)
+        with SimServer(sim) as server:
+            scanner = record_scanner.TriggerScan(
+                server.host,
+                datetime.timedelta(seconds=args.period),
+                data_port = server.port,
+                max_workers = args.workers,
+                incremental = args.incremental,
+                fetch_format = args.fetch_format,
+                streaming = args.streaming,
+            )
+            scanner.emailer = RecordingEmailer()
+            timings = replay(scanner, args.scans)
+    finally:
+        destroy_db(old_name)
+
+    print("{:>5} {:>10} {:>10} {:>10}".format(
+        "scan", "fetch[s]", "eval[s]", "total[s]"))
+    for i, t in enumerate(timings):
+        print("{:>5} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+            i, t['fetch'], t['evaluate'], t['total']))
+    print("archiver requests: {}, emails: {}".format(
+        sim.request_count, len(scanner.emailer.sent)))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,287 @@
+"""
+On-disk cache of PV samples fetched from the archiver. Every fetch is kept as
+a segment file holding the samples of one PV over the time range the fetch
+covered, so a restarted engine or a long lookback only has to request the
+gaps between segments it already has.
+
+Segments are .npy files of (time, val) records, loaded memory-mapped. They
+are laid out as::
+
+    root/<quoted PV name>/<covered from ns>_<covered until ns>.npy
+"""
+
+############
+# Standard #
+############
+import logging
+import os
+import threading
+import time
+from urllib.parse import quote
+
+###############
+# Third Party #
+###############
+import numpy as np
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+SEGMENT_DTYPE = np.dtype([('time', '<i8'), ('val', '<f8')])
+
+
+def merge_samples(chunks):
+    """
+    Combine sample arrays into one time ordered set without duplicates.
+
+    Parameters
+    ----------
+    chunks : list of tuple
+        (times, vals) pairs
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        (times, vals)
+    """
+    chunks = [c for c in chunks if len(c[0])]
+    if not chunks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    times = np.concatenate([c[0] for c in chunks])
+    vals = np.concatenate([c[1] for c in chunks])
+    times, index = np.unique(times, return_index=True)
+    return times, vals[index]
+
+
+def window(times, vals, start, end):
+    """
+    Slice time ordered samples to [start, end]. Like the archiver, the
+    newest sample at or before start is included.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        (times, vals)
+    """
+    lo = max(np.searchsorted(times, start, side='right') - 1, 0)
+    hi = np.searchsorted(times, end, side='right')
+    return times[lo:hi], vals[lo:hi]
+
+
+class SegmentStore:
+    """
+    Directory of per-PV sample segments.
+
+    Attributes
+    ----------
+    root : str
+        Directory holding the segments.
+
+    max_segments : int
+        Once a PV has more segments than this, touching segments are merged
+        into one file.
+
+    retention : float or None
+        Segments ending more than this many seconds ago are deleted. None
+        keeps everything.
+    """
+    def __init__(self, root, max_segments=8, retention=None):
+        self.root = root
+        self.max_segments = max_segments
+        self.retention = retention
+        # PV name -> sorted list of (covered from, covered until)
+        self.index = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _pv_dir(self, name):
+        """
+        Note
+        ----
+            Intended for internal use only.
+        """
+        return os.path.join(self.root, quote(name, safe=""))
+
+    def _path(self, name, span):
+        """
+        Note
+        ----
+            Intended for internal use only.
+        """
+        return os.path.join(self._pv_dir(name), "{}_{}.npy".format(*span))
+
+    def segments(self, name):
+        """
+        Time ranges covered by a PV's segments.
+
+        Returns
+        -------
+        list of tuple
+            sorted (covered from, covered until) pairs in ns since the epoch
+        """
+        with self._lock:
+            if name not in self.index:
+                spans = []
+                pv_dir = self._pv_dir(name)
+                if os.path.isdir(pv_dir):
+                    for entry in os.listdir(pv_dir):
+                        if not entry.endswith(".npy"):
+                            continue
+                        start, end = entry[:-4].split("_")
+                        spans.append((int(start), int(end)))
+                self.index[name] = sorted(spans)
+            return list(self.index[name])
+
+    def missing(self, name, start, end):
+        """
+        Parts of [start, end] not covered by any segment.
+
+        Parameters
+        ----------
+        name : str
+
+        start : int
+            ns since the epoch
+
+        end : int
+            ns since the epoch
+
+        Returns
+        -------
+        list of tuple
+            (start, end) of each gap, in order
+        """
+        gaps = []
+        cursor = start
+        for seg_start, seg_end in self.segments(name):
+            if seg_end < cursor:
+                continue
+            if seg_start > end:
+                break
+            if seg_start > cursor:
+                gaps.append((cursor, seg_start))
+            cursor = max(cursor, seg_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def _load(self, name, span):
+        """
+        Note
+        ----
+            Intended for internal use only.
+        """
+        data = np.load(self._path(name, span), mmap_mode='r')
+        return data['time'], data['val']
+
+    def read(self, name, start, end):
+        """
+        Samples of a PV in [start, end] plus the newest one before start,
+        taken from the segments overlapping the window.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            (times, vals)
+        """
+        chunks = [
+            self._load(name, span) for span in self.segments(name)
+            if span[1] >= start and span[0] <= end
+        ]
+        return window(*merge_samples(chunks), start, end)
+
+    def write(self, name, start, end, times, vals):
+        """
+        Store a fetch's samples as a new segment.
+
+        Parameters
+        ----------
+        name : str
+
+        start : int
+            ns since the epoch from which the samples are complete
+
+        end : int
+            ns since the epoch up to which the samples are complete
+
+        times : numpy.ndarray (int64)
+
+        vals : numpy.ndarray (float64)
+        """
+        if end < start:
+            return
+        os.makedirs(self._pv_dir(name), exist_ok=True)
+        self._save(name, (start, end), times, vals)
+        self.segments(name)
+        with self._lock:
+            self.index[name] = sorted(set(self.index[name] + [(start, end)]))
+            count = len(self.index[name])
+        if self.retention != None:
+            self.prune(name, int((time.time() - self.retention) * 1e9))
+        if count > self.max_segments:
+            self.compact(name)
+
+    def _save(self, name, span, times, vals):
+        """
+        Write a segment file atomically.
+
+        Note
+        ----
+            Intended for internal use only.
+        """
+        records = np.empty(len(times), dtype=SEGMENT_DTYPE)
+        records['time'] = times
+        records['val'] = vals
+        path = self._path(name, span)
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as fp:
+            np.save(fp, records)
+        os.replace(tmp, path)
+
+    def _remove(self, name, spans):
+        """
+        Note
+        ----
+            Intended for internal use only.
+        """
+        with self._lock:
+            self.index[name] = [
+                s for s in self.index.get(name, []) if s not in spans
+            ]
+        for span in spans:
+            try:
+                os.remove(self._path(name, span))
+            except FileNotFoundError:
+                pass
+
+    def prune(self, name, cutoff):
+        """
+        Delete a PV's segments that end before cutoff (ns since the epoch).
+        """
+        old = [span for span in self.segments(name) if span[1] < cutoff]
+        if old:
+            self._remove(name, old)
+
+    def compact(self, name):
+        """
+        Merge each run of overlapping or touching segments of a PV into a
+        single segment.
+        """
+        runs = []
+        for span in self.segments(name):
+            if runs and span[0] <= runs[-1][-1][1]:
+                runs[-1].append(span)
+            else:
+                runs.append([span])
+        for run in runs:
+            if len(run) < 2:
+                continue
+            merged = (run[0][0], max(span[1] for span in run))
+            times, vals = merge_samples([self._load(name, s) for s in run])
+            self._save(name, merged, times, vals)
+            self._remove(name, [s for s in run if s != merged])
+            with self._lock:
+                self.index[name] = sorted(set(self.index[name] + [merged]))
+        logger.debug("compacted {} into {} segments".format(name, len(runs)))
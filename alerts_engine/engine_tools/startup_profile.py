@@ -0,0 +1,113 @@
+"""
+Compare the cost of setting Django up with the web interface's settings and
+with the engine's own. Each settings module is loaded in a fresh interpreter
+that then imports the models and runs a batch of queries against an
+in-memory database, reporting the time taken, the peak memory and how many
+queries Django kept in connection.queries.
+
+    python -m engine_tools.startup_profile --queries 10000
+"""
+
+############
+# Standard #
+############
+import logging
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+##########
+# Custom #
+##########
+from . import django_connect
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+# run in the child interpreter, from a scratch directory so any files the
+# settings make at import are left there
+CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, {engine_dir!r})
+start = time.perf_counter()
+from engine_tools import django_connect
+django_connect.prepare({settings!r})
+from alert_config_app.models import Trigger
+setup = time.perf_counter() - start
+from django.apps import apps
+from django.conf import settings
+# leave the configured database alone, nothing has connected to it yet
+settings.DATABASES['default']['NAME'] = ':memory:'
+from django.db import connection
+start = time.perf_counter()
+for i in range({queries}):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT %s", [i])
+queried = time.perf_counter() - start
+print(json.dumps({{
+    'setup': setup,
+    'queries': queried,
+    'kept': len(connection.queries),
+    'apps': len(apps.get_app_configs()),
+    'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}}))
+"""
+
+
+def profile(settings, queries=1000):
+    """
+    Measure one settings module in a fresh interpreter.
+
+    Parameters
+    ----------
+    settings : str
+        dotted path of the settings module
+
+    queries : int
+        number of queries run after the setup
+
+    Returns
+    -------
+    dict
+        'setup' and 'queries' seconds, 'kept' queries, number of 'apps',
+        'maxrss_kb' and the 'files' the settings left behind
+    """
+    engine_dir = os.path.abspath(os.path.join(
+        os.path.dirname(__file__), os.pardir))
+    code = CHILD.format(
+        engine_dir = engine_dir,
+        settings = settings,
+        queries = queries,
+    )
+    with tempfile.TemporaryDirectory() as scratch:
+        output = subprocess.check_output(
+            [sys.executable, "-c", code],
+            cwd = scratch,
+        )
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        result['files'] = sorted(os.listdir(scratch))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+    for settings in (django_connect.WEB_SETTINGS,
+                     django_connect.ENGINE_SETTINGS):
+        result = profile(settings, args.queries)
+        print("{:32} setup {:6.3f} s  {} queries {:6.3f} s  kept {:6}  "
+              "apps {:2}  maxrss {:7} kB  files {}".format(
+                  settings, result['setup'], args.queries,
+                  result['queries'], result['kept'], result['apps'],
+                  result['maxrss_kb'], result['files']))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
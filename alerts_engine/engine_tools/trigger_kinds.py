@@ -0,0 +1,242 @@
+"""
+Evaluation of the trigger kinds that look at more than a window's extremes:
+'rate' compares the PV's rate of change, 'hysteresis' latches until the PV
+is back past the value by the deadband and 'dwell' needs the comparison to
+hold for a while. Each is vectorized over the samples and carries a Carry of
+constant size from one scan to the next, so a scan only goes over the
+samples that arrived since the previous one. The first scan of a trigger
+goes over its whole window.
+"""
+
+############
+# Standard #
+############
+import logging
+import collections
+
+###############
+# Third Party #
+###############
+import numpy as np
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+LEVEL = 'level'
+KINDS = (LEVEL, 'rate', 'hysteresis', 'dwell')
+
+# comparators each kind can use
+KIND_OPS = {
+    'rate': ('<', '<=', '>', '>='),
+    'hysteresis': ('<', '<=', '>', '>='),
+    'dwell': ('==', '!=', '<', '<=', '>', '>='),
+}
+
+UFUNCS = {
+    '==': np.equal,
+    '!=': np.not_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+}
+
+Carry = collections.namedtuple('Carry', ['time', 'value', 'since'])
+Carry.__doc__ = """
+State of a trigger after the samples it has gone over.
+
+time : int
+    ns since the epoch of the newest sample gone over
+
+value : float
+    newest finite sample, for rate triggers
+
+since : int or bool or None
+    for dwell triggers, when the comparison started holding without a break,
+    None if it doesn't hold. For hysteresis triggers whether it is latched.
+"""
+
+
+def holds(compare, vals, value):
+    """
+    Where a comparison holds, never on nan.
+
+    Parameters
+    ----------
+    compare : str
+
+    vals : numpy.ndarray
+
+    value : float
+
+    Returns
+    -------
+    numpy.ndarray (bool)
+    """
+    with np.errstate(invalid='ignore'):
+        found = UFUNCS[compare](vals, value)
+    if compare == '!=':
+        found &= ~np.isnan(vals)
+    return found
+
+
+def new_samples(times, vals, carry):
+    """
+    The samples newer than the carried ones.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        (times, vals)
+    """
+    if carry == None:
+        return times, vals
+    start = np.searchsorted(times, carry.time, side='right')
+    return times[start:], vals[start:]
+
+
+def rate(times, vals, compare, value, carry=None):
+    """
+    Whether the rate of change between consecutive finite samples, in units
+    per second, compares to value anywhere in the new samples.
+
+    Parameters
+    ----------
+    times : numpy.ndarray (int64)
+        ns since the epoch
+
+    vals : numpy.ndarray
+
+    compare : str
+
+    value : float
+
+    carry : Carry
+        state after the previous scan, None on the first
+
+    Returns
+    -------
+    tuple
+        (tripped, Carry)
+    """
+    times, vals = new_samples(times, vals, carry)
+    if len(times) == 0:
+        return False, carry
+    finite = ~np.isnan(vals)
+    f_times = times[finite]
+    f_vals = vals[finite]
+    if carry != None and carry.value != None:
+        f_times = np.insert(f_times, 0, carry.time)
+        f_vals = np.insert(f_vals, 0, carry.value)
+    tripped = False
+    if len(f_vals) > 1:
+        dt = np.diff(f_times)
+        step = dt > 0
+        slopes = np.diff(f_vals)[step] / (dt[step] / 1e9)
+        tripped = bool(holds(compare, slopes, value).any())
+    if len(f_vals):
+        carry = Carry(int(f_times[-1]), float(f_vals[-1]), None)
+    else:
+        carry = Carry(int(times[-1]), None, None)
+    return tripped, carry
+
+
+def hysteresis(times, vals, compare, value, deadband, carry=None):
+    """
+    Whether the trigger is latched at any of the new samples. It latches
+    where the comparison holds and releases once the PV is past value by
+    more than the deadband in the other direction.
+
+    Parameters
+    ----------
+    times : numpy.ndarray (int64)
+
+    vals : numpy.ndarray
+
+    compare : str
+        <, <=, > or >=
+
+    value : float
+
+    deadband : float or None
+        None is a deadband of 0, the plain comparison
+
+    carry : Carry
+
+    Returns
+    -------
+    tuple
+        (tripped, Carry)
+    """
+    latched = bool(carry != None and carry.since)
+    times, vals = new_samples(times, vals, carry)
+    if len(times) == 0:
+        return latched, carry
+    deadband = abs(deadband or 0.)
+    set_ = holds(compare, vals, value)
+    if compare in ('>', '>='):
+        clear = holds('<', vals, value - deadband)
+    else:
+        clear = holds('>', vals, value + deadband)
+    # the state after each sample follows the last set or clear up to it
+    events = set_ | clear
+    last = np.maximum.accumulate(np.where(events,
+        np.arange(len(vals)), -1))
+    state = np.where(last >= 0, set_[np.maximum(last, 0)], latched)
+    return bool(state.any()), Carry(int(times[-1]), None, bool(state[-1]))
+
+
+def dwell(times, vals, compare, value, dwell_ns, end_ns=None, carry=None):
+    """
+    Whether the comparison held without a break for dwell_ns at any time up
+    to end_ns. Each sample holds until the next one, the last until end_ns.
+
+    Parameters
+    ----------
+    times : numpy.ndarray (int64)
+
+    vals : numpy.ndarray
+
+    compare : str
+
+    value : float
+
+    dwell_ns : int
+
+    end_ns : int
+        end of the window, defaults to the newest sample
+
+    carry : Carry
+
+    Returns
+    -------
+    tuple
+        (tripped, Carry)
+    """
+    since = carry.since if carry != None else None
+    times, vals = new_samples(times, vals, carry)
+    if len(times) == 0:
+        if since == None or end_ns == None:
+            return False, carry
+        return end_ns - since >= dwell_ns, carry
+    if end_ns == None or end_ns < times[-1]:
+        end_ns = int(times[-1])
+    found = holds(compare, vals, value)
+    # start of the unbroken run each sample belongs to
+    last_break = np.maximum.accumulate(np.where(~found,
+        np.arange(len(vals)), -1))
+    starts = times[np.minimum(last_break + 1, len(times) - 1)]
+    if since != None:
+        starts = np.where(last_break < 0, since, starts)
+    until = np.append(times[1:], end_ns)
+    tripped = bool((found & (until - starts >= dwell_ns)).any())
+    # the carried run also held up to the first new sample
+    if since != None and times[0] - since >= dwell_ns:
+        tripped = True
+    if found[-1]:
+        since = int(starts[-1])
+    else:
+        since = None
+    return tripped, Carry(int(times[-1]), None, since)
@@ -0,0 +1,531 @@
+"""
+Columnar form of the trigger configuration. All triggers are compiled into
+NumPy arrays once per scan; each PV's data is reduced to a few statistics per
+window as it arrives and every trigger is then resolved in one vectorized
+pass, so the per-scan work grows with the number of PVs rather than with the
+number of triggers.
+
+Triggers of different alerts often state the same condition. Identical
+(PV, window, compare, value) conditions are compiled into one shared node
+that is evaluated once and fans out to every trigger referencing it, so the
+evaluation cost follows the number of unique conditions.
+
+The <, <=, > and >= thresholds of each PV are also kept sorted in a
+ThresholdIndex, so the tripped ones are found by binary search of the
+window's minimum or maximum. The indexes can be carried from one scan's
+table to the next and are only rebuilt for PVs whose triggers changed.
+Likewise a window's statistics can be carried in a WindowState that only
+folds in each scan's new samples.
+
+Rate, hysteresis and dwell triggers, see trigger_kinds, are resolved while
+their PV is reduced and keep a Carry per trigger in the carry dict, which
+is passed on to the next table like the indexes.
+"""
+
+############
+# Standard #
+############
+import logging
+
+###############
+# Third Party #
+###############
+import numpy as np
+
+##########
+# Custom #
+##########
+from . import trigger_kinds
+from .archiver_client import epoch_ns, pv_times, pv_values
+from .window_state import WindowState
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+# op codes of the comparators
+OPS = {'==': 0, '!=': 1, '<': 2, '<=': 3, '>': 4, '>=': 5}
+
+# comparators resolved through a ThresholdIndex
+RANGE_OPS = ('<', '<=', '>', '>=')
+
+
+class ThresholdIndex:
+    """
+    A PV's range thresholds, sorted separately for each window and
+    comparator.
+
+    Attributes
+    ----------
+    signature : frozenset
+        The PV's trigger signature the index was built from.
+
+    thresholds : dict
+        (window, compare) mapped to (sorted unique thresholds, start of each
+        threshold's triggers in pks, trigger pks grouped by threshold). The
+        triggers of a range of thresholds are then one slice of pks.
+    """
+    def __init__(self, rows, signature=None):
+        """
+        Parameters
+        ----------
+        rows : iterable of tuple
+            (pk, compare, value, window) of each of the PV's range triggers
+
+        signature : frozenset
+        """
+        self.signature = signature
+        groups = {}
+        for pk, compare, value, window in rows:
+            groups.setdefault((window, compare), []).append((value, pk))
+        self.thresholds = {}
+        for key, entries in groups.items():
+            entries.sort()
+            values = np.array([entry[0] for entry in entries],
+                dtype=np.float64)
+            pks = np.array([entry[1] for entry in entries], dtype=np.int64)
+            # every threshold is a shared node however many triggers use it
+            unique, starts = np.unique(values, return_index=True)
+            starts = np.append(starts, len(pks))
+            self.thresholds[key] = (unique, starts, pks)
+
+    def tripped(self, window, lo, hi):
+        """
+        Triggers of a window tripped by its minimum and maximum.
+
+        Parameters
+        ----------
+        window : datetime.timedelta or None
+
+        lo : float
+            minimum of the window, not nan
+
+        hi : float
+            maximum of the window, not nan
+
+        Returns
+        -------
+        list of numpy.ndarray
+            pks of the tripped triggers
+        """
+        found = []
+        for compare in RANGE_OPS:
+            entry = self.thresholds.get((window, compare))
+            if entry == None:
+                continue
+            values, starts, pks = entry
+            if compare == '<':
+                found.append(pks[starts[
+                    np.searchsorted(values, lo, 'right')]:])
+            elif compare == '<=':
+                found.append(pks[starts[
+                    np.searchsorted(values, lo, 'left')]:])
+            elif compare == '>':
+                found.append(pks[:starts[
+                    np.searchsorted(values, hi, 'left')]])
+            else:
+                found.append(pks[:starts[
+                    np.searchsorted(values, hi, 'right')]])
+        return found
+
+
+class TriggerTable:
+    """
+    Triggers as parallel arrays, one entry per trigger that can trip, and
+    the unique conditions they share.
+
+    Each condition refers to a view, a (PV name, window) pair, whose samples
+    are summarized by reduce. Triggers without a PV, comparator or value can
+    never trip and are left out.
+
+    Attributes
+    ----------
+    pk : numpy.ndarray (int64)
+        pk of each trigger
+
+    view : numpy.ndarray (int64)
+        index into views of each trigger
+
+    op : numpy.ndarray (int8)
+        op code of each trigger's comparator, see OPS
+
+    value : numpy.ndarray (float64)
+        threshold of each trigger
+
+    alert : numpy.ndarray (int64)
+        pk of each trigger's alert
+
+    condition : numpy.ndarray (int64)
+        index of each trigger's shared condition, -1 for triggers of other
+        kinds than level
+
+    cond_view, cond_op, cond_value : numpy.ndarray
+        view, op code and threshold of each unique condition
+
+    views : list of tuple
+        (PV name, window) of each view, window being None for the default
+
+    indexes : dict
+        PV name mapped to the ThresholdIndex of its range triggers
+
+    carry : dict
+        pk of each rate, hysteresis and dwell trigger mapped to its
+        definition and its trigger_kinds.Carry
+    """
+    def __init__(self, rows=(), indexes=None, carry=None):
+        """
+        Parameters
+        ----------
+        rows : iterable of tuple
+            (pk, PV name, compare, value, window, alert pk) of each trigger,
+            optionally followed by the PV pk, kind, deadband and dwell.
+            Triggers without a kind are level triggers.
+
+        indexes : dict
+            ThresholdIndexes of a previous table, kept across scans by the
+            caller. Indexes of PVs whose triggers are unchanged are reused,
+            the others are rebuilt, and the dict is updated in place.
+
+        carry : dict
+            carry of a previous table. Entries of unchanged triggers are
+            kept, the dict is updated in place.
+        """
+        self.views = []
+        self.pv_views = {}
+        self.signatures = {}
+        range_rows = {}
+        index = {}
+        conditions = {}
+        # view index -> (position, pk, kind, compare, value, parameter) of
+        # its triggers of other kinds than level
+        self.view_kinds = {}
+        definitions = {}
+        pk, view, op, value, alert, condition = [], [], [], [], [], []
+        for row in rows:
+            t_pk, name, compare, t_value, window, t_alert = row[:6]
+            kind, deadband, dwell = (tuple(row[7:10]) + (None,) * 3)[:3]
+            kind = kind or trigger_kinds.LEVEL
+            if name == None:
+                continue
+            self.signatures.setdefault(name, set()).add(
+                tuple(row[:5]) + (kind, deadband, dwell))
+            if compare == None or t_value == None:
+                continue
+            if compare not in OPS:
+                logger.error("comparator not yet implemented")
+                continue
+            if kind != trigger_kinds.LEVEL:
+                if compare not in trigger_kinds.KIND_OPS.get(kind, ()):
+                    logger.error("{} triggers can't use {}".format(
+                        kind, compare))
+                    continue
+                if kind == 'dwell' and dwell == None:
+                    logger.error("dwell trigger without a dwell time")
+                    continue
+            key = (name, window)
+            if key not in index:
+                index[key] = len(self.views)
+                self.views.append(key)
+                self.pv_views.setdefault(name, []).append(index[key])
+            if kind != trigger_kinds.LEVEL:
+                if kind == 'dwell':
+                    parameter = int(dwell.total_seconds() * 1e9)
+                else:
+                    parameter = deadband
+                self.view_kinds.setdefault(index[key], []).append(
+                    (len(pk), t_pk, kind, compare, t_value, parameter))
+                definitions[t_pk] = (name, compare, t_value, window, kind,
+                    parameter)
+                pk.append(t_pk)
+                view.append(index[key])
+                op.append(OPS[compare])
+                value.append(t_value)
+                alert.append(t_alert)
+                condition.append(-1)
+                continue
+            if compare in RANGE_OPS:
+                range_rows.setdefault(name, []).append(
+                    (t_pk, compare, t_value, window))
+            node = (index[key], OPS[compare], t_value)
+            if node not in conditions:
+                conditions[node] = len(conditions)
+            pk.append(t_pk)
+            view.append(index[key])
+            op.append(OPS[compare])
+            value.append(t_value)
+            alert.append(t_alert)
+            condition.append(conditions[node])
+        self.pk = np.array(pk, dtype=np.int64)
+        self.view = np.array(view, dtype=np.int64)
+        self.op = np.array(op, dtype=np.int8)
+        self.value = np.array(value, dtype=np.float64)
+        self.alert = np.array(alert, dtype=np.int64)
+        self.condition = np.array(condition, dtype=np.int64)
+        # conditions are numbered in order of first appearance
+        nodes = list(conditions)
+        self.cond_view = np.array([n[0] for n in nodes], dtype=np.int64)
+        self.cond_op = np.array([n[1] for n in nodes], dtype=np.int8)
+        self.cond_value = np.array([n[2] for n in nodes], dtype=np.float64)
+        self.signatures = dict(
+            (name, frozenset(rows)) for name, rows in self.signatures.items())
+        # view index -> its == conditions, which need the window's exact
+        # values
+        self.eq_members = {}
+        for member in np.flatnonzero(self.cond_op == OPS['==']):
+            self.eq_members.setdefault(int(self.cond_view[member]),
+                []).append(member)
+        self.ne_members = np.flatnonzero(self.cond_op == OPS['!='])
+        # finds a trigger's row from its pk
+        self.pk_order = np.argsort(self.pk)
+        self.pk_sorted = self.pk[self.pk_order]
+        if indexes == None:
+            indexes = {}
+        for name in set(indexes) - set(range_rows):
+            del indexes[name]
+        for name, pv_rows in range_rows.items():
+            signature = self.signatures[name]
+            if name not in indexes or indexes[name].signature != signature:
+                indexes[name] = ThresholdIndex(pv_rows, signature)
+        self.indexes = indexes
+        if carry == None:
+            carry = {}
+        for t_pk in list(carry):
+            if carry[t_pk][0] != definitions.get(t_pk):
+                del carry[t_pk]
+        for t_pk, definition in definitions.items():
+            if t_pk not in carry:
+                carry[t_pk] = (definition, None)
+        self.carry = carry
+        self.level = self.condition >= 0
+        self.reset()
+
+    def __len__(self):
+        return len(self.pk)
+
+    @property
+    def n_conditions(self):
+        """
+        Number of unique conditions shared by the triggers.
+        """
+        return len(self.cond_op)
+
+    def pv_names(self):
+        """
+        Names of the PVs with triggers, including triggers that can't trip.
+        """
+        return list(self.signatures)
+
+    def rows(self):
+        """
+        (PV name, compare, window) of every trigger with a PV. For triggers
+        of other kinds than level the kind stands in for compare.
+        """
+        for name, rows in self.signatures.items():
+            for pk, row_name, compare, value, window, kind, _, _ in rows:
+                if kind != trigger_kinds.LEVEL:
+                    compare = kind
+                yield name, compare, window
+
+    def carried(self, name):
+        """
+        Whether any of a PV's triggers is a rate, hysteresis or dwell
+        trigger, whose result depends on its carry and the scan's time as
+        well as on the samples.
+        """
+        return any(index in self.view_kinds
+            for index in self.pv_views.get(name, ()))
+
+    def signature(self, name):
+        """
+        Everything about a PV's triggers that affects their evaluation,
+        to tell whether a previous result still holds.
+
+        Returns
+        -------
+        frozenset or None
+            (pk, PV name, compare, value, window, kind, deadband, dwell) of
+            each of its triggers
+        """
+        return self.signatures.get(name)
+
+    def reset(self):
+        """
+        Forget the statistics of the previous scan. The carry is kept.
+        """
+        count = len(self.views)
+        self.count = np.zeros(count, dtype=np.int64)
+        self.min = np.full(count, np.nan)
+        self.max = np.full(count, np.nan)
+        self.has_nan = np.zeros(count, dtype=bool)
+        # view index -> sorted unique values, only for == triggers
+        self.values = {}
+        self.kind_tripped = np.zeros(len(self.pk), dtype=bool)
+
+    def reduce(self, name, data, plan=None, end_time=None, states=None):
+        """
+        Summarize a PV's data for each of its trigger windows. The data
+        itself isn't kept.
+
+        Parameters
+        ----------
+        name : str
+            name of the PV
+
+        data : xarray.Dataset or PvSamples
+
+        plan : FetchPlan
+            If given, each window is a view of data ending at end_time.
+
+        end_time : datetime.datetime
+            end of the windows
+
+        states : dict
+            If given, (PV name, window) mapped to the WindowState of each
+            view, kept across scans by the caller. Each view's state only
+            folds in the samples it hasn't seen and its statistics are
+            taken from there. Missing states are added to the dict.
+        """
+        for index in self.pv_views.get(name, ()):
+            window = self.views[index][1]
+            if plan != None:
+                view = plan.view(name, data, window, end_time)
+            else:
+                view = data
+            if index in self.view_kinds:
+                self._reduce_kinds(index, name, view, end_time)
+            if states != None:
+                self._reduce_state(index, name, view, states)
+                continue
+            vals = np.asarray(pv_values(name, view), dtype=np.float64)
+            nans = np.isnan(vals)
+            self.count[index] = len(vals)
+            self.has_nan[index] = nans.any()
+            if nans.all():
+                continue
+            finite = vals[~nans] if self.has_nan[index] else vals
+            self.min[index] = finite.min()
+            self.max[index] = finite.max()
+            if index in self.eq_members:
+                self.values[index] = np.unique(finite)
+
+    def _reduce_kinds(self, index, name, view, end_time):
+        """
+        Resolve a view's rate, hysteresis and dwell triggers, moving their
+        carry on.
+
+        Note
+        ----
+            Intended for internal use only.
+        """
+        times = pv_times(name, view)
+        vals = np.asarray(pv_values(name, view), dtype=np.float64)
+        end_ns = epoch_ns(end_time) if end_time != None else None
+        for position, t_pk, kind, compare, value, parameter \
+                in self.view_kinds[index]:
+            definition, carry = self.carry[t_pk]
+            if kind == 'rate':
+                tripped, carry = trigger_kinds.rate(times, vals, compare,
+                    value, carry)
+            elif kind == 'hysteresis':
+                tripped, carry = trigger_kinds.hysteresis(times, vals,
+                    compare, value, parameter, carry)
+            else:
+                tripped, carry = trigger_kinds.dwell(times, vals, compare,
+                    value, parameter, end_ns, carry)
+            self.kind_tripped[position] = tripped
+            self.carry[t_pk] = (definition, carry)
+
+    def _reduce_state(self, index, name, view, states):
+        """
+        Note
+        ----
+            Intended for internal use only.
+        """
+        key = self.views[index]
+        track_values = index in self.eq_members
+        state = states.get(key)
+        if state == None or (track_values and state.values == None):
+            state = WindowState(track_values)
+            states[key] = state
+        state.fold(pv_times(name, view), pv_values(name, view))
+        self.count[index] = state.count
+        self.has_nan[index] = state.n_nan > 0
+        if state.count == state.n_nan:
+            return
+        self.min[index] = state.min
+        self.max[index] = state.max
+        if track_values:
+            self.values[index] = state.distinct()
+
+    def evaluate(self):
+        """
+        Resolve every trigger against the reduced statistics.
+
+        Returns
+        -------
+        numpy.ndarray (bool)
+            whether each trigger tripped
+        """
+        # == and != conditions are evaluated once and fan out to their
+        # triggers
+        shared = np.zeros(len(self.cond_op), dtype=bool)
+        # some sample differs from the value; nan differs from all
+        ne = self.ne_members
+        ne_view = self.cond_view[ne]
+        shared[ne] = (self.count[ne_view] > 0) & (self.has_nan[ne_view]
+            | (self.min[ne_view] != self.cond_value[ne])
+            | (self.max[ne_view] != self.cond_value[ne]))
+        for index, members in self.eq_members.items():
+            if index in self.values:
+                shared[members] = np.isin(self.cond_value[members],
+                    self.values[index])
+        tripped = self.kind_tripped.copy()
+        tripped[self.level] = shared[self.condition[self.level]]
+        # empty and all-nan windows trip no range trigger
+        found = []
+        for index in np.flatnonzero(~np.isnan(self.min)):
+            name, window = self.views[index]
+            if name in self.indexes:
+                found.extend(self.indexes[name].tripped(window,
+                    self.min[index], self.max[index]))
+        if found:
+            pks = np.concatenate(found)
+            tripped[self.pk_order[np.searchsorted(self.pk_sorted, pks)]] = \
+                True
+        return tripped
+
+    def tripped(self, mask, name=None):
+        """
+        pks of the tripped triggers.
+
+        Parameters
+        ----------
+        mask : numpy.ndarray (bool)
+            output of evaluate
+
+        name : str
+            If given, only this PV's triggers are returned.
+
+        Returns
+        -------
+        set
+        """
+        if name != None:
+            mask = mask & np.isin(self.view, self.pv_views.get(name, []))
+        return set(self.pk[mask].tolist())
+
+    def alerts(self, pks):
+        """
+        pks of the alerts owning any of the given triggers.
+
+        Parameters
+        ----------
+        pks : set
+            trigger pks
+
+        Returns
+        -------
+        set
+        """
+        return set(self.alert[np.isin(self.pk, list(pks))].tolist())
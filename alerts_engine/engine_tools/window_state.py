@@ -0,0 +1,265 @@
+"""
+Running statistics of a trigger window kept from one scan to the next. The
+window's samples are held in the order they arrived together with the
+count, the number of nan samples, the sum of the finite ones and monotonic
+deques of the candidates for the minimum and maximum. Each scan only folds
+in the samples newer than the last one seen and evicts those that left the
+window, so the work per scan follows the amount of new data rather than the
+length of the window.
+"""
+
+############
+# Standard #
+############
+import logging
+import collections
+
+###############
+# Third Party #
+###############
+import numpy as np
+
+#################
+# Configuration #
+#################
+logger = logging.getLogger(__name__)
+
+
+def _survivors(vals, keep):
+    """
+    Indices of the samples of a batch that stay in a monotonic deque, those
+    strictly beating every later sample of the batch.
+
+    Parameters
+    ----------
+    vals : numpy.ndarray
+        finite values in time order
+
+    keep : numpy.ufunc
+        np.maximum for the maximum's deque, np.minimum for the minimum's
+
+    Note
+    ----
+        Intended for internal use only.
+    """
+    best = keep.accumulate(vals[::-1])[::-1]
+    if keep is np.maximum:
+        beats = vals[:-1] > best[1:]
+    else:
+        beats = vals[:-1] < best[1:]
+    return np.append(np.flatnonzero(beats), len(vals) - 1)
+
+
+class WindowState:
+    """
+    Samples and statistics of one (PV, window) view.
+
+    A PV's samples arrive in time order, so whatever hasn't been folded in
+    yet is newer than the last sample that has.
+
+    Attributes
+    ----------
+    count : int
+        samples in the window, nan included
+
+    n_nan : int
+        nan samples in the window
+
+    total : float
+        sum of the finite samples
+
+    values : dict or None
+        finite value mapped to the number of samples with it, only kept if
+        track_values was set
+    """
+    def __init__(self, track_values=False):
+        """
+        Parameters
+        ----------
+        track_values : bool
+            Also count the distinct values, which == triggers need.
+        """
+        self.track_values = track_values
+        self.reset()
+
+    def __len__(self):
+        return self.count
+
+    def reset(self):
+        """
+        Forget every sample.
+        """
+        # (times, vals) chunks in time order
+        self.chunks = collections.deque()
+        # (time, value) candidates, values decreasing for max and increasing
+        # for min
+        self.max_deque = collections.deque()
+        self.min_deque = collections.deque()
+        self.count = 0
+        self.n_nan = 0
+        self.total = 0.0
+        self.values = {} if self.track_values else None
+
+    @property
+    def first_time(self):
+        if self.count == 0:
+            return None
+        return int(self.chunks[0][0][0])
+
+    @property
+    def last_time(self):
+        if self.count == 0:
+            return None
+        return int(self.chunks[-1][0][-1])
+
+    @property
+    def min(self):
+        """
+        Smallest finite sample, nan if there is none.
+        """
+        if not self.min_deque:
+            return np.nan
+        return self.min_deque[0][1]
+
+    @property
+    def max(self):
+        """
+        Largest finite sample, nan if there is none.
+        """
+        if not self.max_deque:
+            return np.nan
+        return self.max_deque[0][1]
+
+    @property
+    def mean(self):
+        """
+        Mean of the finite samples, nan if there is none.
+        """
+        finite = self.count - self.n_nan
+        if finite == 0:
+            return np.nan
+        return self.total / finite
+
+    def distinct(self):
+        """
+        Distinct finite values of the window.
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        return np.fromiter(self.values, dtype=np.float64,
+            count=len(self.values))
+
+    def fold(self, times, vals):
+        """
+        Bring the window up to date with the samples of a scan's view.
+
+        Samples older than the view's first one are evicted and those newer
+        than the last folded one are added. If the view doesn't continue
+        the folded samples, starting before them or ending before the last
+        of them, the window is rebuilt from the view.
+
+        Parameters
+        ----------
+        times : numpy.ndarray (int64)
+            ns since the epoch, in time order
+
+        vals : numpy.ndarray
+        """
+        if len(times) == 0:
+            self.reset()
+            return
+        if self.count and (times[0] < self.first_time
+                           or times[-1] < self.last_time):
+            logger.debug("window moved back, rebuilding")
+            self.reset()
+        self.evict(times[0])
+        if self.count:
+            start = np.searchsorted(times, self.last_time, side='right')
+        else:
+            start = 0
+        if start < len(times):
+            # views of a ring buffer are overwritten later, keep a copy
+            self.extend(np.array(times[start:], dtype=np.int64),
+                np.array(vals[start:], dtype=np.float64))
+
+    def extend(self, times, vals):
+        """
+        Add samples newer than any folded so far.
+
+        Parameters
+        ----------
+        times : numpy.ndarray (int64)
+
+        vals : numpy.ndarray (float64)
+        """
+        finite = ~np.isnan(vals)
+        self.chunks.append((times, vals))
+        self.count += len(vals)
+        self.n_nan += len(vals) - int(finite.sum())
+        if not finite.any():
+            return
+        f_times = times[finite]
+        f_vals = vals[finite]
+        self.total += float(f_vals.sum())
+        for deque, keep, newest in ((self.max_deque, np.maximum, f_vals.max()),
+                                    (self.min_deque, np.minimum,
+                                     f_vals.min())):
+            # older candidates the batch beats can never be the answer again
+            if keep is np.maximum:
+                while deque and deque[-1][1] <= newest:
+                    deque.pop()
+            else:
+                while deque and deque[-1][1] >= newest:
+                    deque.pop()
+            index = _survivors(f_vals, keep)
+            deque.extend(zip(f_times[index].tolist(),
+                f_vals[index].tolist()))
+        if self.values != None:
+            unique, counts = np.unique(f_vals, return_counts=True)
+            for value, count in zip(unique.tolist(), counts.tolist()):
+                self.values[value] = self.values.get(value, 0) + count
+
+    def evict(self, cutoff):
+        """
+        Drop the samples older than cutoff.
+
+        Parameters
+        ----------
+        cutoff : int
+            ns since the epoch
+        """
+        while self.chunks and self.chunks[0][0][0] < cutoff:
+            times, vals = self.chunks.popleft()
+            split = np.searchsorted(times, cutoff, side='left')
+            if split < len(times):
+                self.chunks.appendleft((times[split:], vals[split:]))
+            self._forget(vals[:split])
+        for deque in (self.max_deque, self.min_deque):
+            while deque and deque[0][0] < cutoff:
+                deque.popleft()
+        if self.count == 0:
+            # don't carry rounding errors into the next samples
+            self.total = 0.0
+
+    def _forget(self, vals):
+        """
+        Take evicted samples out of the statistics.
+
+        Note
+        ----
+            Intended for internal use only.
+        """
+        finite = vals[~np.isnan(vals)]
+        self.count -= len(vals)
+        self.n_nan -= len(vals) - len(finite)
+        self.total -= float(finite.sum())
+        if self.values != None and len(finite):
+            unique, counts = np.unique(finite, return_counts=True)
+            for value, count in zip(unique.tolist(), counts.tolist()):
+                left = self.values[value] - count
+                if left:
+                    self.values[value] = left
+                else:
+                    del self.values[value]
@@ -1,5 +1,6 @@
 """
-Main script running the alerts engine.
+Main script running the alerts engine. The Django secret key is taken from
+the EASE_ENGINE_SECRET_KEY environment variable.
 """
 
 ############
@@ -19,6 +20,7 @@ import configparser
 from engine_tools import scheduler_async
 from engine_tools import email_wrapper
 from engine_tools import record_scanner
+from engine_tools import ca_monitor
 from engine_tools import django_connect
 
 #################
@@ -49,7 +51,76 @@ def main():
     )
 
 
-    scanner = record_scanner.TriggerScan("pscaa01-dev",rep_t)
+    appliances = [
+        host.strip() for host in conf['archiver']['appliances'].split(",")
+        if host.strip()
+    ]
+    routing_ttl = float(conf['archiver']['routing_ttl'])
+    max_workers = int(conf['archiver']['max_workers'])
+    pool_size = int(conf['archiver']['pool_size'])
+    idle_timeout = float(conf['archiver']['idle_timeout'])
+    incremental = conf['archiver'].getboolean('incremental')
+    buffer_capacity = int(conf['archiver']['buffer_capacity'])
+    incremental_overlap = float(conf['archiver']['incremental_overlap'])
+    fetch_format = conf['archiver']['fetch_format']
+    deadline_fraction = float(conf['archiver']['deadline_fraction'])
+    retries = int(conf['archiver']['retries'])
+    backoff = float(conf['archiver']['backoff'])
+    breaker_threshold = int(conf['archiver']['breaker_threshold'])
+    breaker_reset = float(conf['archiver']['breaker_reset'])
+    segment_dir = conf['archiver']['segment_dir'] or None
+    if conf['archiver']['segment_retention']:
+        segment_retention = float(conf['archiver']['segment_retention'])
+    else:
+        segment_retention = None
+    segment_settle = float(conf['archiver']['segment_settle'])
+    streaming = conf['archiver'].getboolean('streaming')
+    skip_unchanged = conf['archiver'].getboolean('skip_unchanged')
+    proxy = conf['archiver']['proxy'] or None
+    stateful = conf['archiver'].getboolean('stateful')
+    if conf['archiver']['chunk_samples']:
+        chunk_samples = int(conf['archiver']['chunk_samples'])
+    else:
+        chunk_samples = None
+    if conf['archiver']['bin_size']:
+        bin_size = int(conf['archiver']['bin_size'])
+    else:
+        bin_size = None
+
+    if conf['monitor'].getboolean('enabled'):
+        # evaluate Channel Access updates in micro-windows instead of polling
+        rep_t = datetime.timedelta(seconds=float(conf['monitor']['window']))
+        scanner = ca_monitor.MonitorScan(
+            rep_t,
+            buffer_capacity = buffer_capacity,
+        )
+    else:
+        scanner = record_scanner.TriggerScan(
+            appliances,
+            rep_t,
+            max_workers = max_workers,
+            pool_size = pool_size,
+            idle_timeout = idle_timeout,
+            incremental = incremental,
+            buffer_capacity = buffer_capacity,
+            incremental_overlap = incremental_overlap,
+            fetch_format = fetch_format,
+            deadline_fraction = deadline_fraction,
+            retries = retries,
+            backoff = backoff,
+            breaker_threshold = breaker_threshold,
+            breaker_reset = breaker_reset,
+            routing_ttl = routing_ttl,
+            segment_dir = segment_dir,
+            segment_retention = segment_retention,
+            segment_settle = segment_settle,
+            bin_size = bin_size,
+            streaming = streaming,
+            chunk_samples = chunk_samples,
+            skip_unchanged = skip_unchanged,
+            proxy = proxy,
+            stateful = stateful,
+        )
     
     '''
     logger.debug("start test_db")
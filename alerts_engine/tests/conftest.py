@@ -1,5 +1,9 @@
+import os
 import pytest
 
+# the engine's settings take the secret key from the environment only
+os.environ.setdefault('EASE_ENGINE_SECRET_KEY', 'alerts-engine-tests')
+
 from engine_tools import scheduler_async
 
 
@@ -26,3 +30,19 @@ def limited_counter_class():
     return counter_class
 
 
+
+@pytest.fixture(scope='function')
+def engine_db():
+    """
+    Fresh test database for tests touching the alert configuration
+    """
+    from engine_tools import scan_replay
+    old_name = scan_replay.create_db()
+    yield
+    scan_replay.destroy_db(old_name)
+
+@pytest.fixture(scope='function')
+def sim_server():
+    from engine_tools import archiver_sim
+    with archiver_sim.SimServer() as server:
+        yield server
@@ -0,0 +1,81 @@
+import pytest
+import datetime
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from engine_tools import archiver_client
+
+
+class canned_handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = json.dumps([{
+        "meta": {"name": "TST:PV"},
+        "data": [
+            {"secs": 1500000000, "nanos": 0, "val": 1.5,
+             "severity": 0, "status": 0},
+            {"secs": 1500000001, "nanos": 500000000, "val": 2.5,
+             "severity": 1, "status": 3},
+        ],
+    }]).encode()
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='function')
+def canned_server():
+    server = HTTPServer(("127.0.0.1", 0), canned_handler)
+    server.clients = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server, **kwargs):
+    host, port = server.server_address
+    return archiver_client.ArchiverClient(host, data_port=port, **kwargs)
+
+
+def test_format_time():
+    dt = datetime.datetime(2017, 8, 10, 17, 41, 0, 123456,
+        tzinfo=datetime.timezone.utc)
+    assert archiver_client.format_time(dt) == "2017-08-10T17:41:00.123Z"
+
+
+@pytest.mark.timeout(5)
+def test_get_xarray(canned_server):
+    client = make_client(canned_server)
+    now = datetime.datetime.now()
+    data = client.get("TST:PV", now - datetime.timedelta(minutes=1), now)
+    vals = data["TST:PV"].sel(field='vals')
+    assert list(vals.values) == [1.5, 2.5]
+    assert list(data["TST:PV"].sel(field='stat').values) == [0, 3]
+
+
+@pytest.mark.timeout(5)
+def test_connection_reused(canned_server):
+    client = make_client(canned_server)
+    now = datetime.datetime.now()
+    for i in range(5):
+        client.get("TST:PV", now - datetime.timedelta(minutes=1), now)
+    assert len(canned_server.clients) == 1, "connection was not kept alive"
+
+
+@pytest.mark.timeout(5)
+def test_idle_reconnect(canned_server):
+    client = make_client(canned_server, idle_timeout=-1)
+    now = datetime.datetime.now()
+    for i in range(3):
+        client.get("TST:PV", now - datetime.timedelta(minutes=1), now)
+    assert len(canned_server.clients) == 3, "idle pool was not rebuilt"
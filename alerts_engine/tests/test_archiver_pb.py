@@ -0,0 +1,53 @@
+import pytest
+import struct
+import numpy as np
+
+from engine_tools import archiver_pb
+
+
+def test_round_trip_double():
+    # cross a year boundary so the response holds two chunks
+    times = np.array([1514764799, 1514764800, 1514764801]) * 1000000000 + 5
+    # 10.0 and 13.0 encode with newline / carriage return bytes
+    vals = np.array([struct.unpack("<d", b"\n" * 8)[0], 13.0, -2.5])
+    body = archiver_pb.encode_raw("TST:PV", times, vals)
+    assert b"\n\n" in body
+    decoded_times, decoded_vals = archiver_pb.decode_raw(body)
+    assert list(decoded_times) == list(times)
+    assert list(decoded_vals) == list(vals)
+    assert decoded_vals.flags['C_CONTIGUOUS']
+
+
+@pytest.mark.parametrize("payload_type", [
+    archiver_pb.SCALAR_FLOAT,
+    archiver_pb.SCALAR_INT,
+    archiver_pb.SCALAR_SHORT,
+    archiver_pb.SCALAR_ENUM,
+])
+def test_round_trip_types(payload_type):
+    times = np.arange(4) * 1000000000 + 1500000000 * 1000000000
+    vals = np.array([-3., 0., 27., 1.5 if payload_type == 2 else 4.])
+    body = archiver_pb.encode_raw("TST:PV", times, vals, payload_type)
+    assert list(archiver_pb.decode_raw(body)[1]) == list(vals)
+
+
+def test_escape_round_trip():
+    lines = [b"a\x1b\x01\nb\rc\x1b", b"plain", b"\x1b\x02"]
+    escaped = [archiver_pb.escape(line) for line in lines]
+    assert not any(b"\n" in line for line in escaped)
+    buf, newlines = archiver_pb.unescape_array(b"\n".join(escaped))
+    assert buf[:newlines[0]].tobytes() == lines[0]
+    assert list(newlines) == [len(lines[0]), len(lines[0]) + 6]
+    assert buf[newlines[1] + 1:].tobytes() == lines[2]
+
+
+def test_empty_body():
+    times, vals = archiver_pb.decode_raw(b"")
+    assert len(times) == 0 and len(vals) == 0
+
+
+def test_unsupported_type():
+    info = b"\x08" + archiver_pb.write_varint(archiver_pb.SCALAR_STRING) \
+        + b"\x12\x02PV\x18" + archiver_pb.write_varint(2017)
+    with pytest.raises(ValueError):
+        archiver_pb.decode_raw(info + b"\n\x08\x01\x10\x01\n")
@@ -0,0 +1,129 @@
+import pytest
+import datetime
+import threading
+import time
+import requests
+
+from engine_tools import archiver_proxy
+from engine_tools import archiver_sim
+from engine_tools import archiver_client
+from engine_tools import record_scanner
+
+
+@pytest.fixture(scope='function')
+def proxy_server():
+    with archiver_proxy.ProxyServer() as server:
+        yield server
+
+
+def make_client(sim_server, proxy_server):
+    return archiver_client.ArchiverClient(
+        sim_server.host,
+        data_port = sim_server.port,
+        mgmt_port = sim_server.port,
+        proxy = proxy_server.url,
+    )
+
+
+@pytest.mark.timeout(10)
+def test_coalesce(proxy_server):
+    sim = archiver_sim.SimArchiver(latency=.3)
+    with archiver_sim.SimServer(sim) as sim_server:
+        end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+        results = []
+
+        def pull():
+            client = make_client(sim_server, proxy_server)
+            results.append(client.get_arrays(
+                "SIM:PV:0", end - datetime.timedelta(minutes=1), end))
+
+        threads = [threading.Thread(target=pull) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert sim.request_count == 1
+    assert len(results) == 4
+    assert all(len(r.times) == 61 for r in results)
+    stats = proxy_server.proxy.statistics()
+    assert stats['misses'] == 1
+    assert stats['coalesced'] == 3
+
+
+@pytest.mark.timeout(10)
+def test_cache_ttl(sim_server, proxy_server):
+    proxy_server.proxy.ttl = .5
+    client = make_client(sim_server, proxy_server)
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    start = end - datetime.timedelta(minutes=1)
+    first = client.get_arrays("SIM:PV:0", start, end)
+    again = client.get_arrays("SIM:PV:0", start, end)
+    assert list(first.vals) == list(again.vals)
+    assert sim_server.sim.request_count == 1
+    time.sleep(.6)
+    client.get_arrays("SIM:PV:0", start, end)
+    assert sim_server.sim.request_count == 2
+    stats = requests.get(proxy_server.url + "/stats").json()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    assert stats['expired'] == 1
+
+
+@pytest.mark.timeout(10)
+def test_lru_eviction(sim_server, proxy_server):
+    proxy_server.proxy.max_entries = 2
+    client = make_client(sim_server, proxy_server)
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    start = end - datetime.timedelta(minutes=1)
+    for name in ["A", "B", "A", "C"]:
+        client.get_arrays(name, start, end)
+    assert sim_server.sim.request_count == 3
+    # B was the least recently used one when C came in
+    client.get_arrays("A", start, end)
+    assert sim_server.sim.request_count == 3
+    client.get_arrays("B", start, end)
+    assert sim_server.sim.request_count == 4
+    assert proxy_server.proxy.statistics()['evictions'] == 2
+
+
+@pytest.mark.timeout(10)
+def test_status_passed_through(sim_server, proxy_server):
+    client = make_client(sim_server, proxy_server)
+    for i in range(2):
+        status = client.get_pv_status(["SIM:PV:0"])
+        assert status["SIM:PV:0"]["status"] == "Being archived"
+    assert sim_server.sim.status_count == 2
+    assert proxy_server.proxy.statistics()['passed'] == 2
+
+
+@pytest.mark.timeout(10)
+def test_errors_not_cached(proxy_server):
+    sim = archiver_sim.SimArchiver(error_rate=1.0)
+    with archiver_sim.SimServer(sim) as sim_server:
+        client = make_client(sim_server, proxy_server)
+        end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+        for i in range(2):
+            with pytest.raises(requests.HTTPError):
+                client.get_arrays("A", end - datetime.timedelta(minutes=1),
+                    end)
+    assert sim.request_count == 2
+    assert proxy_server.proxy.statistics()['entries'] == 0
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_proxy(engine_db, sim_server, proxy_server):
+    from engine_tools import scan_replay
+    names = scan_replay.populate(5)
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    results = []
+    for i in range(2):
+        scanner = record_scanner.TriggerScan(
+            sim_server.host,
+            data_port = sim_server.port,
+            proxy = proxy_server.url,
+        )
+        scanner.emailer = scan_replay.RecordingEmailer()
+        results.append(scanner.scanTask(end))
+    assert results[0].tripped == results[1].tripped
+    assert sim_server.sim.request_count == len(names)
+    assert proxy_server.proxy.statistics()['hits'] == len(names)
@@ -0,0 +1,89 @@
+import pytest
+import datetime
+import requests
+import numpy as np
+
+from engine_tools import archiver_sim
+from engine_tools import archiver_client
+
+
+def make_client(server):
+    return archiver_client.ArchiverClient(server.host, data_port=server.port)
+
+
+@pytest.mark.timeout(5)
+def test_synthetic_series(sim_server):
+    client = make_client(sim_server)
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    data = client.get("SIM:PV:0", end - datetime.timedelta(seconds=60), end)
+    assert len(data["SIM:PV:0"].sel(field='vals')) == 61
+    again = client.get("SIM:PV:0", end - datetime.timedelta(seconds=60), end)
+    assert (data["SIM:PV:0"].values == again["SIM:PV:0"].values).all()
+
+
+@pytest.mark.timeout(5)
+def test_recorded_series(sim_server, tmpdir):
+    recording = tmpdir.join("rec.json")
+    recording.write(
+        '[{"meta": {"name": "REC:PV"}, "data": ['
+        '{"secs": 1500000000, "nanos": 0, "val": 4},'
+        '{"secs": 1500000010, "nanos": 0, "val": 5},'
+        '{"secs": 1500000020, "nanos": 0, "val": 6}]}]'
+    )
+    sim_server.sim.load_recording(str(recording))
+    client = make_client(sim_server)
+    start = archiver_client.from_epoch_ns(1500000005 * 1000000000)
+    end = archiver_client.from_epoch_ns(1500000015 * 1000000000)
+    data = client.get("REC:PV", start, end)
+    assert list(data["REC:PV"].sel(field='vals').values) == [4, 5]
+
+
+@pytest.mark.timeout(5)
+def test_error_injection(sim_server):
+    sim_server.sim.error_rate = 1
+    client = make_client(sim_server)
+    end = datetime.datetime.now()
+    with pytest.raises(requests.HTTPError):
+        client.get("SIM:PV:0", end - datetime.timedelta(seconds=1), end)
+
+
+@pytest.mark.timeout(5)
+def test_latency(sim_server):
+    sim_server.sim.latency = .2
+    client = make_client(sim_server)
+    end = datetime.datetime.now()
+    start = datetime.datetime.now()
+    client.get("SIM:PV:0", end - datetime.timedelta(seconds=1), end)
+    assert datetime.datetime.now() - start >= datetime.timedelta(seconds=.2)
+    assert sim_server.sim.request_count == 1
+
+
+@pytest.mark.timeout(5)
+def test_pb_matches_json(sim_server):
+    json_client = make_client(sim_server)
+    pb_client = archiver_client.ArchiverClient(
+        sim_server.host,
+        data_port = sim_server.port,
+        fetch_format = "pb",
+    )
+    end = datetime.datetime(2018, 1, 1, 0, 0, 30)
+    start = end - datetime.timedelta(minutes=2)
+    from_json = json_client.get_arrays("SIM:PV:1", start, end)
+    from_pb = pb_client.get_arrays("SIM:PV:1", start, end)
+    assert list(from_pb.times) == list(from_json.times)
+    assert np.allclose(from_pb.vals, from_json.vals)
+
+
+@pytest.mark.timeout(5)
+def test_post_processor(sim_server):
+    sim_server.sim.add_series("REC:PV", archiver_sim.RecordedSeries(
+        np.arange(0, 300) * 1000000000, np.arange(300) % 70))
+    client = make_client(sim_server)
+    start = archiver_client.from_epoch_ns(0)
+    end = archiver_client.from_epoch_ns(299 * 1000000000)
+    binned = client.get_binned("REC:PV", "max", 100, start, end)
+    assert list(binned.times) == [0, 100000000000, 200000000000]
+    assert list(binned.vals) == [69, 69, 69]
+    binned = client.get_binned("REC:PV", "min", 100, start, end)
+    assert list(binned.vals) == [0, 0, 0]
+    assert sim_server.sim.binned_count == 2
@@ -0,0 +1,131 @@
+import pytest
+import datetime
+import os
+import subprocess
+import sys
+import time
+
+from engine_tools import ca_monitor
+from engine_tools import archiver_client
+
+
+class fake_sub:
+    def __init__(self, pv):
+        self.pv = pv
+        self.callbacks = []
+
+    def add_callback(self, func):
+        self.callbacks.append(func)
+
+    def clear(self):
+        self.callbacks = []
+
+
+class fake_pv:
+    def __init__(self, name):
+        self.name = name
+        self.connected = True
+        self.subs = []
+
+    def subscribe(self, data_type=None):
+        sub = fake_sub(self)
+        self.subs.append(sub)
+        return sub
+
+
+class fake_context:
+    """
+    Stand-in for a caproto Context handing out always connected PVs
+    """
+    def __init__(self):
+        self.pvs = {}
+
+    def get_pvs(self, *names, timeout=None):
+        for name in names:
+            self.pvs.setdefault(name, fake_pv(name))
+        return [self.pvs[name] for name in names]
+
+
+def test_watch():
+    context = fake_context()
+    source = ca_monitor.MonitorSource(context)
+    source.watch(["A", "B"])
+    assert sorted(source.subscriptions) == ["A", "B"]
+    source.watch(["B", "C"])
+    assert sorted(source.subscriptions) == ["B", "C"]
+    assert context.pvs["A"].subs[0].callbacks == []
+    assert len(context.pvs["B"].subs) == 1
+
+
+def test_window():
+    source = ca_monitor.MonitorSource(fake_context())
+    source.watch(["A"])
+    source.push("A", 1, 100)
+    source.push("A", 3, 300)
+    source.push("A", 2, 200)
+    source.flush()
+    window = source.window("A", 150, 300)
+    assert list(window.times) == [100, 200, 300]
+    assert list(window.vals) == [1, 2, 3]
+    # the last value carries over into later windows
+    window = source.window("A", 400, 500)
+    assert list(window.vals) == [3]
+
+
+def test_archPull_disconnected():
+    context = fake_context()
+    scanner = ca_monitor.MonitorScan(context=context)
+    scanner.source.watch(["A", "B"])
+    context.pvs["B"].connected = False
+    scanner.source.push("A", 5)
+    failures = {}
+    data = scanner.archPull(["A", "B"], datetime.datetime.now(),
+        failures=failures)
+    assert list(data) == ["A"]
+    assert list(data["A"].vals) == [5]
+    assert list(failures) == ["B"]
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_monitor(engine_db):
+    from engine_tools import scan_replay
+    names = scan_replay.populate(5)
+    scanner = ca_monitor.MonitorScan(context=fake_context())
+    scanner.emailer = scan_replay.RecordingEmailer()
+    result = scanner.scanTask()
+    assert result.tripped == set()
+    assert sorted(scanner.source.subscriptions) == sorted(names)
+    # every synthetic trigger compares against a value below 100
+    for name in names:
+        scanner.source.push(name, 1000)
+    result = scanner.scanTask(datetime.datetime.now())
+    assert result.tripped
+    assert scanner.emailer.sent
+
+
+@pytest.fixture(scope='function')
+def soft_ioc(monkeypatch):
+    pytest.importorskip("caproto")
+    monkeypatch.setenv('EPICS_CA_ADDR_LIST', "127.0.0.1")
+    monkeypatch.setenv('EPICS_CA_AUTO_ADDR_LIST', "NO")
+    ioc = subprocess.Popen(
+        [sys.executable, "-m", "caproto.ioc_examples.simple",
+         "--interfaces", "127.0.0.1"],
+        env = dict(os.environ),
+    )
+    time.sleep(2)
+    yield
+    ioc.terminate()
+    ioc.wait()
+
+
+@pytest.mark.timeout(20)
+def test_soft_ioc(soft_ioc):
+    source = ca_monitor.MonitorSource()
+    source.watch(["simple:A"])
+    deadline = time.monotonic() + 5
+    while not source.pending and time.monotonic() < deadline:
+        time.sleep(.1)
+    source.flush()
+    now = archiver_client.epoch_ns(datetime.datetime.now())
+    assert list(source.window("simple:A", now - 10 ** 10, now).vals) == [1]
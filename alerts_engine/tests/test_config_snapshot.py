@@ -0,0 +1,52 @@
+from engine_tools import config_snapshot
+
+
+def row(pk, pv, value, alert, compare=">"):
+    return (pk, "PV:{}".format(pv), compare, value, None, alert, pv)
+
+
+class fake_db:
+    """
+    Answers fetch from a list of rows and records what was asked
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def fetch(self, trigger_pks, alert_pks, pv_pks):
+        self.calls.append((set(trigger_pks), set(alert_pks), set(pv_pks)))
+        return [r for r in self.rows if r[0] in trigger_pks
+            or r[5] in alert_pks or r[6] in pv_pks]
+
+
+def test_patched():
+    rows = [row(1, 1, 5., 10), row(2, 1, 6., 10), row(3, 2, 7., 20),
+        row(4, 3, 8., 30)]
+    snapshot = config_snapshot.ConfigSnapshot(4, rows)
+    assert len(snapshot) == 4
+    assert snapshot.records[3].pv == "PV:2"
+    # alert 10 re-created its triggers as 5 and 6, trigger 3 was edited and
+    # trigger 4 deleted
+    db = fake_db([row(5, 1, 1., 10), row(6, 2, 2., 10), row(3, 2, 9., 20)])
+    patched = snapshot.patched(
+        9,
+        [('alert', 10), ('trigger', 3), ('trigger', 4)],
+        db.fetch,
+    )
+    assert db.calls == [({3, 4}, {10}, set())]
+    assert patched.version == 9
+    assert sorted(patched.records) == [3, 5, 6]
+    assert patched.records[3].value == 9.
+    assert sorted(patched.table.pv_names()) == ["PV:1", "PV:2"]
+    # the old snapshot is left as it was
+    assert sorted(snapshot.records) == [1, 2, 3, 4]
+    assert "PV:3" in snapshot.table.indexes
+
+
+def test_patched_pv():
+    rows = [row(1, 1, 5., 10), row(2, 2, 6., 10)]
+    snapshot = config_snapshot.ConfigSnapshot(2, rows)
+    # PV 1 was deleted, its trigger no longer has a PV
+    patched = snapshot.patched(3, [('pv', 1)], fake_db([]).fetch)
+    assert sorted(patched.records) == [2]
+    assert patched.table.indexes["PV:2"] is snapshot.table.indexes["PV:2"]
@@ -0,0 +1,103 @@
+import pytest
+import datetime
+import time
+
+from engine_tools import archiver_sim
+from engine_tools import archiver_client
+from engine_tools import federation
+from engine_tools import record_scanner
+
+
+@pytest.fixture(scope='function')
+def appliances():
+    """
+    Two simulated appliances on separate loopback addresses sharing a port,
+    the first archiving A:* PVs and the second B:* PVs
+    """
+    servers = []
+    for host, prefix in (("127.0.0.1", "A"), ("127.0.0.2", "B")):
+        sim = archiver_sim.SimArchiver(synthesize=False)
+        for i in range(3):
+            sim.add_series(
+                "{}:{}".format(prefix, i),
+                archiver_sim.RecordedSeries([0], [i]),
+            )
+        port = servers[0].port if servers else 0
+        servers.append(archiver_sim.SimServer(sim, host, port).start())
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+def make_clients(servers):
+    return [
+        archiver_client.ArchiverClient(
+            s.host, data_port=s.port, mgmt_port=s.port)
+        for s in servers
+    ]
+
+
+@pytest.mark.timeout(5)
+def test_pv_status(appliances):
+    client = make_clients(appliances)[0]
+    status = client.get_pv_status(["A:0", "B:0"])
+    assert status["A:0"]['status'] == "Being archived"
+    assert status["B:0"]['status'] == "Not being archived"
+
+
+@pytest.mark.timeout(5)
+def test_route(appliances):
+    clients = make_clients(appliances)
+    router = federation.ApplianceRouter(clients)
+    groups = router.route(["A:0", "B:1", "A:2", "C:0"])
+    assert [(c.hostname, names) for c, names in groups] == [
+        ("127.0.0.1", ["A:0", "A:2", "C:0"]),
+        ("127.0.0.2", ["B:1"]),
+    ]
+
+
+@pytest.mark.timeout(5)
+def test_route_cached(appliances):
+    router = federation.ApplianceRouter(make_clients(appliances), ttl=.2)
+    router.route(["A:0", "B:0", "C:0"])
+    asked = [s.sim.status_count for s in appliances]
+    router.route(["A:0", "B:0", "C:0"])
+    assert [s.sim.status_count for s in appliances] == asked
+    time.sleep(.3)
+    router.route(["A:0"])
+    assert [s.sim.status_count for s in appliances] \
+        == [n + 1 for n in asked]
+
+
+@pytest.mark.timeout(5)
+def test_route_unreachable(appliances):
+    clients = make_clients(appliances)
+    appliances[1].stop()
+    router = federation.ApplianceRouter(clients)
+    groups = router.route(["A:0", "B:0"])
+    assert [(c.hostname, names) for c, names in groups] == [
+        ("127.0.0.1", ["A:0", "B:0"]),
+    ]
+    # B:0 may live on the missing appliance, it must be asked again
+    assert "A:0" in router.routes
+    assert "B:0" not in router.routes
+
+
+@pytest.mark.timeout(10)
+def test_archPull_federated(appliances):
+    scanner = record_scanner.TriggerScan(
+        [s.host for s in appliances],
+        data_port = appliances[0].port,
+        mgmt_port = appliances[0].port,
+        fetch_format = "pb",
+    )
+    end = datetime.datetime.now()
+    failures = {}
+    data = scanner.archPull(["A:1", "B:2", "C:0"], end,
+        start_time=end - datetime.timedelta(seconds=10), failures=failures)
+    assert list(data["A:1"].vals) == [1]
+    assert list(data["B:2"].vals) == [2]
+    assert len(data["C:0"].vals) == 0
+    assert failures == {}
+    assert appliances[0].sim.request_count == 2
+    assert appliances[1].sim.request_count == 1
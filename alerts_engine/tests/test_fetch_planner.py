@@ -0,0 +1,58 @@
+import datetime
+import numpy as np
+
+from engine_tools import fetch_planner
+from engine_tools import archiver_client
+
+
+def samples():
+    times = np.arange(0, 100, 10, dtype=np.int64)
+    return archiver_client.PvSamples(times, times.astype(float))
+
+
+def test_window_view():
+    data = samples()
+    view = fetch_planner.window_view("A", data, 45)
+    assert list(view.times) == [40, 50, 60, 70, 80, 90]
+    assert view.vals.base is data.vals
+    assert fetch_planner.window_view("A", data, 0) is data
+    # a sample right at start is the only one taken from before it
+    view = fetch_planner.window_view("A", data, 40)
+    assert list(view.times) == [40, 50, 60, 70, 80, 90]
+
+
+def test_window_view_xarray():
+    data = samples()
+    dataset = archiver_client.arrays_to_xarray("A", *data)
+    view = fetch_planner.window_view("A", dataset, 45)
+    assert list(archiver_client.pv_values("A", view)) \
+        == [40, 50, 60, 70, 80, 90]
+
+
+def test_plan():
+    minute = datetime.timedelta(minutes=1)
+    plan = fetch_planner.FetchPlan(minute, [
+        ("A", None),
+        ("A", 60 * minute),
+        ("B", None),
+        ("C", datetime.timedelta(seconds=10)),
+    ])
+    assert plan.lookback("A") == 60 * minute
+    assert plan.lookback("B") == minute
+    assert plan.lookback("C") == datetime.timedelta(seconds=10)
+    assert plan.lookback("D") == minute
+    assert plan.lookbacks() == {
+        "A": 60 * minute,
+        "C": datetime.timedelta(seconds=10),
+    }
+
+
+def test_plan_view():
+    end = archiver_client.from_epoch_ns(100 * 1000000000)
+    times = np.arange(0, 101, dtype=np.int64) * 1000000000
+    data = archiver_client.PvSamples(times, times / 1e9)
+    plan = fetch_planner.FetchPlan(datetime.timedelta(seconds=100),
+        [("A", None), ("A", datetime.timedelta(seconds=10))])
+    assert plan.view("A", data, None, end) is data
+    view = plan.view("A", data, datetime.timedelta(seconds=10), end)
+    assert list(view.vals) == list(range(90, 101))
@@ -1,4 +1,679 @@
 import pytest
+import datetime
+import time
+import numpy as np
+import requests
 
 from engine_tools import record_scanner
+from engine_tools import archiver_client
 
+
+class slow_archive:
+    """
+    Stand-in for the archiver that takes a fixed time to answer each request
+    """
+    def __init__(self, delay):
+        self.delay = delay
+        self.requested = []
+
+    fetch_format = "json"
+    breaker = None
+
+    def get(self, pv, xarray=True, start=None, end=None, timeout=None):
+        self.requested.append(pv)
+        time.sleep(self.delay)
+        return pv
+
+
+@pytest.mark.timeout(2)
+def test_archPull_concurrent():
+    scanner = record_scanner.TriggerScan("localhost", max_workers=20)
+    scanner.arch = slow_archive(.2)
+    names = ["PV:{}".format(i) for i in range(20)]
+    start = time.time()
+    data = scanner.archPull(names, datetime.datetime.now())
+    assert time.time() - start < 1, "PVs were not pulled concurrently"
+    assert data == {name: name for name in names}
+
+
+def test_archPull_no_duplicate_requests():
+    scanner = record_scanner.TriggerScan("localhost")
+    scanner.arch = slow_archive(0)
+    data = scanner.archPull(["A", "B", "A"], datetime.datetime.now())
+    assert sorted(scanner.arch.requested) == ["A", "B"]
+    assert list(data) == ["A", "B"]
+
+
+class counting_archive:
+    """
+    Stand-in for the archiver serving one sample per second of PV "A"
+    """
+    def __init__(self):
+        self.requests = []
+
+    fetch_format = "json"
+    breaker = None
+
+    def get_arrays(self, pv, start, end, timeout=None):
+        self.requests.append((start, end))
+        first = archiver_client.epoch_ns(start) // 1000000000
+        last = archiver_client.epoch_ns(end) // 1000000000
+        times = np.arange(first, last + 1) * 1000000000
+        return archiver_client.PvSamples(times, times.astype(float) / 1e9)
+
+
+def test_archPull_incremental():
+    scanner = record_scanner.TriggerScan(
+        "localhost",
+        rep_t = datetime.timedelta(seconds=60),
+        incremental = True,
+    )
+    scanner.arch = counting_archive()
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    first = scanner.archPull(["A"], end)
+    second = scanner.archPull(["A"], end + datetime.timedelta(seconds=10))
+
+    # second pull only asks for the 10s not already held and the overlap
+    assert scanner.arch.requests[1][0] \
+        == end - datetime.timedelta(seconds=10)
+    assert len(first["A"]["A"].sel(field='vals')) == 61
+    vals = second["A"]["A"].sel(field='vals').values
+    assert len(vals) == 61
+    assert vals[-1] == archiver_client.epoch_ns(
+        end + datetime.timedelta(seconds=10)) / 1e9
+
+
+class late_archive(counting_archive):
+    """
+    counting_archive whose sample half a second before late_time only shows
+    up once the archiver has been asked past late_time
+    """
+    def __init__(self, late_time):
+        super().__init__()
+        self.late_ns = archiver_client.epoch_ns(late_time) - 500000000
+
+    def get_arrays(self, pv, start, end, timeout=None):
+        data = super().get_arrays(pv, start, end, timeout)
+        if archiver_client.epoch_ns(end) <= self.late_ns + 500000000 \
+                or not data.times[0] <= self.late_ns <= data.times[-1]:
+            return data
+        index = np.searchsorted(data.times, self.late_ns)
+        return archiver_client.PvSamples(
+            np.insert(data.times, index, self.late_ns),
+            np.insert(data.vals, index, -1.))
+
+
+def test_archPull_incremental_late():
+    scanner = record_scanner.TriggerScan(
+        "localhost",
+        rep_t = datetime.timedelta(seconds=60),
+        incremental = True,
+        fetch_format = "pb",
+    )
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    scanner.arch = late_archive(end)
+    scanner.arch.fetch_format = "pb"
+    scanner.archPull(["A"], end)
+    second = scanner.archPull(["A"], end + datetime.timedelta(seconds=10))
+    # the sample written after the first pull is merged into the window
+    assert second["A"].vals.min() == -1.
+    assert len(second["A"].times) == 62
+    assert (np.diff(second["A"].times) > 0).all()
+
+
+def test_archPull_segments(tmpdir):
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    scanner = record_scanner.TriggerScan(
+        "localhost",
+        rep_t = datetime.timedelta(seconds=60),
+        segment_dir = str(tmpdir),
+        segment_settle = 0,
+    )
+    scanner.arch = counting_archive()
+    scanner.arch.fetch_format = "pb"
+    first = scanner.archPull(["A"], end)
+    # a restarted engine finds the stored samples
+    scanner = record_scanner.TriggerScan(
+        "localhost",
+        rep_t = datetime.timedelta(seconds=60),
+        segment_dir = str(tmpdir),
+        segment_settle = 0,
+    )
+    scanner.arch = counting_archive()
+    scanner.arch.fetch_format = "pb"
+    second = scanner.archPull(["A"], end + datetime.timedelta(seconds=10),
+        start_time = end - datetime.timedelta(seconds=120))
+    assert scanner.arch.requests == [
+        (end - datetime.timedelta(seconds=120),
+         end - datetime.timedelta(seconds=60)),
+        (end, end + datetime.timedelta(seconds=10)),
+    ]
+    assert len(first["A"].times) == 61
+    assert len(second["A"].times) == 131
+    assert (np.diff(second["A"].times) == 1000000000).all()
+
+
+def test_archPull_segments_settle(tmpdir):
+    # scans as they happen live: the newest settle seconds of each window
+    # aren't settled yet and scans start a little early or late
+    rep_t = datetime.timedelta(seconds=60)
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    scanner = record_scanner.TriggerScan(
+        "localhost",
+        rep_t = rep_t,
+        segment_dir = str(tmpdir),
+    )
+    scanner.arch = counting_archive()
+    scanner.arch.fetch_format = "pb"
+    lookback = datetime.timedelta(hours=1)
+    for scan in range(40):
+        target = end + scan * rep_t
+        scanner.segment_settle = (datetime.datetime.now()
+            - target).total_seconds() + 60 + scan % 3
+        scanner.archPull(["A", "B"], target, lookbacks={"B": lookback})
+    # windows of A are never settled long enough to keep
+    assert not tmpdir.join("A").check()
+    # B's segments touch and get compacted, later scans only ask for the
+    # unsettled minute plus the new one
+    assert len(tmpdir.join("B").listdir()) <= scanner.store.max_segments
+    assert max(end - start for start, end in scanner.arch.requests[2:]) \
+        <= 2 * rep_t + datetime.timedelta(seconds=3)
+
+
+@pytest.mark.timeout(10)
+@pytest.mark.parametrize("needs,requests", [
+    ({'max'}, 3),
+    ({'min', 'max'}, 4),
+    ({'max', 'raw'}, 1),
+])
+def test_archPull_binned(sim_server, needs, requests):
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        rep_t = datetime.timedelta(hours=1),
+        data_port = sim_server.port,
+        fetch_format = "pb",
+        bin_size = 60,
+    )
+    end = datetime.datetime(2017, 8, 10, 12, 0, 30)
+    data = scanner.archPull(["A"], end, reductions={"A": needs})
+    raw = scanner.arch.get_arrays("A", end - scanner.rep_t, end)
+    assert sim_server.sim.request_count == requests + 1
+    if 'raw' in needs:
+        assert len(data["A"].vals) == len(raw.vals)
+    else:
+        assert len(data["A"].vals) < len(raw.vals) / 10
+    assert data["A"].vals.max() == raw.vals.max()
+    if 'min' in needs:
+        assert data["A"].vals.min() == raw.vals.min()
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_binned(engine_db, sim_server):
+    from engine_tools import scan_replay
+    names = scan_replay.populate(6)
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        rep_t = datetime.timedelta(hours=1),
+        data_port = sim_server.port,
+        bin_size = 60,
+    )
+    needs = scanner.pvReductions()
+    assert needs[names[0]] == {'raw'}
+    assert needs[names[1]] == {'min'}
+    assert needs[names[2]] == {'max'}
+    scanner.emailer = scan_replay.RecordingEmailer()
+    binned = scanner.scanTask(datetime.datetime(2017, 8, 10, 12, 0, 30))
+    scanner.bin_size = None
+    raw = scanner.scanTask(datetime.datetime(2017, 8, 10, 12, 0, 30))
+    assert binned.tripped == raw.tripped
+    assert sim_server.sim.binned_count == 4
+
+
+class big_result:
+    """
+    Stand-in for a PV's data keeping count of how many are alive at once
+    """
+    alive = 0
+    peak = 0
+
+    def __init__(self):
+        big_result.alive = big_result.alive + 1
+        big_result.peak = max(big_result.peak, big_result.alive)
+
+    def __del__(self):
+        big_result.alive = big_result.alive - 1
+
+
+class big_archive(slow_archive):
+    def get(self, pv, xarray=True, start=None, end=None, timeout=None):
+        time.sleep(self.delay)
+        return big_result()
+
+
+@pytest.mark.timeout(10)
+def test_archStream_bounded():
+    scanner = record_scanner.TriggerScan("localhost", max_workers=4)
+    scanner.arch = big_archive(.01)
+    big_result.peak = 0
+    names = ["PV:{}".format(i) for i in range(100)]
+    seen = [name for name, data in scanner.archStream(names)]
+    assert sorted(seen) == sorted(names)
+    assert big_result.peak <= 2 * 4 + 1
+    # archPull holds on to every PV
+    big_result.peak = 0
+    data = scanner.archPull(names, datetime.datetime.now())
+    assert list(data) == names
+    assert big_result.peak == 100
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_streaming(engine_db, sim_server):
+    from engine_tools import scan_replay
+    scan_replay.populate(30, triggers_per_pv=2)
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        data_port = sim_server.port,
+        max_workers = 4,
+    )
+    scanner.emailer = scan_replay.RecordingEmailer()
+    target = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    collected = scanner.scanTask(target)
+    scanner.streaming = True
+    streamed = scanner.scanTask(target)
+    assert streamed.tripped
+    assert streamed.tripped == collected.tripped
+
+
+@pytest.mark.timeout(20)
+@pytest.mark.parametrize("streaming", [False, True])
+def test_scanTask_windows(engine_db, sim_server, streaming):
+    from engine_tools import scan_replay
+    from engine_tools import archiver_sim
+    from alert_config_app.models import Trigger
+    scan_replay.populate(1, triggers_per_pv=3)
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    spike = archiver_client.epoch_ns(end - datetime.timedelta(minutes=30))
+    times = np.arange(spike - 3600 * 10 ** 9, spike + 3600 * 10 ** 9,
+        10 ** 9)
+    sim_server.sim.add_series("SIM:PV:0", archiver_sim.RecordedSeries(
+        times, np.where(times == spike, 1000., 0.)))
+    triggers = list(Trigger.objects.order_by('pk'))
+    windows = [None, datetime.timedelta(seconds=10),
+        datetime.timedelta(hours=1)]
+    for trigger, window in zip(triggers, windows):
+        trigger.compare = ">"
+        trigger.value = 500
+        trigger.window = window
+        trigger.save()
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        data_port = sim_server.port,
+        fetch_format = "pb",
+        streaming = streaming,
+    )
+    scanner.emailer = scan_replay.RecordingEmailer()
+    result = scanner.scanTask(end)
+    assert result.tripped == {triggers[2].pk}
+    assert sim_server.sim.request_count == 1
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_stateful(engine_db, sim_server):
+    from engine_tools import scan_replay
+    from alert_config_app.models import Trigger
+    scan_replay.populate(10, triggers_per_pv=3)
+    windows = [None, datetime.timedelta(seconds=30),
+        datetime.timedelta(minutes=3)]
+    for i, trigger in enumerate(Trigger.objects.order_by('pk')):
+        trigger.window = windows[i % 3]
+        trigger.save()
+    scanners = [
+        record_scanner.TriggerScan(
+            sim_server.host,
+            data_port = sim_server.port,
+            stateful = stateful,
+        )
+        for stateful in (False, True)
+    ]
+    for scanner in scanners:
+        scanner.emailer = scan_replay.RecordingEmailer()
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    for scan in range(5):
+        target = end + scan * datetime.timedelta(seconds=20)
+        results = [scanner.scanTask(target) for scanner in scanners]
+        assert results[0].tripped == results[1].tripped
+    assert len(scanners[1].window_states) == 30
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_kinds(engine_db, sim_server):
+    from engine_tools import scan_replay
+    from engine_tools import archiver_sim
+    from alert_config_app.models import Trigger
+    scan_replay.populate(1, triggers_per_pv=4)
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    start = archiver_client.epoch_ns(end - datetime.timedelta(minutes=10))
+    times = np.arange(start - 3600 * 10 ** 9, start + 3600 * 10 ** 9,
+        10 ** 9)
+    # a plateau of 15 s at 1000, longer than the dwell of the last window
+    plateau = (times >= start) & (times < start + 15 * 10 ** 9)
+    sim_server.sim.add_series("SIM:PV:0", archiver_sim.RecordedSeries(
+        times, np.where(plateau, 1000., 0.)))
+    kinds = [
+        ("rate", None, None),
+        ("hysteresis", 100., None),
+        ("dwell", None, datetime.timedelta(seconds=10)),
+        ("dwell", None, datetime.timedelta(seconds=20)),
+    ]
+    triggers = list(Trigger.objects.order_by('pk'))
+    for trigger, (kind, deadband, dwell) in zip(triggers, kinds):
+        trigger.compare = ">"
+        trigger.value = 500
+        trigger.window = datetime.timedelta(minutes=20)
+        trigger.kind = kind
+        trigger.deadband = deadband
+        trigger.dwell = dwell
+        trigger.save()
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        data_port = sim_server.port,
+    )
+    scanner.emailer = scan_replay.RecordingEmailer()
+    result = scanner.scanTask(end)
+    assert result.tripped == set(t.pk for t in triggers[:3])
+    # the next scan only sees the new samples, the plateau is over
+    result = scanner.scanTask(end + datetime.timedelta(minutes=1))
+    assert result.tripped == set()
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_skip_unchanged(engine_db, sim_server):
+    from engine_tools import scan_replay
+    from engine_tools import archiver_sim
+    from alert_config_app.models import Trigger
+    scan_replay.populate(2)
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    # SIM:PV:0 stopped changing an hour before the scans, SIM:PV:1 is the
+    # synthetic wave still being sampled now
+    last = archiver_client.epoch_ns(end - datetime.timedelta(hours=1))
+    sim_server.sim.add_series("SIM:PV:0", archiver_sim.RecordedSeries(
+        [last - 10 ** 9, last], [0., 1000.]))
+    trigger = Trigger.objects.get(pv__name="SIM:PV:0")
+    trigger.compare = ">"
+    trigger.value = 500
+    trigger.save()
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        data_port = sim_server.port,
+        mgmt_port = sim_server.port,
+        skip_unchanged = True,
+    )
+    scanner.emailer = scan_replay.RecordingEmailer()
+    first = scanner.scanTask(end)
+    assert trigger.pk in first.tripped
+    assert sim_server.sim.request_count == 2
+    second = scanner.scanTask(end + scanner.rep_t)
+    assert second.tripped == first.tripped
+    assert sim_server.sim.status_count == 1
+    assert sim_server.sim.request_count == 3
+    # a changed trigger invalidates the previous result
+    trigger.value = 5000
+    trigger.save()
+    third = scanner.scanTask(end + 2 * scanner.rep_t)
+    assert trigger.pk not in third.tripped
+    assert sim_server.sim.request_count == 5
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_skip_unchanged_subsecond(engine_db, sim_server):
+    from engine_tools import scan_replay
+    from engine_tools import archiver_sim
+    from alert_config_app.models import Trigger
+    scan_replay.populate(1)
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0, 700000)
+    # the last sample lands 0.2 s into the first window, lastEvent only has
+    # whole seconds and reads as before the window
+    start = archiver_client.epoch_ns(end - datetime.timedelta(seconds=60))
+    sim_server.sim.add_series("SIM:PV:0", archiver_sim.RecordedSeries(
+        [start - 10 ** 10, start + 2 * 10 ** 8], [1000., 0.]))
+    trigger = Trigger.objects.get(pv__name="SIM:PV:0")
+    trigger.compare = ">"
+    trigger.value = 500
+    trigger.save()
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        data_port = sim_server.port,
+        mgmt_port = sim_server.port,
+        skip_unchanged = True,
+    )
+    scanner.emailer = scan_replay.RecordingEmailer()
+    first = scanner.scanTask(end)
+    assert trigger.pk in first.tripped
+    # the window now only holds the 0 carried forward
+    second = scanner.scanTask(end + scanner.rep_t)
+    assert trigger.pk not in second.tripped
+    assert sim_server.sim.status_count == 1
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_skip_unchanged_dwell(engine_db, sim_server):
+    from engine_tools import scan_replay
+    from engine_tools import archiver_sim
+    from alert_config_app.models import Trigger
+    scan_replay.populate(1)
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    # the PV stepped past the value 90 s before the first scan and stayed
+    step = archiver_client.epoch_ns(end - datetime.timedelta(seconds=90))
+    sim_server.sim.add_series("SIM:PV:0", archiver_sim.RecordedSeries(
+        [step - 10 ** 9, step], [0., 10.]))
+    trigger = Trigger.objects.get()
+    trigger.compare = ">"
+    trigger.value = 5
+    trigger.kind = "dwell"
+    trigger.dwell = datetime.timedelta(minutes=5)
+    trigger.save()
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        data_port = sim_server.port,
+        mgmt_port = sim_server.port,
+        skip_unchanged = True,
+    )
+    scanner.emailer = scan_replay.RecordingEmailer()
+    tripped = [bool(scanner.scanTask(end + scan * scanner.rep_t).tripped)
+        for scan in range(6)]
+    assert tripped == [False] * 4 + [True] * 2
+    assert sim_server.sim.status_count == 0
+
+
+TRANSACTION_SQL = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK', 'COMMIT')
+
+
+def scan_queries(sim_server, pv_count, triggers_per_pv, **kwargs):
+    """
+    Queries made by one scan of a configuration where every trigger trips
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from engine_tools import scan_replay
+    from alert_config_app.models import Trigger
+    scan_replay.populate(pv_count, triggers_per_pv=triggers_per_pv)
+    Trigger.objects.update(compare=">", value=-1000)
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        data_port = sim_server.port,
+        mgmt_port = sim_server.port,
+        **kwargs
+    )
+    scanner.emailer = scan_replay.RecordingEmailer()
+    with CaptureQueriesContext(connection) as queries:
+        result = scanner.scanTask(datetime.datetime(2017, 8, 10, 12, 0, 0))
+    assert len(result.tripped) == pv_count * triggers_per_pv
+    assert len(scanner.emailer.sent) == (pv_count + 9) // 10
+    # whether transaction statements show up depends on the Django version
+    return len([query for query in queries
+        if not query['sql'].upper().startswith(TRANSACTION_SQL)])
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_snapshot(engine_db, sim_server):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from engine_tools import scan_replay
+    from alert_config_app.models import Trigger, ConfigChange
+    scan_replay.populate(5)
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        data_port = sim_server.port,
+    )
+    scanner.emailer = scan_replay.RecordingEmailer()
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    first = scanner.scanTask(end)
+    snapshot = scanner.snapshot
+    with CaptureQueriesContext(connection) as queries:
+        second = scanner.scanTask(end)
+    # only the change log is read, nothing trips
+    assert second.tripped == first.tripped == set()
+    assert len(queries) == 1
+    assert scanner.snapshot is snapshot
+    triggers = list(Trigger.objects.order_by('pk'))
+    triggers[0].compare = ">"
+    triggers[0].value = -1000
+    triggers[0].save()
+    triggers[1].delete()
+    third = scanner.scanTask(end)
+    assert third.tripped == {triggers[0].pk}
+    assert scanner.snapshot is not snapshot
+    assert sorted(scanner.snapshot.records) \
+        == [t.pk for t in triggers if t is not triggers[1]]
+    # the untouched PVs keep their threshold indexes
+    for name in ("SIM:PV:2", "SIM:PV:3"):
+        assert scanner.snapshot.table.indexes[name] \
+            is snapshot.table.indexes[name]
+    # applied entries past the retention are pruned with the next change
+    ConfigChange.objects.update(time=datetime.datetime(2017, 8, 1,
+        tzinfo=datetime.timezone.utc))
+    triggers[2].save()
+    scanner.scanTask(end)
+    assert list(ConfigChange.objects.values_list('pk', flat=True)) \
+        == [ConfigChange.latest()]
+
+
+@pytest.mark.timeout(20)
+@pytest.mark.parametrize("pv_count,triggers_per_pv", [(3, 1), (40, 3)])
+@pytest.mark.parametrize("kwargs", [{}, {"streaming": True},
+    {"bin_size": 60}, {"skip_unchanged": True}])
+def test_scanTask_query_count(engine_db, sim_server, pv_count,
+        triggers_per_pv, kwargs):
+    # the config version, the trigger table, the alerts, their subscribers
+    # and tripped triggers, and the last_sent update
+    assert scan_queries(sim_server, pv_count, triggers_per_pv, **kwargs) \
+        == 6
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_last_sent(engine_db, sim_server):
+    from django.utils import timezone
+    from alert_config_app.models import Alert
+    scan_queries(sim_server, 20, 1)
+    target = timezone.make_aware(datetime.datetime(2017, 8, 10, 12, 0, 0))
+    assert Alert.objects.count() == 2
+    for alert in Alert.objects.all():
+        assert alert.last_sent == target
+
+
+@pytest.mark.timeout(20)
+def test_archPull_chunked(sim_server):
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        rep_t = datetime.timedelta(hours=2),
+        data_port = sim_server.port,
+        max_workers = 4,
+        fetch_format = "pb",
+        chunk_samples = 610,
+        initial_chunk = 1800,
+    )
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0, 500000)
+    whole = scanner.arch.get_arrays("A", end - scanner.rep_t, end)
+    # the first pull doesn't know the sample rate yet
+    first = scanner.archPull(["A"], end)
+    assert sim_server.sim.request_count == 1 + 4
+    assert scanner.sample_rates["A"] == pytest.approx(1, rel=.01)
+    second = scanner.archPull(["A"], end)
+    assert sim_server.sim.request_count == 1 + 4 + 12
+    for data in (first, second):
+        assert (data["A"].times == whole.times).all()
+        assert (data["A"].vals == whole.vals).all()
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_replay(engine_db, sim_server):
+    from engine_tools import scan_replay
+    scan_replay.populate(50, triggers_per_pv=2)
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        data_port = sim_server.port,
+        max_workers = 8,
+    )
+    scanner.emailer = scan_replay.RecordingEmailer()
+    timings = scan_replay.replay(scanner, scans=2)
+    assert len(timings) == 2
+    assert sim_server.sim.request_count == 100
+    assert scanner.emailer.sent, "no alert was sent"
+
+
+class flaky_archive(slow_archive):
+    """
+    Stand-in for the archiver that fails for the listed PVs
+    """
+    def __init__(self, broken):
+        super().__init__(0)
+        self.broken = broken
+
+    def get(self, pv, xarray=True, start=None, end=None, timeout=None):
+        if pv in self.broken:
+            raise requests.ConnectionError("unreachable")
+        return super().get(pv, xarray, start, end, timeout)
+
+
+def test_archPull_partial():
+    scanner = record_scanner.TriggerScan("localhost", retries=1, backoff=0)
+    scanner.arch = flaky_archive({"B"})
+    failures = {}
+    data = scanner.archPull(["A", "B", "C"], datetime.datetime.now(),
+        failures=failures)
+    assert list(data) == ["A", "C"]
+    assert list(failures) == ["B"]
+    assert scanner.arch.requested.count("B") == 0
+
+
+@pytest.mark.timeout(10)
+def test_archPull_deadline(sim_server):
+    sim_server.sim.latency = .5
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        rep_t = datetime.timedelta(seconds=1),
+        data_port = sim_server.port,
+        deadline_fraction = .3,
+    )
+    failures = {}
+    start = time.time()
+    data = scanner.archPull(["A", "B"], datetime.datetime.now(),
+        failures=failures)
+    assert time.time() - start < 1
+    assert data == {}
+    assert set(failures) == {"A", "B"}
+
+
+@pytest.mark.timeout(20)
+def test_scanTask_partial(engine_db, sim_server):
+    from engine_tools import scan_replay
+    names = scan_replay.populate(10)
+    scanner = record_scanner.TriggerScan(
+        sim_server.host,
+        data_port = sim_server.port,
+    )
+    scanner.emailer = scan_replay.RecordingEmailer()
+    sim_server.sim.error_rate = .5
+    result = scanner.scanTask()
+    assert result.failed, "no PV failed"
+    assert len(result.failed) < len(names), "every PV failed"
@@ -0,0 +1,73 @@
+import pytest
+import time
+import requests
+
+from engine_tools import resilience
+
+
+class flaky:
+    def __init__(self, failures, exc=requests.ConnectionError):
+        self.failures = failures
+        self.exc = exc
+        self.calls = 0
+
+    def __call__(self, timeout):
+        self.calls = self.calls + 1
+        if self.calls <= self.failures:
+            raise self.exc("failure {}".format(self.calls))
+        return "ok"
+
+
+def test_retry_succeeds():
+    func = flaky(2)
+    assert resilience.call_with_retries(func, retries=2, backoff=0) == "ok"
+    assert func.calls == 3
+
+
+def test_retries_exhausted():
+    func = flaky(5)
+    with pytest.raises(requests.ConnectionError):
+        resilience.call_with_retries(func, retries=2, backoff=0)
+    assert func.calls == 3
+
+
+def test_no_retry_on_client_error():
+    func = flaky(1, ValueError)
+    with pytest.raises(ValueError):
+        resilience.call_with_retries(func, retries=2, backoff=0)
+    assert func.calls == 1
+
+
+def test_deadline():
+    func = flaky(5)
+    with pytest.raises(resilience.DeadlineExceeded):
+        resilience.call_with_retries(func, deadline=time.monotonic() + .1,
+            retries=10, backoff=.2)
+    with pytest.raises(resilience.DeadlineExceeded):
+        resilience.call_with_retries(func, deadline=time.monotonic() - 1)
+
+
+def test_breaker_opens_and_recovers():
+    breaker = resilience.CircuitBreaker(failure_threshold=2, reset_timeout=.1)
+    for i in range(2):
+        with pytest.raises(requests.ConnectionError):
+            resilience.call_with_retries(flaky(1), breaker=breaker)
+    assert breaker.state == 'open'
+    func = flaky(0)
+    with pytest.raises(resilience.CircuitOpen):
+        resilience.call_with_retries(func, breaker=breaker)
+    assert func.calls == 0
+    time.sleep(.15)
+    assert breaker.state == 'half-open'
+    assert resilience.call_with_retries(func, breaker=breaker) == "ok"
+    assert breaker.state == 'closed'
+
+
+def test_breaker_failed_trial_reopens():
+    breaker = resilience.CircuitBreaker(failure_threshold=1, reset_timeout=.1)
+    breaker.record_failure()
+    time.sleep(.15)
+    assert breaker.allow()
+    assert not breaker.allow(), "second trial let through"
+    breaker.record_failure()
+    assert breaker.state == 'open'
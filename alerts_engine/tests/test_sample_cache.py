@@ -0,0 +1,54 @@
+import numpy as np
+
+from engine_tools import sample_cache
+
+
+def test_extend_and_window():
+    buf = sample_cache.RingBuffer(4)
+    buf.extend(np.array([10, 20, 30]), np.array([1., 2., 3.]))
+    times, vals = buf.window(15, 30)
+    # newest sample at or before the start is kept, like the archiver
+    assert list(times) == [10, 20, 30]
+    assert list(vals) == [1., 2., 3.]
+
+
+def test_overlapping_samples_merged():
+    buf = sample_cache.RingBuffer(4)
+    buf.extend(np.array([10, 20]), np.array([1., 2.]))
+    buf.extend(np.array([20, 30, 40]), np.array([2., 3., 4.]))
+    assert len(buf) == 4
+    assert buf.last_time == 40
+    # a sample written late lands between the stored ones
+    buf.extend(np.array([25, 30, 40, 50]), np.array([9., 3., 4., 5.]))
+    times, vals = buf.window(0, 100)
+    assert list(times) == [10, 20, 25, 30, 40, 50]
+    assert list(vals) == [1., 2., 9., 3., 4., 5.]
+
+
+def test_wraparound_is_contiguous():
+    buf = sample_cache.RingBuffer(4)
+    for i in range(10):
+        buf.extend(np.array([i]), np.array([float(i)]))
+        buf.evict(i - 2)
+    times, vals = buf.window(0, 100)
+    assert list(times) == [7, 8, 9]
+    assert list(vals) == [7., 8., 9.]
+    assert buf.capacity == 4, "buffer grew despite eviction"
+    # windows are views into the buffer, not copies
+    assert np.shares_memory(vals, buf.vals)
+
+
+def test_grow():
+    buf = sample_cache.RingBuffer(2)
+    buf.extend(np.arange(5), np.arange(5, dtype=float))
+    assert buf.capacity >= 5
+    times, vals = buf.window(0, 4)
+    assert list(vals) == [0., 1., 2., 3., 4.]
+
+
+def test_cache_buffers():
+    cache = sample_cache.SampleCache(16)
+    assert "PV" not in cache
+    assert cache.buffer("PV") is cache.buffer("PV")
+    cache.discard("PV")
+    assert "PV" not in cache
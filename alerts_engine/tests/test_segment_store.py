@@ -0,0 +1,57 @@
+import numpy as np
+
+from engine_tools import segment_store
+
+
+def samples(first, last):
+    times = np.arange(first, last + 1, dtype=np.int64)
+    return times, times.astype(float)
+
+
+def test_missing(tmpdir):
+    store = segment_store.SegmentStore(str(tmpdir))
+    assert store.missing("A", 0, 100) == [(0, 100)]
+    store.write("A", 10, 20, *samples(9, 20))
+    store.write("A", 40, 50, *samples(39, 50))
+    assert store.missing("A", 0, 100) == [(0, 10), (20, 40), (50, 100)]
+    assert store.missing("A", 12, 18) == []
+    assert store.missing("A", 15, 45) == [(20, 40)]
+
+
+def test_read(tmpdir):
+    store = segment_store.SegmentStore(str(tmpdir))
+    store.write("A", 10, 20, *samples(9, 20))
+    store.write("A", 20, 30, *samples(19, 30))
+    times, vals = store.read("A", 15, 25)
+    assert list(times) == list(range(15, 26))
+    assert list(vals) == list(range(15, 26))
+    # without a sample at start the newest one before it is included
+    times, vals = store.read("A", 14.5, 25)
+    assert list(times) == list(range(14, 26))
+
+
+def test_persistent(tmpdir):
+    store = segment_store.SegmentStore(str(tmpdir))
+    store.write("SIM:PV/0", 10, 20, *samples(9, 20))
+    again = segment_store.SegmentStore(str(tmpdir))
+    assert again.segments("SIM:PV/0") == [(10, 20)]
+    assert list(again.read("SIM:PV/0", 20, 20)[0]) == [20]
+
+
+def test_compact(tmpdir):
+    store = segment_store.SegmentStore(str(tmpdir), max_segments=3)
+    for i in range(4):
+        store.write("A", i * 10, i * 10 + 10, *samples(i * 10, i * 10 + 10))
+    store.write("A", 100, 110, *samples(100, 110))
+    assert store.segments("A") == [(0, 40), (100, 110)]
+    times, vals = store.read("A", 0, 40)
+    assert list(times) == list(range(41))
+    assert len(tmpdir.join("A").listdir()) == 2
+
+
+def test_prune(tmpdir):
+    store = segment_store.SegmentStore(str(tmpdir))
+    store.write("A", 10, 20, *samples(9, 20))
+    store.write("A", 30, 40, *samples(29, 40))
+    store.prune("A", 25)
+    assert store.segments("A") == [(30, 40)]
@@ -0,0 +1,13 @@
+import pytest
+
+from engine_tools import startup_profile
+from engine_tools import django_connect
+
+
+@pytest.mark.timeout(30)
+def test_engine_settings():
+    result = startup_profile.profile(django_connect.ENGINE_SETTINGS, 100)
+    # no query log, nothing written at import, only the apps the models need
+    assert result['kept'] == 0
+    assert result['files'] == []
+    assert result['apps'] == 4
@@ -0,0 +1,103 @@
+import pytest
+import numpy as np
+
+from engine_tools import trigger_kinds
+
+
+def stream(seed, count=400):
+    rng = np.random.RandomState(seed)
+    times = np.cumsum(rng.randint(1, 4, count)).astype(np.int64) * 10 ** 9
+    vals = rng.randint(0, 10, count).astype(np.float64)
+    vals[rng.rand(count) < 0.05] = np.nan
+    return times, vals
+
+
+def scans(times, seed):
+    # the stream cut into consecutive scans, some of them empty
+    rng = np.random.RandomState(seed)
+    ends = np.sort(rng.choice(np.arange(len(times)), 40, replace=False))
+    start = 0
+    for end in list(ends) + [len(times)]:
+        yield start, end
+        start = end
+
+
+@pytest.mark.parametrize("compare", ['>', '<='])
+def test_rate(compare):
+    times, vals = stream(1)
+    finite = ~np.isnan(vals)
+    slopes = np.diff(vals[finite]) / (np.diff(times[finite]) / 1e9)
+    # slope i ends at the (i + 1)th finite sample
+    ends = np.flatnonzero(finite)[1:]
+    carry = None
+    for start, end in scans(times, 1):
+        tripped, carry = trigger_kinds.rate(times[:end], vals[:end],
+            compare, 2., carry)
+        inside = (ends >= start) & (ends < end)
+        assert tripped \
+            == trigger_kinds.holds(compare, slopes[inside], 2.).any()
+
+
+@pytest.mark.parametrize("compare,deadband", [('>', 3.), ('<=', 2.),
+    ('>=', None)])
+def test_hysteresis(compare, deadband):
+    times, vals = stream(2)
+    latched = []
+    state = False
+    for v in vals:
+        if trigger_kinds.holds(compare, np.array([v]), 5.)[0]:
+            state = True
+        elif compare in ('>', '>=') and v < 5. - (deadband or 0.):
+            state = False
+        elif compare in ('<', '<=') and v > 5. + (deadband or 0.):
+            state = False
+        latched.append(state)
+    latched = np.array(latched)
+    carry = None
+    for start, end in scans(times, 2):
+        tripped, carry = trigger_kinds.hysteresis(times[:end], vals[:end],
+            compare, 5., deadband, carry)
+        if end > start:
+            assert tripped == latched[start:end].any()
+            assert carry.since == latched[end - 1]
+    # chattering around the value latches once and stays latched
+    times = np.arange(6, dtype=np.int64)
+    tripped, carry = trigger_kinds.hysteresis(times,
+        np.array([4., 6., 4.5, 5.5, 4.2, 5.1]), '>', 5., 1.)
+    assert tripped and carry.since
+    tripped, carry = trigger_kinds.hysteresis(np.arange(6, 8),
+        np.array([4.5, 3.5]), '>', 5., 1., carry)
+    assert tripped and not carry.since
+
+
+def test_dwell():
+    times, vals = stream(3)
+    dwell_ns = 6 * 10 ** 9
+    carry = None
+    for start, end in scans(times, 3):
+        if end == start:
+            continue
+        end_ns = times[end] if end < len(times) else times[-1] + 10 ** 9
+        tripped, carry = trigger_kinds.dwell(times[:end], vals[:end], '>',
+            3., dwell_ns, end_ns, carry)
+        expected = False
+        run = None
+        for i in range(end):
+            if vals[i] > 3.:
+                if run == None:
+                    run = times[i]
+                until = times[i + 1] if i + 1 < end else end_ns
+                if i >= start - 1 and until - run >= dwell_ns:
+                    expected = True
+            else:
+                run = None
+        assert tripped == expected
+        assert carry.since == run
+    # a run that keeps holding trips without new samples
+    times = np.array([0, 10 ** 9], dtype=np.int64)
+    tripped, carry = trigger_kinds.dwell(times, np.array([1., 5.]), '>', 3.,
+        dwell_ns, 2 * 10 ** 9)
+    assert not tripped
+    tripped, carry = trigger_kinds.dwell(times, np.array([1., 5.]), '>', 3.,
+        dwell_ns, 8 * 10 ** 9, carry)
+    assert tripped
@@ -0,0 +1,244 @@
+import pytest
+import datetime
+import operator
+import numpy as np
+
+from engine_tools import trigger_table
+from engine_tools import fetch_planner
+from engine_tools import archiver_client
+
+OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt,
+             '>=': operator.ge}
+
+
+def reference(compare, value, vals):
+    # a comparison of one trigger against its whole window, the way scans
+    # evaluated triggers before TriggerTable
+    if compare == None or value == None or len(vals) == 0:
+        return False
+    finite = vals[~np.isnan(vals)]
+    if compare == "==":
+        return bool(np.any(vals == value))
+    if compare == "!=":
+        return bool(np.any(vals != value))
+    if len(finite) == 0:
+        return False
+    if compare in ("<", "<="):
+        return OPERATORS[compare](finite.min(), value)
+    return OPERATORS[compare](finite.max(), value)
+
+
+def test_matches_compare():
+    # every comparator against windows with duplicates, nan, a constant
+    # value and no samples, checked against the per trigger reference
+    windows = {
+        "A": np.array([1., 2., 3., 2.]),
+        "B": np.array([2., np.nan, 4.]),
+        "C": np.array([2., 2.]),
+        "D": np.array([np.nan]),
+        "E": np.array([]),
+    }
+    rows = []
+    for name in windows:
+        for compare in trigger_table.OPS:
+            for value in [1., 2., 3., 4., 5.]:
+                rows.append((len(rows), name, compare, value, None, 0))
+    table = trigger_table.TriggerTable(rows)
+    for name, vals in windows.items():
+        times = np.arange(len(vals), dtype=np.int64)
+        table.reduce(name, archiver_client.PvSamples(times, vals))
+    tripped = table.tripped(table.evaluate())
+    for pk, name, compare, value, window, alert in rows:
+        expected = reference(compare, value, windows[name])
+        assert (pk in tripped) == expected, (name, compare, value)
+
+
+@pytest.mark.parametrize("compare,value,expected", [
+    ("==", 2, True),
+    ("==", 5, False),
+    ("<=", 1, True),
+    ("<", 1, False),
+    (">=", 3, True),
+    (">", 3, False),
+    ("!=", 2, True),
+    (None, 2, False),
+])
+def test_layouts(compare, value, expected):
+    times = np.arange(3, dtype=np.int64)
+    vals = np.array([1., 2., 3.])
+    for data in (archiver_client.PvSamples(times, vals),
+                 archiver_client.arrays_to_xarray("A", times, vals)):
+        table = trigger_table.TriggerTable([(1, "A", compare, value, None, 0)])
+        table.reduce("A", data)
+        assert (1 in table.tripped(table.evaluate())) == expected
+
+def test_incomplete_triggers():
+    table = trigger_table.TriggerTable([
+        (1, "A", None, 1., None, 0),
+        (2, "A", ">", None, None, 0),
+        (3, None, ">", 1., None, 0),
+        (4, "A", ">", 1., None, 0),
+    ])
+    assert len(table) == 1
+    assert len(table.signature("A")) == 3
+    table.reduce("A", archiver_client.PvSamples(
+        np.arange(2, dtype=np.int64), np.array([0., 2.])))
+    assert table.tripped(table.evaluate()) == {4}
+
+
+def test_windows():
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    end_ns = archiver_client.epoch_ns(end)
+    minute = datetime.timedelta(minutes=1)
+    plan = fetch_planner.FetchPlan(minute, [("A", None), ("A", 10 * minute)])
+    table = trigger_table.TriggerTable([
+        (1, "A", ">", 5., None, 10),
+        (2, "A", ">", 5., 10 * minute, 20),
+        (3, "B", ">", 5., None, 30),
+    ])
+    # a spike five minutes back is only inside the longer window
+    times = end_ns - np.array([600, 300, 90, 30, 0], dtype=np.int64) \
+        * 10 ** 9
+    table.reduce("A", archiver_client.PvSamples(times,
+        np.array([0., 9., 0., 0., 0.])), plan, end)
+    mask = table.evaluate()
+    assert table.tripped(mask) == {2}
+    assert table.tripped(mask, "B") == set()
+    assert table.alerts({2, 3}) == {20, 30}
+    table.reset()
+    assert table.tripped(table.evaluate()) == set()
+
+
+def test_threshold_index():
+    rng = np.random.RandomState(0)
+    values = rng.randint(0, 50, 400).astype(float)
+    compares = [trigger_table.RANGE_OPS[i % 4] for i in range(400)]
+    rows = [(pk, "A", compares[pk], values[pk], None, 0)
+        for pk in range(400)]
+    table = trigger_table.TriggerTable(rows)
+    table.reduce("A", archiver_client.PvSamples(
+        np.arange(3, dtype=np.int64), np.array([20., 25., 30.])))
+    tripped = table.tripped(table.evaluate())
+    expected = set(pk for pk in range(400) if (
+        compares[pk] == '<' and 20 < values[pk]
+        or compares[pk] == '<=' and 20 <= values[pk]
+        or compares[pk] == '>' and 30 > values[pk]
+        or compares[pk] == '>=' and 30 >= values[pk]))
+    assert tripped == expected
+
+
+def test_threshold_index_reuse():
+    indexes = {}
+    rows = [
+        (1, "A", ">", 5., None, 0),
+        (2, "B", "<", 5., None, 0),
+        (3, "C", "==", 5., None, 0),
+    ]
+    trigger_table.TriggerTable(rows, indexes)
+    assert sorted(indexes) == ["A", "B"]
+    index_a = indexes["A"]
+    index_b = indexes["B"]
+    rows[1] = (2, "B", "<", 6., None, 0)
+    trigger_table.TriggerTable(rows[:2], indexes)
+    # only the changed PV is rebuilt
+    assert indexes["A"] is index_a
+    assert indexes["B"] is not index_b
+    trigger_table.TriggerTable(rows[1:], indexes)
+    assert sorted(indexes) == ["B"]
+
+
+def test_shared_conditions():
+    # the same conditions repeated across three alerts
+    rows = []
+    for alert in range(3):
+        for compare, value in [("==", 2.), ("!=", 2.), (">", 1.), ("<", 0.)]:
+            rows.append((len(rows), "A", compare, value, None, alert))
+    table = trigger_table.TriggerTable(rows)
+    assert len(table) == 12
+    assert table.n_conditions == 4
+    table.reduce("A", archiver_client.PvSamples(
+        np.arange(2, dtype=np.int64), np.array([2., 3.])))
+    mask = table.evaluate()
+    tripped = table.tripped(mask)
+    assert tripped == set(pk for pk, name, compare, value, window, alert
+        in rows if compare != "<")
+    assert table.alerts(tripped) == {0, 1, 2}
+
+
+def test_reduce_states():
+    # consecutive scans of a moving window, folded against reduced whole
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    minute = datetime.timedelta(minutes=1)
+    rows = []
+    for compare in trigger_table.OPS:
+        for value in [0., 3., 7.]:
+            for window in [None, 5 * minute]:
+                rows.append((len(rows), "A", compare, value, window, 0))
+    plan = fetch_planner.FetchPlan(minute, [(r[1], r[4]) for r in rows])
+    rng = np.random.RandomState(5)
+    times = archiver_client.epoch_ns(end) + np.arange(0, 3600, 7,
+        dtype=np.int64) * 10 ** 9
+    vals = rng.randint(0, 8, len(times)).astype(np.float64)
+    vals[::13] = np.nan
+    states = {}
+    folded = trigger_table.TriggerTable(rows)
+    whole = trigger_table.TriggerTable(rows)
+    for scan in range(1, 50):
+        scan_end = end + scan * minute
+        end_ns = archiver_client.epoch_ns(scan_end)
+        lo = np.searchsorted(times, end_ns - 5 * 60 * 10 ** 9)
+        hi = np.searchsorted(times, end_ns, side='right')
+        data = archiver_client.PvSamples(times[lo:hi], vals[lo:hi])
+        folded.reset()
+        whole.reset()
+        folded.reduce("A", data, plan, scan_end, states)
+        whole.reduce("A", data, plan, scan_end)
+        assert folded.tripped(folded.evaluate()) \
+            == whole.tripped(whole.evaluate())
+    assert set(states) == set(folded.views)
+
+
+def test_trigger_kinds():
+    from engine_tools import config_snapshot
+    second = 10 ** 9
+    end = datetime.datetime(2017, 8, 10, 12, 0, 0)
+    end_ns = archiver_client.epoch_ns(end)
+    rows = [
+        (1, "A", ">", 5., None, 10, 1),
+        (2, "A", ">", 1., None, 20, 1, "rate", None, None),
+        (3, "A", ">", 5., None, 30, 1, "hysteresis", 2., None),
+        (4, "A", ">", 5., None, 40, 1, "dwell", None,
+            datetime.timedelta(seconds=20)),
+        # rate triggers can't use ==, dwell triggers need a dwell time
+        (5, "A", "==", 5., None, 50, 1, "rate", None, None),
+        (6, "A", ">", 5., None, 60, 1, "dwell", None, None),
+    ]
+    snapshot = config_snapshot.ConfigSnapshot(1, rows)
+    table = snapshot.table
+    assert len(table) == 4
+    assert sorted(table.carry) == [2, 3, 4]
+    assert set(table.rows()) == {("A", ">", None), ("A", "rate", None),
+        ("A", "hysteresis", None), ("A", "dwell", None)}
+
+    def scan(offsets, vals):
+        table.reset()
+        table.reduce("A", archiver_client.PvSamples(
+            end_ns + np.array(offsets, dtype=np.int64) * second,
+            np.array(vals)))
+        return table.tripped(table.evaluate())
+
+    # a jump of 3 in a second, then above 5 for 10 s
+    assert scan([0, 1, 2, 12], [2., 5., 6., 6.]) == {1, 2, 3}
+    # slowly back down inside the deadband, no level trip, still latched;
+    # the run above 5 ended before it lasted 20 s
+    assert scan([13, 15, 19], [5., 4., 3.5]) == {3}
+    assert scan([25, 60], [7., 7.]) == {1, 3, 4}
+    # the carry moves on to a patched snapshot
+    patched = snapshot.patched(2, [('trigger', 1)],
+        lambda *pks: [(1, "A", ">", 50., None, 10, 1)])
+    assert patched.table.carry[3] == table.carry[3]
+    assert patched.table.carry is not table.carry
+    table = patched.table
+    # the run held from 25 s until the sample at 61 s
+    assert scan([61], [1.]) == {4}
+    assert scan([62], [1.]) == set()
@@ -0,0 +1,68 @@
+import pytest
+import numpy as np
+
+from engine_tools import window_state
+
+
+def check(state, times, vals):
+    assert state.count == len(vals)
+    nans = np.isnan(vals)
+    assert state.n_nan == nans.sum()
+    finite = vals[~nans]
+    if len(finite):
+        assert state.min == finite.min()
+        assert state.max == finite.max()
+        assert state.total == pytest.approx(finite.sum())
+    else:
+        assert np.isnan(state.min) and np.isnan(state.max)
+    if state.track_values:
+        assert sorted(state.distinct()) == sorted(set(finite.tolist()))
+
+
+def test_sliding():
+    # a stream scanned with overlapping windows of varying length against
+    # a fresh reduction of every window
+    rng = np.random.RandomState(3)
+    times = np.cumsum(rng.randint(1, 5, 2000)).astype(np.int64)
+    vals = rng.randint(0, 20, 2000).astype(np.float64)
+    vals[rng.rand(2000) < 0.05] = np.nan
+    state = window_state.WindowState(track_values=True)
+    end = 0
+    for step in range(200):
+        end = end + rng.randint(0, 40)
+        length = rng.randint(1, 150)
+        lo = np.searchsorted(times, end - length, side='left')
+        hi = np.searchsorted(times, end, side='right')
+        state.fold(times[lo:hi], vals[lo:hi])
+        check(state, times[lo:hi], vals[lo:hi])
+
+
+def test_fold_only_new():
+    state = window_state.WindowState()
+    times = np.arange(10, dtype=np.int64)
+    vals = np.array([5., 1., 4., 2., 3., 9., 0., 8., 7., 6.])
+    state.fold(times[:6], vals[:6])
+    assert (state.min, state.max) == (1., 9.)
+    chunks = len(state.chunks)
+    # nothing new, nothing is added
+    state.fold(times[2:6], vals[2:6])
+    assert len(state.chunks) == chunks
+    assert (state.min, state.max) == (2., 9.)
+    assert state.mean == pytest.approx(np.mean(vals[2:6]))
+    state.fold(times[6:], vals[6:])
+    assert (state.min, state.max, len(state)) == (0., 8., 4)
+    # the deques only hold candidates that can still win
+    assert [v for t, v in state.max_deque] == [8., 7., 6.]
+    assert [v for t, v in state.min_deque] == [0., 6.]
+
+
+def test_rebuild():
+    state = window_state.WindowState()
+    times = np.arange(10, dtype=np.int64)
+    vals = np.arange(10, dtype=np.float64)
+    state.fold(times[5:], vals[5:])
+    # an earlier window than the folded one
+    state.fold(times[:4], vals[:4])
+    check(state, times[:4], vals[:4])
+    state.fold(times[:0], vals[:0])
+    assert len(state) == 0 and state.total == 0.
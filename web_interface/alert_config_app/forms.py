@@ -12,6 +12,8 @@ ____
 
 """
 
+import datetime
+
 from django import forms
 from .models import Alert, Pv, Trigger#, PVname
 from account_mgr_app.models import Profile
@@ -41,6 +43,19 @@ class configTrigger(forms.Form):
         new_value : forms.FloatField
             Changes to the triggering value can be entered in this field
 
+        new_window : forms.DurationField
+            How far back the trigger looks. Left empty, the engine's scan
+            period is used
+
+        new_kind : forms.ChoiceField
+            What the comparison is applied to, see Trigger
+
+        new_deadband : forms.FloatField
+            Margin a hysteresis trigger's PV must clear to release
+
+        new_dwell : forms.DurationField
+            Time a dwell trigger's comparison must hold
+
     """
     def __init__(self,*args,**kwargs):
         """Constrct the object
@@ -94,6 +109,52 @@ class configTrigger(forms.Form):
 
 
 
+    new_window = forms.DurationField(
+        label = 'Window',
+        required = False,
+        widget = forms.TimeInput(
+            attrs = {
+                'class':'form-control',
+                'type':'text',
+                'placeholder':'hh:mm:ss',
+            }
+        )
+    )
+
+    new_kind = forms.ChoiceField(
+        label = 'Kind',
+        choices = Trigger.kind_choices,
+        initial = 'level',
+        required = False,
+        widget = forms.Select(
+            attrs = {
+                'class':'custom-select',
+            }
+        )
+    )
+
+    new_deadband = forms.FloatField(
+        label = 'Deadband',
+        required = False,
+        widget = forms.NumberInput(
+            attrs = {
+                'class':'form-control',
+            }
+        )
+    )
+
+    new_dwell = forms.DurationField(
+        label = 'Dwell',
+        required = False,
+        widget = forms.TimeInput(
+            attrs = {
+                'class':'form-control',
+                'type':'text',
+                'placeholder':'hh:mm:ss',
+            }
+        )
+    )
+
     def clean_new_name(self):
         data = self.cleaned_data['new_name']
         # print("DATA:",data)
@@ -122,6 +183,46 @@ class configTrigger(forms.Form):
 
         return data
 
+    def clean_new_window(self):
+        data = self.cleaned_data['new_window']
+        if data != None and data <= datetime.timedelta(0):
+            raise forms.ValidationError(
+                'The window must be longer than zero.',
+                code='invalid_window'
+            )
+
+        return data
+
+    def clean_new_kind(self):
+        data = self.cleaned_data['new_kind']
+        if not data:
+            data = 'level'
+
+        return data
+
+    def clean_new_dwell(self):
+        data = self.cleaned_data['new_dwell']
+        if data != None and data <= datetime.timedelta(0):
+            raise forms.ValidationError(
+                'The dwell time must be longer than zero.',
+                code='invalid_dwell'
+            )
+
+        return data
+
+    def clean(self):
+        cleaned_data = super().clean()
+        kind = cleaned_data.get('new_kind')
+        if kind in ('rate', 'hysteresis') \
+                and cleaned_data.get('new_compare') not in (
+                    None, '<', '<=', '>', '>='):
+            self.add_error('new_compare',
+                "{} triggers need <, <=, > or >=".format(kind))
+        if kind == 'dwell' and cleaned_data.get('new_dwell') == None:
+            self.add_error('new_dwell', "dwell triggers need a dwell time")
+
+        return cleaned_data
+
 
 class configAlert(forms.Form):#ModelForm
     """Define the fields for an alert. These are the editable fields that
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert_config_app', '0011_auto_20170810_1742'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trigger',
+            name='window',
+            field=models.DurationField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert_config_app', '0012_trigger_window'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfigChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('alert', 'alert'), ('pv', 'pv'), ('trigger', 'trigger')], max_length=7)),
+                ('object_id', models.IntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
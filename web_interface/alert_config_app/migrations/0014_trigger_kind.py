@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alert_config_app', '0013_configchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trigger',
+            name='deadband',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trigger',
+            name='dwell',
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trigger',
+            name='kind',
+            field=models.CharField(choices=[('level', 'level'), ('rate', 'rate'), ('hysteresis', 'hysteresis'), ('dwell', 'dwell')], default='level', max_length=10),
+        ),
+    ]
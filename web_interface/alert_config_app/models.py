@@ -1,6 +1,8 @@
 """Manage alert_config data models
 """
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.urls import reverse
 from account_mgr_app.models import Profile
 
@@ -104,6 +106,13 @@ class Trigger(models.Model):
     Each trigger defines a trip condition relating a numeric value, condition 
     and PV. Each trigger can be owned by a single Alert. Triggers are not
     edited directly but through the alerts config page.
+
+    The kind decides what the comparison is applied to. 'level' triggers
+    compare the PV's samples themselves. 'rate' triggers compare its rate of
+    change, in units per second. 'hysteresis' triggers latch once the
+    comparison holds and only release once the PV is back past the value
+    by more than the deadband. 'dwell' triggers trip once the comparison
+    has held continuously for the dwell time.
     """
     name_max_length = 100
     name = models.CharField(max_length = name_max_length)
@@ -136,6 +145,37 @@ class Trigger(models.Model):
         null = True,
     ) 
 
+    # how far back the trigger looks, None uses the engine's scan period
+    window = models.DurationField(
+        blank = True,
+        null = True,
+    )
+
+    kind_choices = [
+        ('level','level'),
+        ('rate','rate'),
+        ('hysteresis','hysteresis'),
+        ('dwell','dwell'),
+    ]
+
+    kind = models.CharField(
+        choices = kind_choices,
+        max_length = 10,
+        default = 'level',
+    )
+
+    # margin a hysteresis trigger's PV must clear before it releases
+    deadband = models.FloatField(
+        blank = True,
+        null = True,
+    )
+
+    # time a dwell trigger's comparison must hold
+    dwell = models.DurationField(
+        blank = True,
+        null = True,
+    )
+
 
     def __repr__(self):
         return '{}(name="{}",alert="{}",value={},compare="{}")'.format(
@@ -149,3 +189,117 @@ class Trigger(models.Model):
     def __str__(self):
         return(str(self.name))
 
+
+class ConfigChange(models.Model):
+    """Append-only log of changes to the alert configuration
+
+    A row is written whenever an Alert, Pv or Trigger is saved or deleted.
+    The engine keeps its configuration in memory, reads the log past the
+    last entry it has seen, and only reloads the triggers the new entries
+    touch. Changes that bypass the model signals, such as bulk_create or
+    QuerySet.update, must be recorded by the caller.
+
+    Attributes
+    ----------
+    model : django.db.models.CharField
+        Which kind of object changed, 'alert', 'pv' or 'trigger'. A change
+        to an alert stands for all of its triggers.
+
+    object_id : django.db.models.IntegerField
+        pk of the changed object.
+
+    deleted : django.db.models.BooleanField
+        Whether the object was deleted.
+
+    time : django.db.models.DateTimeField
+        When the change was recorded.
+    """
+    model_choices = [
+        ('alert','alert'),
+        ('pv','pv'),
+        ('trigger','trigger'),
+    ]
+
+    model = models.CharField(
+        choices = model_choices,
+        max_length = 7,
+    )
+
+    object_id = models.IntegerField()
+
+    deleted = models.BooleanField(default = False)
+
+    time = models.DateTimeField(auto_now_add = True)
+
+    @classmethod
+    def latest(cls):
+        """pk of the newest entry, 0 if the log is empty
+        """
+        latest = cls.objects.order_by('-pk').values_list(
+            'pk', flat = True).first()
+        if latest == None:
+            return 0
+        return latest
+
+    @classmethod
+    def record(cls, model, object_id, deleted = False):
+        """Append an entry to the log
+        """
+        return cls.objects.create(
+            model = model,
+            object_id = object_id,
+            deleted = deleted,
+        )
+
+    @classmethod
+    def prune(cls, before, through = None):
+        """Delete the entries recorded before a time
+
+        The newest entry is always kept so that latest() never goes back.
+
+        Parameters
+        ----------
+        before : datetime.datetime
+            Entries recorded earlier than this are deleted.
+
+        through : int, optional
+            If given, only entries with a pk up to this one are deleted,
+            e.g. the last one a reader has applied.
+
+        Returns
+        -------
+        int
+            Number of entries deleted.
+        """
+        entries = cls.objects.filter(
+            time__lt = before,
+            pk__lt = cls.latest(),
+        )
+        if through != None:
+            entries = entries.filter(pk__lte = through)
+        return entries.delete()[0]
+
+    def __repr__(self):
+        return '{}(model="{}",object_id={},deleted={})'.format(
+            self.__class__.__name__,
+            self.model,
+            self.object_id,
+            self.deleted,
+        )
+
+    def __str__(self):
+        return '{} {}'.format(self.model, self.object_id)
+
+
+@receiver(post_save, sender = Alert)
+@receiver(post_save, sender = Pv)
+@receiver(post_save, sender = Trigger)
+@receiver(post_delete, sender = Alert)
+@receiver(post_delete, sender = Pv)
+@receiver(post_delete, sender = Trigger)
+def log_config_change(sender, instance, signal, **kwargs):
+    ConfigChange.record(
+        sender._meta.model_name,
+        instance.pk,
+        deleted = signal is post_delete,
+    )
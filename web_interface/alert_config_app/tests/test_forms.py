@@ -1,5 +1,6 @@
 from django.test import TestCase, RequestFactory, Client
 from unittest import skip
+import datetime
 
 from alert_config_app.models import *
 from alert_config_app.forms import *
@@ -58,6 +59,60 @@ class test_configTrigger_form(TestCase):
                 'new_name' : 'trigger name',
                 'new_value' : None,})
 
+    def test_clean_new_window(self):
+        """ensure windows must be longer than zero
+        """
+        def form(window):
+            return configTrigger(
+                data = {
+                    'new_pv' : -1,
+                    'new_compare' : '>',
+                    'new_name' : 'trigger name',
+                    'new_value' : 5,
+                    'new_window' : window,})
+
+        for window in ('00:00:00', '-1:00'):
+            rejected = form(window)
+            self.assertFalse(rejected.is_valid())
+            self.assertIn('new_window', rejected.errors)
+        accepted = form('00:10:00')
+        self.assertTrue(accepted.is_valid())
+        self.assertEqual(accepted.cleaned_data['new_window'],
+            datetime.timedelta(minutes = 10))
+        self.assertTrue(form('').is_valid())
+
+    def test_trigger_kinds(self):
+        """check the kind specific fields of the trigger form
+        """
+        def form(**kwargs):
+            data = {
+                'new_pv' : -1,
+                'new_compare' : '>',
+                'new_name' : 'trigger name',
+                'new_value' : 5,
+            }
+            data.update(kwargs)
+            return configTrigger(data = data)
+
+        plain = form()
+        self.assertTrue(plain.is_valid())
+        self.assertEqual(plain.cleaned_data['new_kind'], 'level')
+        self.assertTrue(form(new_kind = 'hysteresis', new_deadband = 1).is_valid())
+        rate = form(new_kind = 'rate', new_compare = '==')
+        self.assertFalse(rate.is_valid())
+        self.assertIn('new_compare', rate.errors)
+        dwell = form(new_kind = 'dwell')
+        self.assertFalse(dwell.is_valid())
+        self.assertIn('new_dwell', dwell.errors)
+        dwell = form(new_kind = 'dwell', new_dwell = '00:00:30')
+        self.assertTrue(dwell.is_valid())
+        self.assertEqual(dwell.cleaned_data['new_dwell'],
+            datetime.timedelta(seconds = 30))
+        for dwell_time in ('00:00:00', '-1:00'):
+            dwell = form(new_kind = 'dwell', new_dwell = dwell_time)
+            self.assertFalse(dwell.is_valid())
+            self.assertIn('new_dwell', dwell.errors)
+
 
 class test_config_Alert_form(TestCase):
     '''Collection of tests inspecting the configAlert form.
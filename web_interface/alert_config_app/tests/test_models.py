@@ -1,4 +1,7 @@
+import datetime
+
 from django.test import TestCase
+from django.utils import timezone
 from unittest import expectedFailure
 
 from account_mgr_app.models import *
@@ -98,3 +101,65 @@ class PVFieldsTests(TestCase):
     def tearDownClass(cls):
         super().tearDownClass()
         pass
+
+
+class ConfigChangeTests(TestCase):
+    """Ensure that configuration changes are logged
+    """
+    def test_empty_log(self):
+        self.assertEqual(ConfigChange.latest(), 0)
+
+    def test_signals(self):
+        """Ensure saving and deleting alerts, PVs and triggers is logged
+        """
+        alert = Alert.objects.create(name="unittest_alert")
+        pv = Pv.objects.create(name="unittest_pv")
+        trigger = Trigger.objects.create(
+            name="unittest_trigger",
+            alert=alert,
+            pv=pv,
+            compare=">",
+            value=1,
+        )
+        trigger.value = 2
+        trigger.save()
+        # deleting the alert cascades to its trigger
+        alert_pk = alert.pk
+        trigger_pk = trigger.pk
+        alert.delete()
+        self.assertEqual(
+            list(ConfigChange.objects.order_by('pk').values_list(
+                'model', 'object_id', 'deleted')),
+            [
+                ('alert', alert_pk, False),
+                ('pv', pv.pk, False),
+                ('trigger', trigger_pk, False),
+                ('trigger', trigger_pk, False),
+                ('trigger', trigger_pk, True),
+                ('alert', alert_pk, True),
+            ]
+        )
+        self.assertEqual(ConfigChange.latest(),
+            ConfigChange.objects.order_by('pk').last().pk)
+
+    def test_prune(self):
+        """Ensure old entries are pruned and the newest one is kept
+        """
+        for pk in range(4):
+            ConfigChange.record('pv', pk)
+        first, second, third, last = ConfigChange.objects.order_by('pk')
+        old = timezone.now() - datetime.timedelta(days=2)
+        ConfigChange.objects.all().update(time = old)
+        cutoff = timezone.now() - datetime.timedelta(days=1)
+        self.assertEqual(ConfigChange.prune(cutoff, through = first.pk), 1)
+        self.assertEqual(ConfigChange.prune(cutoff), 2)
+        self.assertEqual(
+            list(ConfigChange.objects.values_list('pk', flat = True)),
+            [last.pk]
+        )
+        self.assertEqual(ConfigChange.latest(), last.pk)
+        # once there is a newer entry the old one goes, recent ones stay
+        ConfigChange.record('pv', 4)
+        ConfigChange.record('pv', 5)
+        self.assertEqual(ConfigChange.prune(cutoff), 1)
+        self.assertEqual(ConfigChange.objects.count(), 2)
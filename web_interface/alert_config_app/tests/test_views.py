@@ -260,6 +260,41 @@ class test_alert_config_view(TestCase):
             "1 Trigger not added"
         )
 
+    def test_create_trigger_window(self):
+        """ check that the optional trigger window is stored
+        """
+        response = self.generic_alert_post(**{
+            'new_name':'alert_name',
+            'tg-0-new_window':'00:00:10',
+        })
+        alert_inst = Alert.objects.get(name="alert_name")
+        self.assertEqual(
+            alert_inst.trigger_set.get(name="0 trigger").window,
+            timedelta(seconds=10),
+            "Trigger window has incorrect value"
+        )
+        self.assertEqual(
+            alert_inst.trigger_set.get(name="1 trigger").window,
+            None,
+            "Blank trigger window should be None"
+        )
+
+    def test_create_alert_logs_change(self):
+        """ check that bulk created triggers are recorded in the change log
+        """
+        latest = ConfigChange.latest()
+        self.generic_alert_post(**{'new_name':'alert_name'})
+        alert_inst = Alert.objects.get(name="alert_name")
+        self.assertEqual(alert_inst.trigger_set.count(), 2)
+        self.assertEqual(
+            ConfigChange.objects.filter(pk__gt = latest).last().model,
+            'alert'
+        )
+        self.assertEqual(
+            ConfigChange.objects.filter(pk__gt = latest).last().object_id,
+            alert_inst.pk
+        )
+
     def test_modify_alert(self):
         """ check that alert is created correctly from this POST request
         """
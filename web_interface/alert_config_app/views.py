@@ -13,7 +13,7 @@ from django.views.generic.edit import (CreateView, UpdateView, DeleteView)
 
 from account_mgr_app.models import Profile
 import account_mgr_app
-from .models import Alert, Pv, Trigger 
+from .models import Alert, Pv, Trigger, ConfigChange
 from .forms import configAlert, configTrigger, deleteAlert, detailAlert, createPv
 
 from django.contrib.auth.decorators import login_required
@@ -291,6 +291,10 @@ class alert_config(View):
                     'new_pv': l.pv.pk if l.pv else None,
                     'new_value':l.value,
                     'new_compare':l.compare,
+                    'new_window':l.window,
+                    'new_kind':l.kind,
+                    'new_deadband':l.deadband,
+                    'new_dwell':l.dwell,
                 } 
                 for l in alert_inst.trigger_set.all()
             ]
@@ -406,6 +410,14 @@ class alert_config(View):
                                 'new_compare'),
                             value = single_trigger_form.cleaned_data.get(
                                 'new_value'),
+                            window = single_trigger_form.cleaned_data.get(
+                                'new_window'),
+                            kind = single_trigger_form.cleaned_data.get(
+                                'new_kind'),
+                            deadband = single_trigger_form.cleaned_data.get(
+                                'new_deadband'),
+                            dwell = single_trigger_form.cleaned_data.get(
+                                'new_dwell'),
                         )
                     )
             
@@ -414,7 +426,9 @@ class alert_config(View):
                 with transaction.atomic():
                     alert_inst.trigger_set.all().delete()
                     Trigger.objects.bulk_create(new_triggers)
-                    pass
+                    # bulk_create doesn't send post_save, log the whole
+                    # alert's triggers as changed
+                    ConfigChange.record('alert', alert_inst.pk)
 
             except IntegrityError:
                 pass
@@ -0,0 +1,34 @@
+"""
+Settings shared by the web interface and the alerts engine.
+
+Both web_interface.settings and web_interface.engine_settings import these, so
+the engine always works on the web interface's database. Importing this
+module has no side effects.
+"""
+
+import os
+
+# Build paths inside the project like this: os.path.join(BASE_DIR, ...)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Database
+# https://docs.djangoproject.com/en/1.11/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    },
+}
+
+# Internationalization
+# https://docs.djangoproject.com/en/1.11/topics/i18n/
+
+TIME_ZONE = 'America/Los_Angeles'
+
+USE_TZ = True
+
+EMAIL_HOST = 'psmail'
+EMAIL_PORT = 25
+EMAIL_HOST_USER = 'EASE'
+DEFAULT_FROM_EMAIL = 'EASE'
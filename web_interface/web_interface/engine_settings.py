@@ -0,0 +1,38 @@
+"""
+Django settings for the alerts engine.
+
+The engine only reads and writes the alert configuration through the models,
+so it loads the two EASE apps and the contrib apps their models need and
+nothing of the web stack. Unlike web_interface.settings, importing this
+module has no side effects: no session_logs_* directory is made and no
+secret key is generated. DEBUG is off so that Django doesn't keep every
+query of the long running engine in connection.queries.
+
+The database, time zone and email settings come from
+web_interface.common_settings, shared with web_interface.settings.
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .common_settings import (DATABASES, TIME_ZONE, USE_TZ, EMAIL_HOST,
+                              EMAIL_PORT, EMAIL_HOST_USER, DEFAULT_FROM_EMAIL)
+
+# nothing is signed by the engine, but Django refuses an empty key
+SECRET_KEY = os.environ.get('EASE_ENGINE_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured("Set EASE_ENGINE_SECRET_KEY")
+
+DEBUG = False
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'alert_config_app',
+    'account_mgr_app'
+]
+
+USE_I18N = False
+
+USE_L10N = False
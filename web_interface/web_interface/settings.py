@@ -199,15 +199,9 @@ FIXTURE_DIRS = [
 
 WSGI_APPLICATION = 'web_interface.wsgi.application'
 
-# Database
-# https://docs.djangoproject.com/en/1.11/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    },
-}
+# Database, time zone and email settings, shared with engine_settings
+from .common_settings import (DATABASES, TIME_ZONE, USE_TZ, EMAIL_HOST,
+                              EMAIL_PORT, EMAIL_HOST_USER, DEFAULT_FROM_EMAIL)
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -232,14 +226,10 @@ AUTH_PASSWORD_VALIDATORS = [
 
 LANGUAGE_CODE = 'en-us'
 
-TIME_ZONE = 'America/Los_Angeles'
-
 USE_I18N = True
 
 USE_L10N = True
 
-USE_TZ = True
-
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/1.11/howto/static-files/
 
@@ -254,11 +244,6 @@ STATICFILES_DIRS = (
 STATIC_ROOT = os.path.join(BASE_DIR,'staticfiles')
 
 
-EMAIL_HOST = 'psmail'
-EMAIL_PORT = 25
-EMAIL_HOST_USER = 'EASE'
-DEFAULT_FROM_EMAIL = 'EASE'
-
 
 if not DEBUG:
     LOGIN_REDIRECT_URL = FORCE_SCRIPT_NAME + '/alert/title'